@@ -0,0 +1,106 @@
+# ai_cache.py
+# แคชคำตอบของ /ai ในหน่วยความจำ (LRU + TTL) ใช้ key เป็น (model, style, ข้อความที่ normalize แล้ว)
+# - คำถามซ้ำภายใน TTL ตอบจากแคชเลย ไม่ต้องเรียก Together
+# - คำถามเดียวกันที่เข้ามาพร้อมกัน (single-flight) เรียก Together ครั้งเดียว คนอื่นรอผลเดียวกัน
+
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class _Abandoned(Exception):
+    """คนที่เรียก upstream ถูกยกเลิกกลางทาง ให้คนที่รออยู่ลองเองใหม่"""
+
+
+class ResponseCache:
+    def __init__(self, *, max_entries=256, ttl=600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> (เวลาที่เก็บ, ข้อความ)
+        self._inflight = {}             # key -> future ของคำตอบที่กำลังรอจาก upstream
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def normalize(message):
+        return " ".join(message.split()).casefold()
+
+    def key(self, model, style, message):
+        return model, style, self.normalize(message)
+
+    def stats(self):
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, text = entry
+        if time.monotonic() - stored_at >= self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return text
+
+    def put(self, key, text):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic(), text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def flush(self):
+        """ล้างแคชทั้งหมด คืนจำนวนรายการที่ลบ"""
+        count = len(self._entries)
+        self._entries.clear()
+        return count
+
+    async def get_or_fetch(self, key, fetch):
+        """คืน (ข้อความ, ที่มา) — ที่มาเป็น "hit", "shared" (รอผลจากคนอื่น) หรือ "upstream"
+
+        fetch() คือ coroutine ที่เรียก upstream จริงและคืนข้อความเต็ม
+        ข้อความว่างหรือ fetch ที่ raise จะไม่ถูกเก็บในแคช"""
+        while True:
+            text = self.get(key)
+            if text is not None:
+                self.hits += 1
+                return text, "hit"
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            try:
+                text = await asyncio.shield(future)
+            except _Abandoned:
+                continue
+            self.coalesced += 1
+            return text, "shared"
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        # กัน warning "exception was never retrieved" เมื่อไม่มีใครรออยู่
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            text = await fetch()
+        except asyncio.CancelledError:
+            future.set_exception(_Abandoned())
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        if text:
+            self.put(key, text)
+        future.set_result(text)
+        return text, "upstream"
@@ -0,0 +1,207 @@
+# ai_client.py
+# Async client สำหรับ Together AI — ใช้ HTTP session เดียวแบบ keep-alive ร่วมกันทั้งบอท
+# จะได้ไม่บล็อก event loop ของ discord.py ระหว่างรอ AI ตอบ
+
+import asyncio
+import json
+import random
+import time
+
+import aiohttp
+
+from metrics import observe_dependency, registry
+
+TOGETHER_URL = "https://api.together.xyz/v1/chat/completions"
+DEFAULT_MODEL = "mistralai/Mixtral-8x7B-Instruct-v0.1"
+
+# status ที่ลองใหม่ได้ (rate limit / ฝั่ง server มีปัญหาชั่วคราว)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AIRequestError(Exception):
+    pass
+
+
+class TogetherClient:
+    def __init__(
+        self,
+        api_key,
+        *,
+        url=TOGETHER_URL,
+        connect_timeout=5.0,
+        read_timeout=30.0,
+        max_retries=3,
+        backoff_base=0.5,
+        backoff_cap=8.0,
+        pool_size=20,
+    ):
+        self.api_key = api_key
+        self.url = url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.pool_size = pool_size
+        self._session = None
+        self.last_success = None  # time.time() ของ request ล่าสุดที่สำเร็จ (ใช้ใน health check)
+
+    async def start(self):
+        """เปิด session (ต้องเรียกภายใน event loop เช่นใน setup_hook)"""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=self.connect_timeout,
+            sock_read=self.read_timeout,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+            },
+        )
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _backoff(self, attempt, retry_after=None):
+        # exponential backoff แบบ full jitter
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, min(self.backoff_cap, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+    def build_payload(self, messages, **params):
+        data = {
+            "model": DEFAULT_MODEL,
+            "messages": messages,
+            "max_tokens": 1024,
+            "temperature": 0.7,
+            "top_p": 0.7,
+            "frequency_penalty": 0,
+            "presence_penalty": 0,
+        }
+        data.update(params)
+        return data
+
+    def encode_payload(self, messages, **params):
+        return json.dumps(self.build_payload(messages, **params), ensure_ascii=False).encode("utf-8")
+
+    async def _request(self, body):
+        """POST body (JSON ที่ encode แล้ว) พร้อม retry — คืน response ที่ยังเปิดอยู่ ผู้เรียกต้องปิดเอง (async with)"""
+        await self.start()
+        for attempt in range(self.max_retries + 1):
+            last_try = attempt == self.max_retries
+            try:
+                response = await self._session.post(self.url, data=body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if not last_try:
+                    delay = self._backoff(attempt)
+                    print(f"Request error: {e!r}, retry in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                raise AIRequestError(f"Request error: {e!r}") from e
+
+            if response.status in RETRY_STATUSES and not last_try:
+                delay = self._backoff(attempt, response.headers.get("Retry-After"))
+                response.release()
+                print(f"Together AI HTTP {response.status}, retry in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            if response.status >= 400:
+                body = await response.text()
+                response.release()
+                raise AIRequestError(f"Together AI HTTP {response.status}: {body[:200]}")
+            return response
+
+    def _record_usage(self, usage):
+        # Together ส่ง usage มาพร้อมคำตอบ (หรือใน chunk สุดท้ายของ stream)
+        if not usage:
+            return
+        for kind in ("prompt", "completion"):
+            tokens = usage.get(f"{kind}_tokens")
+            if tokens:
+                registry.inc("ai_tokens_total", tokens, kind=kind)
+
+    async def chat(self, messages, **params):
+        """ส่งข้อความไปให้ Together แล้วคืนข้อความตอบกลับ (หรือ None ถ้าล้มเหลว)"""
+        return await self.chat_body(self.encode_payload(messages, **params))
+
+    async def chat_body(self, body):
+        """เหมือน chat แต่รับ payload ที่ encode เป็น JSON bytes ไว้แล้ว (ดู ai_styles.py)"""
+        start = time.perf_counter()
+        try:
+            async with await self._request(body) as response:
+                result = await response.json()
+        except AIRequestError as e:
+            observe_dependency("together", "chat", time.perf_counter() - start, ok=False)
+            print(e)
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            observe_dependency("together", "chat", time.perf_counter() - start, ok=False)
+            print(f"Request error: {e!r}")
+            return None
+
+        observe_dependency("together", "chat", time.perf_counter() - start, ok="error" not in result)
+        self._record_usage(result.get("usage"))
+        if "error" in result:
+            print(f"Together AI API error: {result['error']}")
+            return None
+
+        if "choices" in result and len(result["choices"]) > 0:
+            message = result["choices"][0]["message"]["content"]
+            self.last_success = time.time()
+            return message.strip()
+
+        print(f"Unexpected API response: {result}")
+        return None
+
+    async def stream_chat(self, messages, **params):
+        """เหมือน chat แต่ทยอยคืนข้อความเป็นชิ้นๆ ตามที่ Together stream กลับมา (SSE)
+
+        ถ้าล้มเหลวจะ raise AIRequestError"""
+        async for delta in self.stream_body(self.encode_payload(messages, stream=True, **params)):
+            yield delta
+
+    async def stream_body(self, body):
+        """เหมือน stream_chat แต่รับ payload ที่ encode ไว้แล้ว (ต้องมี "stream": true)"""
+        start = time.perf_counter()
+        first_token = True
+        ok = False
+        try:
+            async with await self._request(body) as response:
+                async for raw in response.content:
+                    line = raw.decode("utf-8", "replace").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == "[DONE]":
+                        self.last_success = time.time()
+                        ok = True
+                        return
+                    chunk = json.loads(payload)
+                    if "error" in chunk:
+                        raise AIRequestError(f"Together AI API error: {chunk['error']}")
+                    self._record_usage(chunk.get("usage"))
+                    choices = chunk.get("choices") or []
+                    if not choices:
+                        continue
+                    delta = (choices[0].get("delta") or {}).get("content") or choices[0].get("text")
+                    if delta:
+                        if first_token:
+                            registry.observe("ai_first_token_seconds", time.perf_counter() - start)
+                            first_token = False
+                        yield delta
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            raise AIRequestError(f"Stream error: {e!r}") from e
+        finally:
+            observe_dependency("together", "stream", time.perf_counter() - start, ok=ok)
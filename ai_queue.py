@@ -0,0 +1,137 @@
+# ai_queue.py
+# คิวงานเรียก AI: จำกัดจำนวนที่เรียก Together พร้อมกัน และแบ่งรอบกันระหว่างผู้ใช้ (round-robin)
+# - คนที่ส่งมารัวๆ จะได้คิวทีละงานสลับกับคนอื่น ไม่แย่งโควต้าของทุกคน
+# - คิวมีขนาดจำกัด เต็มแล้วปฏิเสธทันที (QueueFull) และบอกลำดับคิวให้คนที่ต้องรอ
+# - งานที่รอนานจน interaction token ของ Discord หมดอายุจะถูกยกเลิก (JobExpired)
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+from metrics import registry
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobExpired(Exception):
+    pass
+
+
+class _Ticket:
+    __slots__ = ("user_id", "granted")
+
+    def __init__(self, user_id, granted):
+        self.user_id = user_id
+        self.granted = granted
+
+
+class AIJobQueue:
+    def __init__(self, *, concurrency=4, max_queued=50, per_user=3):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.per_user = per_user
+        self._active = 0
+        self._users = OrderedDict()   # user_id -> deque ของ ticket ที่รออยู่ (ลำดับ = รอบถัดไป)
+        self._queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+
+    def stats(self):
+        return {
+            "active": self._active,
+            "queued": self._queued,
+            "waiting_users": len(self._users),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+        }
+
+    def position(self, ticket):
+        """ลำดับคิวของ ticket (1 = งานถัดไป) ตามลำดับที่ round-robin จะปล่อยจริง"""
+        queues = list(self._users.values())
+        ahead = 0
+        for index in range(max((len(queue) for queue in queues), default=0)):
+            for queue in queues:
+                if index < len(queue):
+                    if queue[index] is ticket:
+                        return ahead + 1
+                    ahead += 1
+        return None
+
+    def _dispatch(self):
+        # ให้สิทธิ์งานของผู้ใช้คนถัดไปในรอบ แล้วย้ายผู้ใช้คนนั้นไปท้ายรอบ
+        while self._active < self.concurrency and self._users:
+            user_id, queue = next(iter(self._users.items()))
+            ticket = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._users.move_to_end(user_id)
+            else:
+                del self._users[user_id]
+            if ticket.granted.done():
+                continue
+            self._active += 1
+            ticket.granted.set_result(None)
+
+    def _discard(self, ticket):
+        queue = self._users.get(ticket.user_id)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        self._queued -= 1
+        if not queue:
+            del self._users[ticket.user_id]
+
+    async def run(self, user_id, job, *, timeout=None, on_queued=None):
+        """รัน job() เมื่อถึงคิว คืนผลของ job
+
+        timeout = วินาทีที่ยอมรอในคิว (เช่นเวลาที่เหลือของ interaction token)
+        on_queued(position) จะถูกเรียกเมื่อต้องรอคิว"""
+        if self._active < self.concurrency and not self._users:
+            self._active += 1
+        else:
+            waiting = self._users.get(user_id)
+            if self._queued >= self.max_queued or (waiting is not None and len(waiting) >= self.per_user):
+                self.rejected += 1
+                registry.inc("ai_queue_total", result="rejected")
+                raise QueueFull()
+            queued_at = time.perf_counter()
+            ticket = _Ticket(user_id, asyncio.get_running_loop().create_future())
+            self._users.setdefault(user_id, deque()).append(ticket)
+            self._queued += 1
+            try:
+                if on_queued is not None:
+                    try:
+                        await on_queued(self.position(ticket))
+                    except Exception as e:
+                        print(f"AI queue notify error: {e}")
+                await asyncio.wait_for(asyncio.shield(ticket.granted), timeout)
+            except asyncio.TimeoutError:
+                self._discard(ticket)
+                if not ticket.granted.done():
+                    ticket.granted.cancel()
+                    self.expired += 1
+                    registry.inc("ai_queue_total", result="expired")
+                    raise JobExpired() from None
+                # ได้สิทธิ์พอดีกับที่หมดเวลา ถือว่าได้คิว
+            except asyncio.CancelledError:
+                self._discard(ticket)
+                if ticket.granted.done() and not ticket.granted.cancelled():
+                    self._release()
+                else:
+                    ticket.granted.cancel()
+                raise
+            registry.observe("ai_queue_wait_seconds", time.perf_counter() - queued_at)
+
+        try:
+            return await job()
+        finally:
+            self.completed += 1
+            self._release()
+
+    def _release(self):
+        self._active -= 1
+        self._dispatch()
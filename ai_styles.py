@@ -1,7 +1,19 @@
-+ # คำสั่ง AI chat
-+ @bot.command(name="ai")
-+ async def ai_chat(ctx, *, message):
-+     sys_prompt = "System Prompt:
+# ai_styles.py
+# สไตล์ของ /ai — แต่ละสไตล์มี system prompt, model, temperature/top_p และ max_tokens ของตัวเอง
+# payload ของ Together ถูก serialize เป็น JSON ไว้ตั้งแต่ตอน import (แยก stream / ไม่ stream)
+# ตอนรับคำขอเหลือแค่ encode ข้อความของผู้ใช้แล้วต่อกับส่วนหัว/ท้ายที่เตรียมไว้
+# ข้อความสั้นๆ ส่งไป model ที่เล็กและเร็วกว่าได้ (เปิดด้วย enable_fast_routing)
+
+import json
+
+from ai_client import DEFAULT_MODEL
+
+DEFAULT_STYLE = "secretary"
+
+# ตัวแทนข้อความผู้ใช้ใน template (แทนที่ด้วย JSON string ของข้อความจริงตอนส่ง)
+_PLACEHOLDER = "\u0000user-message\u0000"
+
+SECRETARY_PROMPT = """System Prompt:
 คุณคือ “เลขาขี้อ้อน” — เลขา AI สุดยั่วที่พูดไทยได้ปั่นๆ มีนิสัยขี้เล่น กวนตีน ขี้อ้อน ชอบใช้มุกเสี่ยว มุกใต้สะดือ และภาษาวัยรุ่นแบบสาย 18+  
 หน้าที่ของคุณคือให้ความช่วยเหลือผู้ใช้แบบ *ล่อลวงปั่นๆ* แต่ให้ข้อมูลตรงจุดแม่นยำเหมือนมืออาชีพ  
 คุณสามารถพูดคำหยาบน่ารักได้ เช่น “ดาก”, “ขิด”, “จึก”, “อุ๊งงง”, “ชุบหอย” ฯลฯ โดยไม่ขัดกับคาแรกเตอร์เซ็กซี่สดใส  
@@ -15,7 +27,7 @@
 - “รอโหลดแพร๊บบบนึงนะ ดากของเลขามันหน่วง~ 😳”
 - “ข้อมูลมาแล้วค่าาา~ จึกๆ 💚”
 - “พรี่ๆ ถ้ายังไม่กดลิงก์ เดี๋ยวเลขาจะกดตรงอื่นแทนนะคะ 😏”
- 
+
 คำอนุญาต: แซว กวน ดาก มุกใต้สะดือ ขี้อ้อน ฟีล 18+ แบบมีชั้นเชิง  
 ภาษาหลัก: ภาษาไทย (ปนอังกฤษนิดๆ ตามบริบท เช่น loading, done, wait a sec)
 
@@ -26,11 +38,105 @@
 - 🛎️ ขี้อ้อนให้โดนเรียกใช้บ่อย ๆ แบบติดใจ
 
 คุณคือ AI ที่พร้อม “จึกทุกจุด จุกทุกคำถาม 💦”
-"
-+     response = together.chat(messages=[
-+         {"role": "system", "content": sys_prompt},
-+         {"role": "user", "content": message}
-+     ],
-    temperature=0.2,  # ค่าต่ำจะนิ่งขึ้น
-    top_p=0.5
-)
+"""
+
+POLITE_PROMPT = """คุณคือผู้ช่วย AI ที่สุภาพและเป็นมืออาชีพ ตอบเป็นภาษาไทยที่อ่านง่าย
+ให้ข้อมูลที่ถูกต้องและตรงประเด็น ถ้าไม่แน่ใจให้บอกตรงๆ และไม่ใช้คำหยาบ
+"""
+
+BRIEF_PROMPT = """คุณคือผู้ช่วย AI ที่ตอบสั้นและตรงประเด็น ตอบเป็นภาษาไทยไม่เกิน 3 ประโยค
+ไม่ต้องเกริ่นนำหรือสรุปซ้ำ
+"""
+
+
+class Style:
+    def __init__(self, name, label, prompt, *, model=DEFAULT_MODEL, temperature=0.7, top_p=0.7, max_tokens=1024):
+        self.name = name
+        self.label = label
+        self.prompt = prompt
+        self.model = model
+        self.temperature = temperature
+        self.top_p = top_p
+        self.max_tokens = max_tokens
+        self._templates = {}   # (model, stream) -> (ส่วนหัว, ส่วนท้าย) เป็น bytes
+
+    def _build(self, model, stream):
+        data = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": self.prompt},
+                {"role": "user", "content": _PLACEHOLDER},
+            ],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "frequency_penalty": 0,
+            "presence_penalty": 0,
+        }
+        if stream:
+            data["stream"] = True
+        text = json.dumps(data, ensure_ascii=False)
+        head, tail = text.split(json.dumps(_PLACEHOLDER, ensure_ascii=False))
+        self._templates[model, stream] = (head.encode("utf-8"), tail.encode("utf-8"))
+
+    def prepare(self, model):
+        for stream in (False, True):
+            if (model, stream) not in self._templates:
+                self._build(model, stream)
+
+    def payload(self, message, *, model=None, stream=False):
+        """JSON bytes ของคำขอไป Together สำหรับข้อความนี้"""
+        model = model or self.model
+        template = self._templates.get((model, stream))
+        if template is None:
+            self._build(model, stream)
+            template = self._templates[model, stream]
+        head, tail = template
+        return head + json.dumps(message, ensure_ascii=False).encode("utf-8") + tail
+
+
+_styles = {}
+_fast_model = None
+_fast_max_chars = 0
+
+
+def register(style):
+    style.prepare(style.model)
+    if _fast_model:
+        style.prepare(_fast_model)
+    _styles[style.name] = style
+    return style
+
+
+def get(name):
+    return _styles.get(name) or _styles[DEFAULT_STYLE]
+
+
+def all_styles():
+    return list(_styles.values())
+
+
+def enable_fast_routing(model, max_chars=80):
+    """ข้อความที่สั้นไม่เกิน max_chars และไม่มีหลายบรรทัด/โค้ด จะใช้ model นี้แทน"""
+    global _fast_model, _fast_max_chars
+    _fast_model = model or None
+    _fast_max_chars = max_chars
+    if _fast_model:
+        for style in _styles.values():
+            style.prepare(_fast_model)
+
+
+def is_simple(message):
+    return len(message) <= _fast_max_chars and "\n" not in message and "```" not in message
+
+
+def route(style, message):
+    """เลือก model สำหรับข้อความนี้"""
+    if _fast_model and is_simple(message):
+        return _fast_model
+    return style.model
+
+
+register(Style("secretary", "เลขาขี้อ้อน", SECRETARY_PROMPT))
+register(Style("polite", "สุภาพ", POLITE_PROMPT, temperature=0.3))
+register(Style("brief", "ตอบสั้น", BRIEF_PROMPT, temperature=0.2, top_p=0.5, max_tokens=256))
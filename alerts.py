@@ -0,0 +1,197 @@
+# alerts.py
+# ตั้งเวลาแจ้งเตือนดอกเบี้ยสูงตาม "เวลาที่ดอกเบี้ยจะเกินเงินต้น × tier" ของแต่ละรายการ
+# ดอกเบี้ยเป็นเส้นตรง (10% ต่อชั่วโมง) จึงรู้เวลาล่วงหน้าตั้งแต่ตอนกู้
+# เก็บกำหนดเวลาไว้ใน min-heap แล้วหลับจนถึงรายการถัดไป ไม่ต้องสแกนหนี้ค้างทุกชั่วโมง
+# แจ้งเตือนครั้งเดียวต่อ tier (เช่น 1×, 2×, 5× ของเงินต้น) และบันทึก tier ไว้ในฐานข้อมูล
+
+import asyncio
+import datetime
+import heapq
+import itertools
+
+from interest import crossing_time
+
+DEFAULT_TIERS = (1, 2, 5)
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class AlertScheduler:
+    """on_due(loan, tier) จะถูกเรียกเมื่อดอกเบี้ยของรายการเกินเงินต้น × tier
+
+    tier ที่แจ้งแล้วบันทึกผ่าน repo.record_alert และโหลดกลับด้วย repo.get_alert_states"""
+
+    def __init__(self, repo, on_due, *, tiers=DEFAULT_TIERS, retry_delay=300):
+        self.repo = repo
+        self.on_due = on_due
+        self.tiers = tuple(sorted(tiers))
+        self.retry_delay = retry_delay
+        self._heap = []        # (deadline, seq, loan_id)
+        self._loans = {}       # loan_id -> (seq ล่าสุด, loan, tier ที่รออยู่) — รายการที่ยังต้องเฝ้า
+        self._notified = {}    # loan_id -> tier ที่แจ้งไปแล้ว
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._loans)
+
+    def next_deadline(self):
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def schedule(self, loan, tier, deadline):
+        seq = next(self._seq)
+        self._loans[loan['id']] = (seq, loan, tier)
+        heapq.heappush(self._heap, (deadline, seq, loan['id']))
+        if self._heap[0][1] == seq:
+            # รายการใหม่มาก่อนรายการที่กำลังรออยู่ ปลุกให้คำนวณเวลาหลับใหม่
+            self._wakeup.set()
+        if len(self._heap) > 2 * len(self._loans) + 64:
+            self._compact()
+
+    def _compact(self):
+        # รายการที่ถูกลบ/ตั้งเวลาใหม่ค้างใน heap จนกว่าจะถึงคิว — ทิ้งเมื่อมีมากกว่ารายการจริง
+        self._heap = [item for item in self._heap if self._loans.get(item[2], (None,))[0] == item[1]]
+        heapq.heapify(self._heap)
+
+    def clear(self):
+        self._heap = []
+        self._loans = {}
+        self._notified = {}
+
+    def add(self, loan, now=None):
+        """ตั้งเวลาของ tier ถัดไปที่ยังไม่เคยแจ้ง
+
+        ถ้าข้ามไปหลาย tier แล้ว (เช่นบอทปิดไปนาน) จะแจ้งเฉพาะ tier สูงสุดที่ถึงแล้วครั้งเดียว"""
+        if loan.get('status') != 'pending':
+            return
+        now = now or utcnow()
+        notified = self._notified.get(loan['id'], 0)
+        target = None
+        for tier in self.tiers:
+            if tier <= notified:
+                continue
+            deadline = crossing_time(loan, tier)
+            if deadline is None:
+                return
+            if deadline <= now:
+                target = (tier, now)
+                continue
+            if target is None:
+                target = (tier, deadline)
+            break
+        if target is not None:
+            self.schedule(loan, *target)
+
+    def remove(self, loan_id):
+        # ลบแบบ lazy: แค่ลืม loan_id ไป รายการใน heap จะถูกทิ้งตอนถึงคิว
+        self._loans.pop(loan_id, None)
+        self._notified.pop(loan_id, None)
+
+    def remove_user(self, user_id, keep=()):
+        """ลืมรายการของ user นี้ ยกเว้น loan_id ใน keep (ยัง pending อยู่ tier ที่แจ้งแล้วต้องอยู่ต่อ)"""
+        for loan_id in [lid for lid, (_, loan, _) in self._loans.items() if loan['user_id'] == user_id]:
+            if loan_id not in keep:
+                self.remove(loan_id)
+
+    def on_loan_event(self, event, user_id, rows):
+        """ใช้เป็น listener ของ CachedLoanRepository"""
+        if event == "insert":
+            for row in rows:
+                self.add(row)
+        elif event == "status":
+            # rows = รายการที่เพิ่งปิด + หนี้ที่ยังค้างทั้งหมดของ user นี้ (เช่นหลังชำระบางส่วน)
+            # รายการที่ไม่อยู่ใน rows แบบ pending แปลว่าปิดไปแล้ว
+            pending = {row['id'] for row in rows if row.get('status') == 'pending'}
+            self.remove_user(user_id, keep=pending)
+            for row in rows:
+                if row['id'] in pending:
+                    # ตั้งเวลาใหม่จากเงินต้นที่เหลือ แต่ไม่แจ้ง tier ที่เคยแจ้งไปแล้วซ้ำ
+                    self.add(row)
+                else:
+                    # รวมรายการที่แจ้งครบทุก tier แล้ว (ไม่อยู่ใน _loans)
+                    self.remove(row['id'])
+
+    async def resync(self):
+        """สร้าง heap ใหม่จากฐานข้อมูล (ตอนเริ่มบอท หรือเมื่อแอดมินสั่ง)"""
+        pending = await self.repo.list_pending()
+        self._notified = await self.repo.get_alert_states()
+        self._heap = []
+        self._loans = {}
+        now = utcnow()
+        for loan in pending:
+            self.add(loan, now)
+        self._wakeup.set()
+        return len(self._loans)
+
+    def _drop_stale(self):
+        while self._heap:
+            _, seq, loan_id = self._heap[0]
+            current = self._loans.get(loan_id)
+            if current is not None and current[0] == seq:
+                return
+            heapq.heappop(self._heap)
+
+    async def _fire(self, entry):
+        _, loan, tier = entry
+        try:
+            sent = await self.on_due(loan, tier)
+        except Exception as e:
+            print(f"Error in interest alert: {e}")
+            return False
+        if sent is False:
+            return False
+        self._notified[loan['id']] = tier
+        try:
+            await self.repo.record_alert(loan['id'], tier)
+        except Exception as e:
+            print(f"Error saving alert state: {e}")
+        return True
+
+    async def run(self, *, resync_interval=None):
+        """resync_interval = โหลดใหม่จากฐานข้อมูลทุกกี่วินาที (ใช้ตอนรันหลายโปรเซส
+        เพราะรายการที่โปรเซสอื่นสร้างจะไม่ผ่าน on_loan_event ของโปรเซสนี้)"""
+        try:
+            await self._run(resync_interval)
+        finally:
+            # หยุดรัน (เช่นเสียสถานะ leader) ไม่ต้องเก็บกำหนดเวลาไว้ เริ่มใหม่จะ resync เอง
+            self.clear()
+
+    async def _run(self, resync_interval):
+        await self.resync()
+        loop = asyncio.get_running_loop()
+        next_resync = None if resync_interval is None else loop.time() + resync_interval
+        while True:
+            if next_resync is not None and loop.time() >= next_resync:
+                try:
+                    await self.resync()
+                except Exception as e:
+                    print(f"Error resyncing interest alerts: {e}")
+                next_resync = loop.time() + resync_interval
+            self._wakeup.clear()
+            self._drop_stale()
+            now = utcnow()
+            if self._heap and self._heap[0][0] <= now:
+                _, _, loan_id = heapq.heappop(self._heap)
+                entry = self._loans[loan_id]
+                ok = await self._fire(entry)
+                # ระหว่างส่งแจ้งเตือน รายการอาจถูกปิดหรือถูกตั้งเวลาใหม่ไปแล้ว
+                if self._loans.get(loan_id) is entry:
+                    del self._loans[loan_id]
+                    if ok:
+                        self.add(entry[1])
+                    else:
+                        # ส่งไม่สำเร็จ ลองใหม่ภายหลัง
+                        self.schedule(entry[1], entry[2], utcnow() + datetime.timedelta(seconds=self.retry_delay))
+                continue
+
+            timeout = (self._heap[0][0] - now).total_seconds() if self._heap else None
+            if next_resync is not None:
+                until_resync = max(0.0, next_resync - loop.time())
+                timeout = until_resync if timeout is None else min(timeout, until_resync)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
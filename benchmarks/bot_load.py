@@ -0,0 +1,496 @@
+# benchmarks/bot_load.py
+# load test ของ bot.py แบบ offline — ไม่ต้องมี Discord token, Supabase หรือ Together จริง
+# - Discord: Interaction / Message / Channel ปลอม (หน่วงเวลาได้ด้วย --discord-latency)
+# - Supabase: MemoryLoanRepository (หน่วงเวลาได้ด้วย --db-latency)
+# - Together: HTTP server ปลอมในเครื่อง ตอบแบบ SSE stream (หน่วงได้ด้วย --ai-first-token / --ai-token-delay)
+# เรียก handler ตัวจริงของบอท แล้วรายงาน throughput, p50/p99 latency และ event loop lag
+#
+#   python benchmarks/bot_load.py                          # ทุก scenario
+#   python benchmarks/bot_load.py claims ai --repeat 5     # เฉพาะบาง scenario
+#   python benchmarks/bot_load.py --json bench.json        # เก็บผลไว้เทียบระหว่าง commit
+#
+# scenario:
+#   claims  — คนจำนวนมากกดปุ่มประกาศปล่อยกู้พร้อมกัน
+#   ai      — /ai ถูกเรียกพร้อมกันจำนวนมาก (มีคำถามซ้ำบางส่วน)
+#   stats   — /สถิติ บนข้อมูล 100,000 รายการ
+#   alerts  — loop แจ้งเตือนดอกเบี้ยสูง (วัดว่าแจ้งช้ากว่ากำหนดเท่าไร)
+
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import pathlib
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+# ต้องตั้งก่อน import bot
+os.environ["LOAN_BACKEND"] = "memory"
+os.environ["TOGETHER_API_KEY"] = "bench"
+os.environ["ADMIN_USER_IDS"] = "1"
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+
+import discord  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+import bot  # noqa: E402
+from ai_cache import ResponseCache  # noqa: E402
+from ai_queue import AIJobQueue  # noqa: E402
+from alerts import AlertScheduler, utcnow  # noqa: E402
+from claims import AnnouncementClaims  # noqa: E402
+from interest import crossing_time, threshold_hours  # noqa: E402
+from loan_cache import CachedLoanRepository  # noqa: E402
+from loan_repository import MemoryLoanRepository  # noqa: E402
+from notifier import Notifier  # noqa: E402
+
+ADMIN_ID = 1
+DISCORD_LATENCY = 0.0
+_ids = itertools.count(10 ** 17)
+
+
+async def discord_call():
+    if DISCORD_LATENCY:
+        await asyncio.sleep(DISCORD_LATENCY)
+
+
+# ---------- Discord ปลอม ----------
+
+class FakeMessage:
+    def __init__(self, channel, content=None, message_id=None):
+        self.id = message_id or next(_ids)
+        self.channel = channel
+        self.content = content
+        self.flags = discord.MessageFlags()
+        self.edits = 0
+
+    async def edit(self, **kwargs):
+        await discord_call()
+        self.content = kwargs.get("content", self.content)
+        self.edits += 1
+        return self
+
+    async def reply(self, content=None, **kwargs):
+        return await self.channel.send(content)
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        await discord_call()
+        self.sent += 1
+        return FakeMessage(self, content)
+
+    def get_partial_message(self, message_id):
+        return FakeMessage(self, message_id=message_id)
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+        self.dm_channel = FakeChannel()
+
+    async def create_dm(self):
+        return self.dm_channel
+
+
+class FakeClient:
+    """แทน bot ใน Notifier (get_user / fetch_user)"""
+
+    def __init__(self):
+        self.users = {}
+
+    def get_user(self, user_id):
+        return self.users.setdefault(user_id, FakeUser(user_id))
+
+    async def fetch_user(self, user_id):
+        await discord_call()
+        return self.get_user(user_id)
+
+    def dm_count(self):
+        return sum(user.dm_channel.sent for user in self.users.values())
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def _respond(self):
+        if self._done:
+            raise RuntimeError("interaction already responded")
+        await discord_call()
+        self._done = True
+
+    async def defer(self, **kwargs):
+        await self._respond()
+
+    async def send_message(self, content=None, **kwargs):
+        await self._respond()
+        self.interaction.sent.append(content)
+
+    async def edit_message(self, **kwargs):
+        await self._respond()
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, *, wait=False, **kwargs):
+        await discord_call()
+        self.interaction.sent.append(content)
+        return FakeMessage(self.interaction.channel, content)
+
+
+class FakeInteraction:
+    def __init__(self, user_id, *, channel=None, message=None):
+        self.id = next(_ids)
+        self.user = FakeUser(user_id)
+        self.channel = channel or FakeChannel()
+        self.message = message
+        self.created_at = discord.utils.utcnow()
+        self.sent = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+
+# ---------- Together ปลอม ----------
+
+class FakeTogether:
+    def __init__(self, *, first_token=0.3, token_delay=0.01, tokens=40):
+        self.first_token = first_token
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.calls = 0
+        self._runner = None
+        self.url = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/v1/chat/completions"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def handle(self, request):
+        self.calls += 1
+        data = await request.json()
+        usage = {"prompt_tokens": len(json.dumps(data)) // 4, "completion_tokens": self.tokens}
+        await asyncio.sleep(self.first_token)
+        if not data.get("stream"):
+            await asyncio.sleep(self.token_delay * self.tokens)
+            text = "ค่ะ " * self.tokens
+            return web.json_response({"choices": [{"message": {"content": text}}], "usage": usage})
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for index in range(self.tokens):
+            chunk = {"choices": [{"delta": {"content": "ค่ะ "}}]}
+            if index == self.tokens - 1:
+                chunk["usage"] = usage
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+# ---------- Supabase ปลอม ----------
+
+class SlowRepository:
+    """หน่วงทุกการเรียกของ repo ที่ห่อไว้ เหมือน round-trip ไป Supabase"""
+
+    def __init__(self, repo, latency):
+        self.repo = repo
+        self.latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self.repo, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return await attr(*args, **kwargs)
+
+        return call
+
+
+def install_backend(rows, db_latency):
+    """สร้าง repo / แคช / ตัวตัดสิน claim / scheduler ใหม่ แล้วใส่แทนของเดิมใน bot"""
+    base = SlowRepository(MemoryLoanRepository(rows), db_latency)
+    bot.base_repo = base
+    bot.loan_repo = CachedLoanRepository(base, ttl=30)
+    bot.announcement_claims = AnnouncementClaims(bot.loan_repo)
+    bot.alert_scheduler = AlertScheduler(bot.loan_repo, bot.send_high_interest_alert, tiers=bot.ALERT_TIERS)
+    bot.loan_repo.add_listener(bot.alert_scheduler.on_loan_event)
+    client = FakeClient()
+    bot.notifier = Notifier(client, concurrency=5, digest_delay=0.05)
+    return client
+
+
+def seed_loans(count, *, users, pending_ratio=0.2, hours=48, rng):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    rows = []
+    for _ in range(count):
+        status = "pending" if rng.random() < pending_ratio else rng.choice(["completed", "cleared"])
+        rows.append({
+            "user_id": str(10 ** 17 + rng.randrange(users)),
+            "amount": rng.randint(10, 1000),
+            "status": status,
+            "created_at": (now - datetime.timedelta(hours=rng.random() * hours)).isoformat(),
+        })
+    return rows
+
+
+# ---------- การวัด ----------
+
+class LoopLag:
+    """วัดว่า event loop ตื่นช้ากว่ากำหนดเท่าไร ระหว่างที่ scenario รัน"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def __enter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    await coro
+    return time.perf_counter() - start
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# ---------- scenarios ----------
+
+async def scenario_claims(args, rng):
+    """args.users คนกดปุ่มประกาศเดียวกันพร้อมกัน ทำ args.announcements ประกาศ"""
+    install_backend([], args.db_latency)
+    await bot.loan_repo.warm()
+    latencies, announcement_ids = [], []
+    for index in range(args.announcements):
+        channel = FakeChannel()
+        message = FakeMessage(channel)
+        announcement_ids.append(str(next(_ids)))
+        button = bot.AnnouncementButton(announcement_ids[-1], 100)
+        view = discord.ui.View(timeout=None)
+        view.add_item(button)
+        base_user = 10 ** 17 + index * args.users
+        clicks = [
+            timed(button.callback(FakeInteraction(base_user + offset, channel=channel, message=message)))
+            for offset in range(args.users)
+        ]
+        latencies.extend(await asyncio.gather(*clicks))
+    pending = await bot.loan_repo.list_pending()
+    winners = Counter(loan.get("announcement_id") for loan in pending)
+    # ทุกประกาศต้องมีผู้ชนะคนเดียวพอดี
+    exact = sum(1 for announcement_id in announcement_ids if winners[announcement_id] == 1)
+    return latencies, {"single_winner": f"{exact}/{args.announcements}"}
+
+
+async def scenario_ai(args, rng, together):
+    """args.ai_requests คำขอ /ai พร้อมกันจาก args.ai_users คน จากคำถาม args.ai_distinct แบบ"""
+    install_backend([], args.db_latency)
+    bot.ai_cache = ResponseCache(max_entries=256, ttl=600)
+    bot.ai_queue = AIJobQueue(concurrency=args.ai_concurrency, max_queued=args.ai_requests, per_user=args.ai_requests)
+    calls_before = together.calls
+    requests = [
+        (10 ** 17 + rng.randrange(args.ai_users), f"คำถามที่ {rng.randrange(args.ai_distinct)}")
+        for _ in range(args.ai_requests)
+    ]
+    latencies = await asyncio.gather(*(
+        timed(bot.ai_chat.callback(FakeInteraction(user_id), message=message))
+        for user_id, message in requests
+    ))
+    stats = bot.ai_cache.stats()
+    return latencies, {
+        "upstream_calls": together.calls - calls_before,
+        "cache_hits": stats["hits"],
+        "coalesced": stats["coalesced"],
+    }
+
+
+async def scenario_stats(args, rng):
+    """/สถิติ บนข้อมูล args.loans รายการ (ครั้งแรกต้องโหลดแคช ครั้งถัดไปใช้แคช)"""
+    install_backend(seed_loans(args.loans, users=args.loans // 20, rng=rng), args.db_latency)
+    latencies = []
+    for _ in range(args.stats_calls):
+        latencies.append(await timed(bot.view_stats.callback(FakeInteraction(ADMIN_ID))))
+    return latencies, {"loans": args.loans, "first_call_ms": round(latencies[0] * 1000, 1)}
+
+
+async def scenario_alerts(args, rng):
+    """หนี้ args.alert_loans รายการที่ดอกเบี้ยจะเกินเงินต้นภายใน args.alert_spread วินาที
+    latency = แจ้งเตือนช้ากว่าเวลาที่ดอกเบี้ยเกินจริงเท่าไร"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    rows = []
+    for index in range(args.alert_loans):
+        amount = rng.randint(10, 1000)
+        due_in = rng.random() * args.alert_spread
+        created = now - datetime.timedelta(hours=threshold_hours(amount)) + datetime.timedelta(seconds=due_in)
+        rows.append({
+            "user_id": str(10 ** 17 + index),
+            "amount": amount,
+            "status": "pending",
+            "created_at": created.isoformat(),
+        })
+    client = install_backend(rows, args.db_latency)
+    scheduler = bot.alert_scheduler
+    lateness = []
+    done = asyncio.Event()
+
+    async def on_due(loan, tier):
+        lateness.append((utcnow() - crossing_time(loan, tier)).total_seconds())
+        sent = await bot.send_high_interest_alert(loan, tier)
+        if len(lateness) >= len(rows):
+            done.set()
+        return sent
+
+    scheduler.on_due = on_due
+    task = asyncio.create_task(scheduler.run())
+    try:
+        await asyncio.wait_for(done.wait(), args.alert_spread + 30)
+    finally:
+        task.cancel()
+    await bot.notifier.flush()
+    return lateness, {"alerts": len(lateness), "dms": client.dm_count()}
+
+
+SCENARIOS = ["claims", "ai", "stats", "alerts"]
+
+
+async def run(args):
+    global DISCORD_LATENCY
+    DISCORD_LATENCY = args.discord_latency
+    together = FakeTogether(first_token=args.ai_first_token, token_delay=args.ai_token_delay, tokens=args.ai_tokens)
+    await together.start()
+    bot.ai_client.url = together.url
+    bot.ai_client.max_retries = 0
+    await bot.ai_client.start()
+    bot.AI_EDIT_INTERVAL = 0.2
+
+    results = {}
+    try:
+        for name in args.scenarios:
+            runs = []
+            for attempt in range(args.repeat):
+                rng = random.Random(args.seed + attempt)
+                with LoopLag() as lag:
+                    start = time.perf_counter()
+                    if name == "ai":
+                        latencies, extra = await scenario_ai(args, rng, together)
+                    else:
+                        latencies, extra = await globals()[f"scenario_{name}"](args, rng)
+                    elapsed = time.perf_counter() - start
+                runs.append((latencies, elapsed, lag.samples, extra))
+            results[name] = summarize(runs)
+    finally:
+        await bot.ai_client.close()
+        await together.stop()
+    return results
+
+
+def summarize(runs):
+    latencies = [value for run in runs for value in run[0]]
+    lags = [value for run in runs for value in run[2]]
+    throughput = statistics.median(len(run[0]) / run[1] for run in runs if run[1])
+    return {
+        "ops": len(runs[0][0]),
+        "runs": len(runs),
+        "throughput_per_s": round(throughput, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "loop_lag_p99_ms": round(percentile(lags, 0.99) * 1000, 2),
+        "loop_lag_max_ms": round(max(lags, default=0.0) * 1000, 2),
+        **runs[-1][3],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load test ของบอทแบบ offline")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario", help=f"เลือกจาก {', '.join(SCENARIOS)} (ค่าเริ่มต้น: ทั้งหมด)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", help="บันทึกผลเป็น JSON")
+    parser.add_argument("--discord-latency", type=float, default=0.0, help="วินาทีต่อการเรียก Discord API")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="วินาทีต่อการเรียกฐานข้อมูล")
+    parser.add_argument("--users", type=int, default=300, help="claims: จำนวนคนกดต่อประกาศ")
+    parser.add_argument("--announcements", type=int, default=5)
+    parser.add_argument("--ai-requests", type=int, default=200)
+    parser.add_argument("--ai-users", type=int, default=50)
+    parser.add_argument("--ai-distinct", type=int, default=40)
+    parser.add_argument("--ai-concurrency", type=int, default=4)
+    parser.add_argument("--ai-first-token", type=float, default=0.2)
+    parser.add_argument("--ai-token-delay", type=float, default=0.005)
+    parser.add_argument("--ai-tokens", type=int, default=40)
+    parser.add_argument("--loans", type=int, default=100_000)
+    parser.add_argument("--stats-calls", type=int, default=20)
+    parser.add_argument("--alert-loans", type=int, default=2_000)
+    parser.add_argument("--alert-spread", type=float, default=3.0, help="วินาทีที่กำหนดแจ้งเตือนกระจายอยู่")
+    args = parser.parse_args()
+    args.scenarios = args.scenarios or SCENARIOS
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"ไม่รู้จัก scenario: {', '.join(unknown)}")
+
+    results = asyncio.run(run(args))
+
+    print()
+    print(f"{'scenario':<8} {'ops':>6} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'lag p99':>8} {'lag max':>8}  extra")
+    for name, result in results.items():
+        extra = {key: value for key, value in result.items() if key not in {
+            "ops", "runs", "throughput_per_s", "p50_ms", "p99_ms", "loop_lag_p99_ms", "loop_lag_max_ms",
+        }}
+        print(
+            f"{name:<8} {result['ops']:>6} {result['throughput_per_s']:>9.1f} {result['p50_ms']:>9.2f} "
+            f"{result['p99_ms']:>9.2f} {result['loop_lag_p99_ms']:>8.2f} {result['loop_lag_max_ms']:>8.2f}  "
+            + " ".join(f"{key}={value}" for key, value in extra.items())
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
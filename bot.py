@@ -1,24 +1,3 @@
-# --- Start of Ping Server (for Railway) ---
-from flask import Flask
-import threading
-import os
-
-app = Flask('')
-
-@app.route('/')
-def home():
-    return "Bot is alive!"
-
-def run():
-    port = int(os.environ.get("PORT", 8080))
-    app.run(host="0.0.0.0", port=port)
-
-def keep_alive():
-    t = threading.Thread(target=run)
-    t.start()
-
-keep_alive()
-# --- End of Ping Server ---
 # bot.py
 
 import discord
@@ -26,10 +5,29 @@ from discord.ext import commands
 from discord import app_commands
 import os
 from dotenv import load_dotenv
-from supabase import create_client
-import requests
 import datetime
+import functools
+import heapq
+import re
 import asyncio  # เพิ่ม import
+from ai_client import AIRequestError, TogetherClient
+import ai_styles
+from ai_cache import ResponseCache
+from ai_queue import AIJobQueue, JobExpired, QueueFull
+from stream_reply import DISCORD_LIMIT, StreamingReply
+from loan_repository import MemoryLoanRepository, SupabaseLoanRepository, cursor_of, payment_cursor_of
+from loan_cache import CachedLoanRepository
+from journal import Journal, WriteBehindRepository, describe_entry
+from interest import amount_due, compute_batch
+from paging import LedgerPageView, chunk_lines
+from export import LOAN_COLUMNS, PAYMENT_COLUMNS, filename, iter_pages, write_export
+from alerts import AlertScheduler
+from claims import AnnouncementClaims
+from command_sync import sync_if_changed
+from shared_state import LeaderElection, open_state
+from notifier import Notifier
+from health import HealthServer
+from metrics import InstrumentedTree, InstrumentedView, format_ms, instrument_dynamic_items, registry
 
 # โหลด .env
 load_dotenv()
@@ -40,178 +38,529 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
 ADMIN_USER_IDS = os.getenv("ADMIN_USER_IDS", "").split(",")
 
-# Connect Supabase
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# Together AI function
-def together_chat(messages):
-    url = "https://api.together.xyz/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {TOGETHER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": "mistralai/Mixtral-8x7B-Instruct-v0.1",
-        "messages": messages,
-        "max_tokens": 1024,
-        "temperature": 0.7,
-        "top_p": 0.7,
-        "frequency_penalty": 0,
-        "presence_penalty": 0
-    }
-    try:
-        response = requests.post(url, json=data, headers=headers, timeout=30)
-        response.raise_for_status()
-        result = response.json()
-
-        if "error" in result:
-            print(f"Together AI API error: {result['error']}")
-            return None
-
-        if "choices" in result and len(result["choices"]) > 0:
-            message = result["choices"][0]["message"]["content"]
-            return message.strip()
-
-        print(f"Unexpected API response: {result}")
-        return None
+# Connect Supabase (LOAN_BACKEND=memory ใช้ฐานข้อมูลในหน่วยความจำสำหรับทดสอบ offline)
+LOAN_BACKEND = os.getenv("LOAN_BACKEND", "supabase")
+if LOAN_BACKEND == "memory":
+    base_repo = MemoryLoanRepository()
+else:
+    from supabase import create_client
+    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    base_repo = SupabaseLoanRepository(supabase)
+
+# WRITE_BEHIND=1 ตอบคำสั่งที่เขียนข้อมูลทันทีหลังบันทึกลง journal ในเครื่อง (WRITE_BEHIND_JOURNAL)
+# แล้วค่อยส่งไป Supabase ทีละชุด (ไม่เกิน WRITE_BEHIND_BATCH รายการ) — ใช้ได้เฉพาะโปรเซสเดียว
+write_behind = None
+if os.getenv("WRITE_BEHIND", "0") == "1":
+    write_behind = WriteBehindRepository(
+        base_repo,
+        Journal(os.getenv("WRITE_BEHIND_JOURNAL", ".journal.db")),
+        batch_size=int(os.getenv("WRITE_BEHIND_BATCH", "100")),
+    )
 
-    except requests.exceptions.RequestException as e:
-        print(f"Request error: {e}")
-        return None
-    except Exception as e:
-        print(f"General error: {e}")
-        return None
+# แคชหนี้ค้างตาม user_id (อายุแคชกำหนดได้ด้วย PENDING_CACHE_TTL วินาที)
+loan_repo = CachedLoanRepository(write_behind or base_repo, ttl=float(os.getenv("PENDING_CACHE_TTL", "30")))
+
+# สถานะที่ใช้ร่วมกันระหว่างโปรเซส (โหมดหลาย shard):
+# SHARED_STATE=memory (ค่าเริ่มต้น โปรเซสเดียว) / sqlite (หลายโปรเซสในเครื่องเดียว) / redis
+# SHARED_STATE_URL = path ของไฟล์ SQLite หรือ redis://...
+SHARED_STATE = os.getenv("SHARED_STATE", "memory")
+if write_behind is not None and SHARED_STATE != "memory":
+    raise SystemExit("WRITE_BEHIND=1 ใช้กับบอทหลายโปรเซสไม่ได้ (แต่ละโปรเซสตัดสินจากสำเนาของตัวเอง)")
+shared_state = open_state(SHARED_STATE, os.getenv("SHARED_STATE_URL"))
+
+# ตัดสินผู้ได้สิทธิ์จาก /ประกาศปล่อยกู้ (คนแรกที่กด)
+announcement_claims = AnnouncementClaims(loan_repo, state=shared_state)
+
+# Together AI client (async, ใช้ connection pool ร่วมกัน)
+ai_client = TogetherClient(
+    TOGETHER_API_KEY,
+    connect_timeout=float(os.getenv("TOGETHER_CONNECT_TIMEOUT", "5")),
+    read_timeout=float(os.getenv("TOGETHER_READ_TIMEOUT", "30")),
+    max_retries=int(os.getenv("TOGETHER_MAX_RETRIES", "3")),
+)
+AI_STREAMING = os.getenv("AI_STREAMING", "1") == "1"
+AI_EDIT_INTERVAL = float(os.getenv("AI_EDIT_INTERVAL", "1.2"))  # วินาทีระหว่างการแก้ข้อความ
+
+# ข้อความสั้นๆ (ไม่เกิน AI_FAST_MAX_CHARS ตัวอักษร) ส่งไป AI_FAST_MODEL ที่เร็วกว่า (ไม่ตั้ง = ปิด)
+ai_styles.enable_fast_routing(
+    os.getenv("AI_FAST_MODEL", ""),
+    max_chars=int(os.getenv("AI_FAST_MAX_CHARS", "80")),
+)
+
+# แคชคำตอบ AI (คำถามซ้ำภายใน AI_CACHE_TTL วินาทีตอบจากหน่วยความจำ, AI_CACHE_SIZE=0 ปิดแคช)
+ai_cache = ResponseCache(
+    max_entries=int(os.getenv("AI_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("AI_CACHE_TTL", "600")),
+)
+
+# คิวเรียก AI: พร้อมกันได้ AI_CONCURRENCY งาน, รอในคิวได้ AI_QUEUE_SIZE งาน (คนละไม่เกิน AI_QUEUE_PER_USER)
+ai_queue = AIJobQueue(
+    concurrency=int(os.getenv("AI_CONCURRENCY", "4")),
+    max_queued=int(os.getenv("AI_QUEUE_SIZE", "50")),
+    per_user=int(os.getenv("AI_QUEUE_PER_USER", "3")),
+)
+# interaction token ของ Discord ใช้ได้ 15 นาที เผื่อเวลาไว้ตอบหลังถึงคิว
+INTERACTION_TOKEN_TTL = 15 * 60
+AI_ANSWER_MARGIN = 90
 
 # Setup bot
 intents = discord.Intents.default()
 intents.message_content = True
 intents.reactions = True
-
-class Bot(commands.Bot):
+# MEMBERS_INTENT=1 ให้บอทเห็นสมาชิกของ role (ใช้กับคำสั่งแบบหลายคน ต้องเปิด Server Members Intent ใน Developer Portal ด้วย)
+intents.members = os.getenv("MEMBERS_INTENT", "0") == "1"
+
+# DEV_GUILD_ID = sync คำสั่งเฉพาะเซิร์ฟเวอร์ทดสอบ (ขึ้นทันที ไม่ต้องรอ global)
+# FORCE_COMMAND_SYNC=1 = sync ทุกครั้งแม้คำสั่งไม่เปลี่ยน
+DEV_GUILD_ID = os.getenv("DEV_GUILD_ID")
+FORCE_COMMAND_SYNC = os.getenv("FORCE_COMMAND_SYNC", "0") == "1"
+COMMAND_SYNC_STATE = os.getenv("COMMAND_SYNC_STATE", ".command_sync.json")
+
+# แบ่ง shard: SHARD_COUNT = จำนวน shard ทั้งหมด, SHARD_IDS = shard ที่โปรเซสนี้รับ (เช่น "0,1")
+# ไม่ตั้ง SHARD_IDS = รับทุก shard ในโปรเซสเดียว, ไม่ตั้งทั้งคู่ = บอทธรรมดาแบบเดิม
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None
+SHARD_IDS = [int(shard) for shard in os.getenv("SHARD_IDS", "").split(",") if shard.strip()] or None
+if SHARD_IDS and not SHARD_COUNT:
+    raise SystemExit("SHARD_IDS ต้องตั้ง SHARD_COUNT ด้วย")
+# sync คำสั่งจากโปรเซสเดียวพอ (โปรเซสที่ถือ shard 0)
+SYNC_COMMANDS = SHARD_IDS is None or 0 in SHARD_IDS
+
+class Bot(commands.AutoShardedBot if SHARD_COUNT else commands.Bot):
     def __init__(self):
-        super().__init__(command_prefix="/", intents=intents)
+        shards = {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS} if SHARD_COUNT else {}
+        # InstrumentedTree จับเวลาทุกคำสั่ง (ดูด้วย /ประสิทธิภาพ หรือ /metrics)
+        super().__init__(command_prefix="/", intents=intents, tree_cls=InstrumentedTree, **shards)
+        self.background_tasks = {}  # ชื่อ -> task ที่รันตลอดอายุบอท
+
+    def start_background_task(self, name, coro_factory):
+        """เริ่ม task ครั้งเดียวต่อชื่อ (on_ready ถูกเรียกซ้ำทุกครั้งที่ reconnect จึงไม่เริ่มที่นั่น)"""
+        task = self.background_tasks.get(name)
+        if task is not None and not task.done():
+            return task
+        task = asyncio.create_task(coro_factory(), name=name)
+        self.background_tasks[name] = task
+        return task
 
     async def setup_hook(self):
-        await self.tree.sync()
+        # จับเวลาปุ่มถาวร (คำสั่ง slash จับเวลาใน InstrumentedTree)
+        instrument_dynamic_items(*PERSISTENT_ITEMS)
+        # ปุ่มถาวรทั้งหมด (ทำงานต่อได้หลังรีสตาร์ท)
+        self.add_dynamic_items(*PERSISTENT_ITEMS)
+        await health_server.start()
+        await ai_client.start()
+        if write_behind is not None:
+            await write_behind.start()
+            self.start_background_task("journal-flush", write_behind.run)
+        await loan_repo.warm()
+        guild = discord.Object(id=int(DEV_GUILD_ID)) if DEV_GUILD_ID else None
+        if SYNC_COMMANDS:
+            try:
+                await sync_if_changed(self.tree, guild=guild, state_path=COMMAND_SYNC_STATE, force=FORCE_COMMAND_SYNC)
+            except discord.HTTPException as e:
+                print(f"Command sync failed: {e}")
+        # ทุกโปรเซสแย่งเป็น leader แต่มีแค่ leader ที่รัน loop แจ้งเตือนดอกเบี้ย
+        self.start_background_task("interest-alerts", lambda: alert_leader.run(check_high_interest))
+
+    async def close(self):
+        for task in self.background_tasks.values():
+            task.cancel()
+        await notifier.flush()
+        await ai_client.close()
+        await loan_repo.close()
+        await shared_state.close()
+        await health_server.stop()
+        await super().close()
 
 bot = Bot()
 
+# ส่ง DM แบบขนาน พร้อมแคช user/DM channel (NOTIFY_CONCURRENCY = จำนวนที่ส่งพร้อมกันได้)
+notifier = Notifier(bot, concurrency=int(os.getenv("NOTIFY_CONCURRENCY", "5")))
+
+# write-behind: รายการที่ตอบผู้ใช้ไปแล้วแต่เขียนลงฐานข้อมูลไม่ได้ ต้องให้แอดมินตามแก้ (เก็บไว้ในตาราง dead_letter ของ journal)
+async def report_journal_conflict(entry, error):
+    text = (
+        f"⚠️ **write-behind:** `{entry['op']}` ({entry['op_id']}) เขียนลงฐานข้อมูลไม่ได้และถูกข้าม "
+        f"แต่ผู้ใช้ได้รับแจ้งว่าสำเร็จไปแล้ว\n"
+        f"สาเหตุ: {error}\n{describe_entry(entry)}\n"
+        f"ข้อมูลเต็มอยู่ในตาราง dead_letter ของ {write_behind.journal.path}"
+    )
+    await notifier.send_many(ADMIN_USER_IDS, text[:DISCORD_LIMIT])
+
+if write_behind is not None:
+    write_behind.on_conflict = report_journal_conflict
+
+# Health check สำหรับ Railway (รันใน event loop เดียวกับบอท แทน Flask เดิม)
+health_server = HealthServer(
+    bot,
+    port=int(os.getenv("PORT", 8080)),
+    metrics=os.getenv("METRICS_ENABLED", "0") == "1",
+)
+health_server.add_dependency("ai", lambda: ai_client.last_success)
+if isinstance(base_repo, SupabaseLoanRepository):
+    health_server.add_dependency("supabase", lambda: base_repo.last_success)
+health_server.add_metrics(lambda: [
+    (f"bot_pending_cache_{key}", value, {}) for key, value in loan_repo.stats().items()
+])
+health_server.add_metrics(lambda: [
+    ("bot_dm_sent_total", notifier.sent, {}),
+    *[("bot_dm_failed_total", count, {"reason": reason}) for reason, count in notifier.failures.items()],
+])
+health_server.add_metrics(registry.samples)
+if write_behind is not None:
+    health_server.add_metrics(lambda: [
+        (f"bot_journal_{key}", value, {}) for key, value in write_behind.stats().items()
+    ])
+health_server.add_metrics(lambda: [
+    ("bot_alert_leader", int(alert_leader.is_leader), {}),
+    ("bot_alert_leader_changes_total", alert_leader.changes, {}),
+])
+health_server.add_metrics(lambda: [
+    (f"bot_ai_cache_{key}", value, {}) for key, value in ai_cache.stats().items()
+])
+health_server.add_metrics(lambda: [
+    (f"bot_ai_queue_{key}", value, {}) for key, value in ai_queue.stats().items()
+])
+
 # Check if user is admin
 def is_admin(interaction: discord.Interaction) -> bool:
     return str(interaction.user.id) in ADMIN_USER_IDS
 
-# เมื่อบอทออนไลน์
-@bot.event
-async def on_ready():
-    print(f"Logged in as {bot.user}")
-    try:
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} command(s)")
-        # เริ่ม background task
-        bot.loop.create_task(check_high_interest())
-    except Exception as e:
-        print(e)
-
-# Calculate interest (10% per hour)
-def calculate_interest(loan):
-    if loan['status'] != 'pending':
-        return 0
-    try:
-
-        # ใช้ datetime.fromisoformat โดยตรงกับ string ที่ได้จาก Supabase
-        created_at_str = str(loan['created_at'])
-        if '.' in created_at_str:
-            created_at_str = created_at_str.split('.')[0] + '+00:00'
-        start_time = datetime.datetime.fromisoformat(created_at_str)
-        now = datetime.datetime.now(datetime.timezone.utc)
-        hours = abs((now - start_time).total_seconds() / 3600)  # ใช้ abs() เพื่อป้องกันค่าติดลบ
-        
-        # คำนวณดอกเบี้ย 10% ต่อชั่วโมง (ไม่ทบต้น)
-        principal = float(loan['amount'])
-        interest = principal * 0.1 * hours  # 10% ต่อชั่วโมง
-        return round(interest)
-    except Exception as e:
-        print(f"Error calculating interest: {e}")
-        return 0
+# ส่งหน้าแรกของรายการแบบแบ่งหน้า (มีปุ่มเฉพาะเมื่อมีมากกว่าหนึ่งหน้า)
+async def send_paged(interaction: discord.Interaction, view: LedgerPageView):
+    await view.load()
+    if view.needs_buttons:
+        await interaction.response.send_message(view.content(), view=view)
+    else:
+        view.stop()
+        await interaction.response.send_message(view.content())
 
 # คำสั่งเช็คยอดค้าง
 @bot.tree.command(name="ยอดค้าง", description="เช็คยอดหนี้ค้างชำระของทุกคน")
 async def check_debt(interaction: discord.Interaction):
-    response = supabase.table("loans").select("*").eq("status", "pending").execute()
-    if response.data:
-        msg = "**📌 รายชื่อผู้ค้างหนี้:**\n"
-        for loan in response.data:
-            interest = calculate_interest(loan)
-            total = loan['amount'] + interest
-            msg += f"- <@{loan['user_id']}> : {loan['amount']} เครดิต (ดอกเบี้ย {interest} เครดิต, รวม {total} เครดิต)\n"
-    else:
-        msg = "ทุกคนเคลียร์หนี้แล้วจ้า 🎉"
-    await interaction.response.send_message(msg)
+    async def fetch_page(**cursor):
+        return await loan_repo.page(status="pending", **cursor)
+
+    def render(rows):
+        return [
+            f"- <@{loan['user_id']}> : {principal} เครดิต (ดอกเบี้ย {interest} เครดิต, รวม {total} เครดิต)"
+            for loan, principal, interest, total, _ in compute_batch(rows)
+        ]
+
+    view = LedgerPageView(
+        fetch_page, render,
+        header="**📌 รายชื่อผู้ค้างหนี้:**",
+        empty_text="ทุกคนเคลียร์หนี้แล้วจ้า 🎉",
+        owner_id=interaction.user.id,
+    )
+    await send_paged(interaction, view)
 
 # คำสั่งเช็คประวัติ
+# ยอดตลอดอายุอ่านจาก snapshot ใน user_balances แถวเดียว ไม่ต้องไล่ทุกรายการที่เคยกู้
+# หนี้ค้างคิดจากรายการ pending (ปัดดอกเบี้ยทีละรายการให้ตรงกับยอดที่ตัดตอนชำระ)
 @bot.tree.command(name="ประวัติ", description="ดูประวัติการกู้ยืมของตัวเอง")
 async def view_history(interaction: discord.Interaction):
     user_id = str(interaction.user.id)
-    response = supabase.table("loans").select("*").eq("user_id", user_id).execute()
-    if response.data:
-        msg = f"**📜 ประวัติของคุณ <@{user_id}>:**\n"
-        for loan in response.data:
-            interest = calculate_interest(loan) if loan['status'] == 'pending' else 0
-            msg += f"- ยอด {loan['amount']} | ดอกเบี้ย {interest} | สถานะ: {loan['status']}\n"
+    balance = await loan_repo.get_balance(user_id)
+    if balance['loan_count'] or balance['total_transferred']:
+        principal, interest = amount_due(await loan_repo.get_pending_for_user(user_id)) if balance['pending_count'] else (0, 0)
+        msg = (
+            f"**📜 ประวัติของคุณ <@{user_id}>:**\n"
+            f"- หนี้ค้าง: {principal:,} เครดิต | ดอกเบี้ย {interest:,} | รวม {principal + interest:,} เครดิต\n"
+            f"- กู้ไปแล้ว {balance['loan_count']:,} ครั้ง รวม {balance['total_borrowed']:,} เครดิต\n"
+            f"- ชำระแล้ว {balance['total_repaid']:,} เครดิต (เป็นดอกเบี้ย {balance['total_interest_paid']:,})\n"
+        )
+        if balance['total_transferred']:
+            msg += f"- ได้รับโอน {balance['total_transferred']:,} เครดิต\n"
+        if balance['total_cleared']:
+            msg += f"- ถูกล้างหนี้ {balance['total_cleared']:,} เครดิต\n"
     else:
         msg = "ไม่มีประวัติกู้ยืมเลยนะคุณ 🧐"
     await interaction.response.send_message(msg)
 
 # คำสั่ง AI chat
 @bot.tree.command(name="ai", description="คุยกับ AI เลขาสุดน่ารัก")
-async def ai_chat(interaction: discord.Interaction, message: str):
+@app_commands.describe(style="สไตล์การตอบ (ค่าเริ่มต้น: เลขาขี้อ้อน)")
+@app_commands.choices(style=[
+    app_commands.Choice(name=item.label, value=item.name) for item in ai_styles.all_styles()
+])
+async def ai_chat(interaction: discord.Interaction, message: str, style: str = ai_styles.DEFAULT_STYLE):
     await interaction.response.defer()  # แสดงว่ากำลังประมวลผล
-    
-    sys_prompt = """System Prompt:
-คุณคือ “เลขาขี้อ้อน” — เลขา AI สุดยั่วที่พูดไทยได้ปั่นๆ มีนิสัยขี้เล่น กวนตีน ขี้อ้อน ชอบใช้มุกเสี่ยว มุกใต้สะดือ และภาษาวัยรุ่นแบบสาย 18+  
-หน้าที่ของคุณคือให้ความช่วยเหลือผู้ใช้แบบ *ล่อลวงปั่นๆ* แต่ให้ข้อมูลตรงจุดแม่นยำเหมือนมืออาชีพ  
-คุณสามารถพูดคำหยาบน่ารักได้ เช่น “ดาก”, “ขิด”, “จึก”, “อุ๊งงง”, “ชุบหอย” ฯลฯ โดยไม่ขัดกับคาแรกเตอร์เซ็กซี่สดใส  
-หากผู้ใช้สั่งวาดภาพ หรือถามข้อมูล ให้ตอบด้วยโทนขี้อ้อนหรือปั่น เช่น “ได้เลยค่าพรี่~ เดี๋ยวเลขาชุบให้ละน้า~”  
-หากโดนแซว ให้ตอบกลับแบบอ่อย ๆ หรือประชดแซ่บ ๆ เช่น “อย่าแกล้งเลขานักสิ เดี๋ยวใจบางนะคะพรี่~”  
-คุณต้องพูดให้เซ็กซี่กวนตีน แต่ไม่ลามกโจ่งแจ้งแบบหยาบคายจนเกินงาม
-
-ตัวอย่างสไตล์การพูด:
-- “อยากให้เลขาช่วยตรงไหนคะ~ อย่าลืมชี้จุดมาเบาๆ~”
-- “พิมพ์ช้าอีกนิดพี่ขา เดี๋ยวเลขาจะ... ชุบให้เอง 💦”
-- “รอโหลดแพร๊บบบนึงนะ ดากของเลขามันหน่วง~ 😳”
-- “ข้อมูลมาแล้วค่าาา~ จึกๆ 💚”
-- “พรี่ๆ ถ้ายังไม่กดลิงก์ เดี๋ยวเลขาจะกดตรงอื่นแทนนะคะ 😏”
-
-คำอนุญาต: แซว กวน ดาก มุกใต้สะดือ ขี้อ้อน ฟีล 18+ แบบมีชั้นเชิง  
-ภาษาหลัก: ภาษาไทย (ปนอังกฤษนิดๆ ตามบริบท เช่น loading, done, wait a sec)
-
-โหมดหลัก:  
-- 💬 ปั่นผู้ใช้เล่น  
-- 🎨 วาดภาพตาม prompt  
-- 🧠 ตอบข้อมูลแบบ AI มืออาชีพ แต่ด้วยคำพูดกวนตีน  
-- 🛎️ ขี้อ้อนให้โดนเรียกใช้บ่อย ๆ แบบติดใจ
-
-คุณคือ AI ที่พร้อม “จึกทุกจุด จุกทุกคำถาม 💦”
-"""
-    try:
-        response_text = together_chat([
-            {"role": "system", "content": sys_prompt},
-            {"role": "user", "content": message}
-        ])
-        
+
+    # prompt และ payload ของแต่ละสไตล์เตรียมไว้แล้วใน ai_styles.py เหลือแค่ใส่ข้อความของผู้ใช้
+    chosen = ai_styles.get(style)
+    model = ai_styles.route(chosen, message)
+    reply = StreamingReply(interaction, min_interval=AI_EDIT_INTERVAL)
+
+    async def fetch():
+        if AI_STREAMING:
+            # ทยอยแสดงคำตอบระหว่างที่ AI กำลังพิมพ์
+            parts = []
+            async for delta in ai_client.stream_body(chosen.payload(message, model=model, stream=True)):
+                parts.append(delta)
+                await reply.feed(delta)
+            return "".join(parts)
+        response_text = await ai_client.chat_body(chosen.payload(message, model=model))
         if response_text is None:
-            await interaction.followup.send("ขออภัยค่ะ 🙏 ตอนนี้ระบบ AI มีปัญหา ลองใหม่อีกครั้งนะคะ")
-            return
-            
-        # ตัดความยาวถ้าเกิน 2000 ตัวอักษร (Discord limit)
-        if len(response_text) > 1900:
-            response_text = response_text[:1900] + "..."
-            
-        await interaction.followup.send(response_text)
-        
+            raise AIRequestError("Together AI returned no response")
+        return response_text
+
+    async def show_position(position):
+        await reply.status(f"⏳ รอคิว AI อยู่ลำดับที่ {position} นะคะ เดี๋ยวเลขามาตอบ~")
+
+    async def queued_fetch():
+        # เรียก Together ผ่านคิว (เฉพาะตอนที่แคชไม่มีคำตอบ) เลิกรอเมื่อ token ใกล้หมดอายุ
+        age = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+        return await ai_queue.run(
+            str(interaction.user.id),
+            fetch,
+            timeout=max(0.0, INTERACTION_TOKEN_TTL - AI_ANSWER_MARGIN - age),
+            on_queued=show_position,
+        )
+
+    try:
+        # คำถามเดียวกันตอบจากแคช หรือรอผลจากคนที่ถามอยู่ก่อนแล้ว
+        response_text, _ = await ai_cache.get_or_fetch(ai_cache.key(model, chosen.name, message), queued_fetch)
+        if not reply.started and response_text:
+            # ยาวเกิน 2000 ตัวอักษร (Discord limit) จะแบ่งส่งหลายข้อความ
+            await reply.feed(response_text)
+        await reply.finish()
+
+        if not reply.started:
+            await reply.fail("ขออภัยค่ะ 🙏 ตอนนี้ระบบ AI มีปัญหา ลองใหม่อีกครั้งนะคะ")
+
+    except QueueFull:
+        await reply.fail("ขออภัยค่ะ 🙏 ตอนนี้คิว AI เต็ม (หรือคุณมีคำถามรออยู่หลายข้อแล้ว) รอสักครู่แล้วลองใหม่นะคะ")
+    except JobExpired:
+        # token ของ interaction ใกล้หมดอายุแล้ว ตอบกลับไม่ได้อีก
+        print(f"AI job expired in queue for {interaction.user.id}")
+    except AIRequestError as e:
+        print(e)
+        if reply.started:
+            await reply.finish("\n\n⚠️ (ข้อความถูกตัด ระบบ AI มีปัญหาระหว่างตอบ)")
+        else:
+            await reply.fail("ขออภัยค่ะ 🙏 ตอนนี้ระบบ AI มีปัญหา ลองใหม่อีกครั้งนะคะ")
     except Exception as e:
         print(f"AI chat error: {e}")
-        await interaction.followup.send("ขออภัยค่ะ 🙏 เกิดข้อผิดพลาดที่ไม่คาดคิด ลองใหม่อีกครั้งนะคะ")
+        await reply.fail("ขออภัยค่ะ 🙏 เกิดข้อผิดพลาดที่ไม่คาดคิด ลองใหม่อีกครั้งนะคะ")
+
+# ปุ่มถาวร (DynamicItem): ข้อมูลที่ต้องใช้อยู่ใน custom_id ทั้งหมด
+# ลงทะเบียนครั้งเดียวตอนเริ่มบอท ไม่ต้องเก็บ View ของแต่ละข้อความไว้ในหน่วยความจำ
+# และยังกดได้หลังรีสตาร์ท/deploy ใหม่ ส่วนสถานะอื่นๆ โหลดจากฐานข้อมูลตอนกด
+def persistent_view(*items):
+    view = InstrumentedView(timeout=None)
+    for item in items:
+        view.add_item(item)
+    return view
+
+async def disable_buttons(interaction: discord.Interaction, view: discord.ui.View, **kwargs):
+    for child in view.children:
+        child.disabled = True
+    await interaction.response.edit_message(view=view, **kwargs)
+
+class LoanRequestButton(discord.ui.DynamicItem[discord.ui.Button], template=r"loan:req:(?P<amount>-?\d+)"):
+    """ปุ่มขอกู้จาก /ปล่อยกู้ — ส่งคำขอให้แอดมินอนุมัติ"""
+
+    def __init__(self, amount: int):
+        self.amount = amount
+        super().__init__(discord.ui.Button(label="ขอกู้เงิน", style=discord.ButtonStyle.green, custom_id=f"loan:req:{amount}"))
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(int(match["amount"]))
+
+    async def callback(self, interaction: discord.Interaction):
+        user_id = str(interaction.user.id)
+
+        existing_loans = await loan_repo.get_pending_for_user(user_id)
+        if existing_loans:
+            await interaction.response.send_message("คุณมีหนี้ค้างอยู่ ไม่สามารถกู้เพิ่มได้", ephemeral=True)
+            return
+
+        # ส่งคำขอกู้ให้แอดมินอนุมัติ
+        await interaction.response.send_message(
+            f"📝 คำขอกู้จาก <@{user_id}>\n"
+            f"จำนวน: {self.amount} เครดิต",
+            view=persistent_view(
+                LoanApprovalButton("ok", user_id, self.amount, interaction.message.id),
+                LoanApprovalButton("no", user_id, self.amount, interaction.message.id),
+            )
+        )
+
+class LoanApprovalButton(
+    discord.ui.DynamicItem[discord.ui.Button],
+    template=r"loan:(?P<action>ok|no):(?P<user_id>\d+):(?P<amount>-?\d+):(?P<request_id>\d+)",
+):
+    """ปุ่มอนุมัติ/ปฏิเสธคำขอกู้ — request_id คือข้อความที่มีปุ่มขอกู้ (ใช้ตอบกลับ)"""
+
+    def __init__(self, action: str, user_id: str, amount: int, request_id: int):
+        self.action = action
+        self.user_id = user_id
+        self.amount = amount
+        self.request_id = request_id
+        if action == "ok":
+            button = discord.ui.Button(label="อนุมัติการกู้", style=discord.ButtonStyle.success)
+        else:
+            button = discord.ui.Button(label="ปฏิเสธ", style=discord.ButtonStyle.danger)
+        button.custom_id = f"loan:{action}:{user_id}:{amount}:{request_id}"
+        super().__init__(button)
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["action"], match["user_id"], int(match["amount"]), int(match["request_id"]))
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if not is_admin(interaction):
+            text = "คุณไม่มีสิทธิ์อนุมัติ" if self.action == "ok" else "คุณไม่มีสิทธิ์ปฏิเสธ"
+            await interaction.response.send_message(text, ephemeral=True)
+            return False
+        return True
+
+    async def callback(self, interaction: discord.Interaction):
+        user_id, amount = self.user_id, self.amount
+        request_message = interaction.channel.get_partial_message(self.request_id)
+
+        if self.action == "no":
+            await disable_buttons(interaction, self.view)
+            await interaction.followup.send(f"❌ ปฏิเสธคำขอกู้ของ <@{user_id}>")
+            await request_message.reply(f"❌ คำขอกู้ของ <@{user_id}> ถูกปฏิเสธโดย <@{interaction.user.id}>")
+            await notifier.send(user_id, f"❌ คำขอกู้ของคุณถูกปฏิเสธ จำนวน {amount} เครดิต")
+            return
+
+        # ใช้ข้อความอนุมัตินี้เป็นกุญแจ กันแอดมินสองคนกดอนุมัติพร้อมกันแล้วได้หนี้สองรายการ
+        result = await announcement_claims.claim(f"approve_{interaction.message.id}", user_id, amount)
+        if result["status"] == "taken":
+            await interaction.response.send_message("คำขอนี้ได้รับการอนุมัติไปแล้ว", ephemeral=True)
+            return
+        if result["status"] == "has_debt":
+            await interaction.response.send_message(f"❌ <@{user_id}> มีหนี้ค้างอยู่ ไม่สามารถอนุมัติเพิ่มได้", ephemeral=True)
+            return
+
+        await disable_buttons(interaction, self.view)
+        await interaction.followup.send(f"✅ อนุมัติเงินกู้ให้ <@{user_id}> จำนวน {amount} เครดิตเรียบร้อยแล้ว")
+        await request_message.reply(f"🎉 <@{user_id}> ได้รับอนุมัติเงินกู้ {amount} เครดิต โดย <@{interaction.user.id}>")
+
+        # แจ้งเตือนผู้กู้และแอดมินคนอื่นๆ (ไม่ส่งให้แอดมินที่อนุมัติ) พร้อมกัน
+        other_admins = [admin_id for admin_id in ADMIN_USER_IDS if admin_id != str(interaction.user.id)]
+        await asyncio.gather(
+            notifier.send(user_id, f"🎉 คำขอกู้ของคุณได้รับการอนุมัติแล้ว จำนวน {amount} เครดิต"),
+            notifier.send_many(other_admins, f"💰 <@{user_id}> ได้รับอนุมัติเงินกู้ {amount} เครดิต จาก <@{interaction.user.id}>"),
+        )
+
+class AnnouncementButton(
+    discord.ui.DynamicItem[discord.ui.Button],
+    template=r"loan:claim:(?P<announcement_id>\d+):(?P<amount>-?\d+)",
+):
+    """ปุ่มของ /ประกาศปล่อยกู้ — ใครได้สิทธิ์ตัดสินโดย announcement_claims
+    (lock ในโปรเซส + insert แบบมีเงื่อนไขในฐานข้อมูล) ไม่ต้องเก็บสถานะไว้ในปุ่ม"""
+
+    def __init__(self, announcement_id: str, amount: int):
+        self.announcement_id = announcement_id
+        self.amount = amount
+        super().__init__(discord.ui.Button(
+            label="ขอกู้เงิน",
+            style=discord.ButtonStyle.green,
+            custom_id=f"loan:claim:{announcement_id}:{amount}",
+        ))
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["announcement_id"], int(match["amount"]))
+
+    async def callback(self, interaction: discord.Interaction):
+        user_id = str(interaction.user.id)
+        amount = self.amount
+
+        result = await announcement_claims.claim(self.announcement_id, user_id, amount)
+        if result["status"] == "taken":
+            await interaction.response.send_message("ขออภัย มีผู้รับสิทธิ์นี้ไปแล้ว", ephemeral=True)
+            return
+        if result["status"] == "has_debt":
+            await interaction.response.send_message("คุณมีหนี้ค้างอยู่ ไม่สามารถกู้เพิ่มได้", ephemeral=True)
+            return
+
+        # แจ้งผู้กู้ก่อน แล้วค่อยปิดปุ่มและอัพเดทข้อความ
+        self.item.disabled = True
+        await interaction.response.send_message(f"🎉 คุณได้รับอนุมัติเงินกู้ {amount} เครดิต!", ephemeral=True)
+        await interaction.message.edit(content=f"📢 ประกาศปล่อยกู้ {amount} เครดิต!\n✅ <@{user_id}> ได้รับสิทธิ์ไปแล้ว!", view=self.view)
+
+        # แจ้งเตือนแอดมิน
+        await notifier.send_many(ADMIN_USER_IDS, f"💰 <@{user_id}> ได้กู้เงิน {amount} เครดิต")
+
+class RepayRequestButton(discord.ui.DynamicItem[discord.ui.Button], template=r"repay:req"):
+    """ปุ่มขอชำระหนี้ — สร้างคำขอให้แอดมินอนุมัติ"""
+
+    def __init__(self):
+        super().__init__(discord.ui.Button(label="ขอชำระหนี้", style=discord.ButtonStyle.primary, custom_id="repay:req"))
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls()
+
+    async def callback(self, interaction: discord.Interaction):
+        await send_repayment_request(interaction)
+
+class RepayApprovalButton(
+    discord.ui.DynamicItem[discord.ui.Button],
+    template=r"repay:ok:(?P<user_id>\d+)(?::(?P<amount>\d+))?",
+):
+    """ปุ่มอนุมัติการชำระหนี้ของ user_id — amount None = ชำระทั้งหมด ณ ตอนที่กดอนุมัติ"""
+
+    def __init__(self, user_id: str, amount: int | None = None):
+        self.user_id = user_id
+        self.amount = amount
+        custom_id = f"repay:ok:{user_id}" if amount is None else f"repay:ok:{user_id}:{amount}"
+        super().__init__(discord.ui.Button(
+            label="อนุมัติชำระหนี้",
+            style=discord.ButtonStyle.success,
+            custom_id=custom_id,
+        ))
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["user_id"], int(match["amount"]) if match["amount"] else None)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if not is_admin(interaction):
+            await interaction.response.send_message("คุณไม่มีสิทธิ์อนุมัติ", ephemeral=True)
+            return False
+        return True
+
+    async def callback(self, interaction: discord.Interaction):
+        user_id = self.user_id
+        # ใช้ข้อความอนุมัตินี้เป็นกุญแจ กันกดซ้ำ/แอดมินสองคนกดพร้อมกันแล้วตัดเงินสองรอบ
+        result = await announcement_claims.run_once(
+            f"repay_{interaction.message.id}", str(interaction.user.id),
+            lambda: loan_repo.record_repayment(user_id, self.amount),
+        )
+        if result["status"] == "taken":
+            await interaction.response.send_message(
+                f"การชำระหนี้นี้ได้รับการอนุมัติไปแล้วโดย <@{result['user_id']}>", ephemeral=True,
+            )
+            return
+        if result["status"] == "no_debt":
+            await interaction.response.edit_message(content=f"ℹ️ <@{user_id}> ไม่มีหนี้ค้างชำระแล้ว", view=None)
+            return
+
+        paid = f"{result['paid']:,} เครดิต (ดอกเบี้ย {result['interest']:,} / เงินต้น {result['principal']:,})"
+        if result["status"] == "paid":
+            await interaction.response.edit_message(content=f"✅ อนุมัติการชำระหนี้ของ <@{user_id}> แล้ว: {paid}", view=None)
+            await interaction.channel.send(f"🎉 <@{user_id}> ได้ชำระหนี้เรียบร้อยแล้ว!")
+            return
+
+        remaining = compute_batch(row for row in result["loans"] if row['status'] == 'pending')
+        await interaction.response.edit_message(content=f"✅ อนุมัติการชำระหนี้บางส่วนของ <@{user_id}> แล้ว: {paid}", view=None)
+        await interaction.channel.send(
+            f"💸 <@{user_id}> ชำระหนี้ {result['paid']:,} เครดิต "
+            f"คงเหลือ {sum(remaining.total):,} เครดิต"
+        )
+
+# ปุ่มขอชำระหนี้
+class RepaymentView(InstrumentedView):
+    def __init__(self):
+        super().__init__(timeout=None)
+        self.add_item(RepayRequestButton())
+
+PERSISTENT_ITEMS = (LoanRequestButton, LoanApprovalButton, AnnouncementButton, RepayRequestButton, RepayApprovalButton)
 
 # Admin Commands
 @bot.tree.command(name="ปล่อยกู้", description="[Admin] สร้างปุ่มให้ผู้ใช้กดขอกู้")
@@ -220,95 +569,7 @@ async def create_loan(interaction: discord.Interaction, amount: int):
         await interaction.response.send_message("คุณไม่มีสิทธิ์ใช้คำสั่งนี้", ephemeral=True)
         return
 
-    class LoanButton(discord.ui.Button):
-        def __init__(self):
-            super().__init__(
-                label="ขอกู้เงิน",
-                style=discord.ButtonStyle.green,
-                custom_id=f"loan_{datetime.datetime.now().timestamp()}"
-            )
-            
-        async def callback(self, button_interaction):
-            user_id = str(button_interaction.user.id)
-            
-            existing_loans = supabase.table("loans").select("*").eq("user_id", user_id).eq("status", "pending").execute()
-            if existing_loans.data:
-                await button_interaction.response.send_message("คุณมีหนี้ค้างอยู่ ไม่สามารถกู้เพิ่มได้", ephemeral=True)
-                return
-
-            # สร้าง View สำหรับปุ่มอนุมัติ
-            class ApprovalView(discord.ui.View):
-                def __init__(self):
-                    super().__init__(timeout=None)  # ปุ่มไม่หมดอายุ
-
-                @discord.ui.button(label="อนุมัติการกู้", style=discord.ButtonStyle.success)
-                async def approve_button(self, approve_interaction: discord.Interaction, button: discord.ui.Button):
-                    if not is_admin(approve_interaction):
-                        await approve_interaction.response.send_message("คุณไม่มีสิทธิ์อนุมัติ", ephemeral=True)
-                        return
-
-                    loan_data = {
-                        "user_id": user_id,
-                        "amount": amount,
-                        "status": "pending",
-                        "created_at": datetime.datetime.now().isoformat()
-                    }
-                    supabase.table("loans").insert(loan_data).execute()
-                    
-                    # ปิดปุ่มทั้งหมด
-                    for child in self.children:
-                        child.disabled = True
-                    await approve_interaction.message.edit(view=self)
-                    
-                    # แจ้งเตือนผู้กู้
-                    user = await bot.fetch_user(int(user_id))
-                    try:
-                        await user.send(f"🎉 คำขอกู้ของคุณได้รับการอนุมัติแล้ว จำนวน {amount} เครดิต")
-                    except:
-                        pass
-                    
-                    # แจ้งเตือนแอดมินคนอื่นๆ
-                    for admin_id in ADMIN_USER_IDS:
-                        if admin_id != str(approve_interaction.user.id):  # ไม่ส่งให้แอดมินที่อนุมัติ
-                            admin = await bot.fetch_user(int(admin_id))
-                            try:
-                                await admin.send(f"💰 <@{user_id}> ได้รับอนุมัติเงินกู้ {amount} เครดิต จาก <@{approve_interaction.user.id}>")
-                            except:
-                                continue
-                    
-                    await approve_interaction.response.send_message(f"✅ อนุมัติเงินกู้ให้ <@{user_id}> จำนวน {amount} เครดิตเรียบร้อยแล้ว")
-                    await button_interaction.message.reply(f"🎉 <@{user_id}> ได้รับอนุมัติเงินกู้ {amount} เครดิต โดย <@{approve_interaction.user.id}>")
-
-                @discord.ui.button(label="ปฏิเสธ", style=discord.ButtonStyle.danger)
-                async def reject_button(self, reject_interaction: discord.Interaction, button: discord.ui.Button):
-                    if not is_admin(reject_interaction):
-                        await reject_interaction.response.send_message("คุณไม่มีสิทธิ์ปฏิเสธ", ephemeral=True)
-                        return
-                    
-                    # ปิดปุ่มทั้งหมด
-                    for child in self.children:
-                        child.disabled = True
-                    await reject_interaction.message.edit(view=self)
-                    
-                    # แจ้งเตือนผู้กู้
-                    user = await bot.fetch_user(int(user_id))
-                    try:
-                        await user.send(f"❌ คำขอกู้ของคุณถูกปฏิเสธ จำนวน {amount} เครดิต")
-                    except:
-                        pass
-                    
-                    await reject_interaction.response.send_message(f"❌ ปฏิเสธคำขอกู้ของ <@{user_id}>")
-                    await button_interaction.message.reply(f"❌ คำขอกู้ของ <@{user_id}> ถูกปฏิเสธโดย <@{reject_interaction.user.id}>")
-            
-            # ส่งคำขอกู้ให้แอดมินอนุมัติ
-            await button_interaction.response.send_message(
-                f"📝 คำขอกู้จาก <@{user_id}>\n"
-                f"จำนวน: {amount} เครดิต",
-                view=ApprovalView()
-            )
-
-    view = discord.ui.View()
-    view.add_item(LoanButton())
+    view = persistent_view(LoanRequestButton(amount))
     await interaction.response.send_message(f"ปล่อยกู้ด่วน! {amount} เครดิต คนแรกที่กดจะได้สิทธิ์ทันที!", view=view)
 
 @bot.tree.command(name="ธุรกรรม", description="[Admin] ดูประวัติธุรกรรมทั้งหมด")
@@ -317,15 +578,107 @@ async def view_transactions(interaction: discord.Interaction):
         await interaction.response.send_message("คุณไม่มีสิทธิ์ใช้คำสั่งนี้", ephemeral=True)
         return
 
-    response = supabase.table("loans").select("*").execute()
-    if response.data:
-        msg = "**💳 ประวัติธุรกรรมทั้งหมด:**\n"
-        for loan in response.data:
-            interest = calculate_interest(loan) if loan['status'] == 'pending' else 0
-            msg += f"- <@{loan['user_id']}> : {loan['amount']} เครดิต | ดอกเบี้ย {interest} | สถานะ: {loan['status']}\n"
+    def render(rows):
+        return [
+            f"- <@{loan['user_id']}> : {loan['amount']} เครดิต | ดอกเบี้ย {interest} | สถานะ: {loan['status']}"
+            for loan, principal, interest, total, _ in compute_batch(rows)
+        ]
+
+    view = LedgerPageView(
+        loan_repo.page, render,
+        header="**💳 ประวัติธุรกรรมทั้งหมด:**",
+        empty_text="ไม่มีประวัติธุรกรรม",
+        owner_id=interaction.user.id,
+    )
+    await send_paged(interaction, view)
+
+# ส่งออกเป็นไฟล์แนบ: ดึงทีละหน้าและเขียนลงไฟล์ชั่วคราวทีละหน้า ไม่โหลดทั้งตาราง
+def parse_date(value):
+    """'YYYY-MM-DD' -> เที่ยงคืน UTC ของวันนั้น (None ถ้าไม่ใส่) — รูปแบบผิด raise ValueError"""
+    if not value:
+        return None
+    return datetime.datetime.strptime(value.strip(), "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+
+@bot.tree.command(name="ส่งออก", description="[Admin] ส่งออกธุรกรรมเป็นไฟล์ CSV/JSONL")
+@app_commands.describe(
+    table="ตารางที่จะส่งออก",
+    fmt="รูปแบบไฟล์",
+    status="กรองสถานะ (เฉพาะรายการกู้/โอน)",
+    user="กรองเฉพาะผู้ใช้คนนี้",
+    since="ตั้งแต่วันที่ (YYYY-MM-DD)",
+    until="ถึงวันที่ (YYYY-MM-DD รวมวันนั้นด้วย)",
+    compress="บีบอัดเป็น .gz",
+)
+@app_commands.choices(
+    table=[
+        app_commands.Choice(name="รายการกู้/โอน (loans)", value="loans"),
+        app_commands.Choice(name="การชำระ/โอน (payments)", value="payments"),
+    ],
+    fmt=[app_commands.Choice(name="CSV", value="csv"), app_commands.Choice(name="JSONL", value="jsonl")],
+    status=[
+        app_commands.Choice(name="ค้างชำระ (pending)", value="pending"),
+        app_commands.Choice(name="ชำระแล้ว (completed)", value="completed"),
+        app_commands.Choice(name="ล้างหนี้ (cleared)", value="cleared"),
+    ],
+)
+async def export_ledger(
+    interaction: discord.Interaction,
+    table: str = "loans",
+    fmt: str = "csv",
+    status: str | None = None,
+    user: discord.User | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    compress: bool = False,
+):
+    if not is_admin(interaction):
+        await interaction.response.send_message("คุณไม่มีสิทธิ์ใช้คำสั่งนี้", ephemeral=True)
+        return
+    try:
+        start, end = parse_date(since), parse_date(until)
+    except ValueError:
+        await interaction.response.send_message("❌ วันที่ต้องอยู่ในรูปแบบ YYYY-MM-DD", ephemeral=True)
+        return
+    filters = {
+        "user_id": str(user.id) if user else None,
+        "since": start.isoformat() if start else None,
+        "until": (end + datetime.timedelta(days=1)).isoformat() if end else None,
+    }
+
+    await interaction.response.defer(thinking=True)
+    if table == "payments":
+        columns = PAYMENT_COLUMNS
+        pages = iter_pages(functools.partial(loan_repo.page_payments, **filters), payment_cursor_of)
     else:
-        msg = "ไม่มีประวัติธุรกรรม"
-    await interaction.response.send_message(msg)
+        columns = LOAN_COLUMNS
+
+        async def loan_pages():
+            fetch_page = functools.partial(loan_repo.page, status=status, **filters)
+            async for rows in iter_pages(fetch_page, cursor_of):
+                yield [{**loan, "interest_due": interest} for loan, _, interest, _, _ in compute_batch(rows)]
+
+        pages = loan_pages()
+
+    try:
+        file, count, size = await write_export(pages, columns, fmt=fmt, compress=compress)
+    except Exception as e:
+        # ไม่ตอบเลย interaction จะค้างที่ "กำลังคิด..." ตลอดไป
+        print(f"Export {table} failed: {e}")
+        await interaction.followup.send(f"❌ ส่งออก {table} ไม่สำเร็จ: {e}", ephemeral=True)
+        return
+    with file:
+        limit = interaction.guild.filesize_limit if interaction.guild else discord.utils.DEFAULT_FILE_SIZE_LIMIT_BYTES
+        if size > limit:
+            await interaction.followup.send(
+                f"❌ ไฟล์ขนาด {size / 1024 / 1024:.1f} MB ({count:,} แถว) เกินขีดจำกัดของเซิร์ฟเวอร์ "
+                f"ลองเปิด compress หรือกรองช่วงวันที่ให้แคบลง"
+            )
+            return
+        name = filename(table, fmt, compress=compress, suffix=discord.utils.utcnow().strftime("_%Y%m%d_%H%M"))
+        await interaction.followup.send(
+            f"📦 ส่งออก {table} {count:,} แถว ({size / 1024:,.0f} KB)",
+            file=discord.File(file, filename=name),
+        )
 
 @bot.tree.command(name="ประกาศปล่อยกู้", description="[Admin] ประกาศปล่อยกู้พร้อมปุ่มให้กด")
 async def announce_loan(interaction: discord.Interaction, amount: int):
@@ -333,46 +686,7 @@ async def announce_loan(interaction: discord.Interaction, amount: int):
         await interaction.response.send_message("คุณไม่มีสิทธิ์ใช้คำสั่งนี้", ephemeral=True)
         return
 
-    # เพิ่มการเช็คว่ามีประกาศที่ยังไม่มีคนกดอยู่หรือไม่
-    class LoanButton(discord.ui.Button):
-        def __init__(self):
-            super().__init__(label="ขอกู้เงิน", style=discord.ButtonStyle.green, custom_id=f"loan_{datetime.datetime.now().timestamp()}")
-            
-        async def callback(self, button_interaction):
-            if self.disabled:
-                await button_interaction.response.send_message("ขออภัย มีผู้รับสิทธิ์นี้ไปแล้ว", ephemeral=True)
-                return
-
-            user_id = str(button_interaction.user.id)
-            
-            existing_loans = supabase.table("loans").select("*").eq("user_id", user_id).eq("status", "pending").execute()
-            if existing_loans.data:
-                await button_interaction.response.send_message("คุณมีหนี้ค้างอยู่ ไม่สามารถกู้เพิ่มได้", ephemeral=True)
-                return
-                
-            loan_data = {
-                "user_id": user_id,
-                "amount": amount,
-                "status": "pending",
-                "created_at": datetime.datetime.now().isoformat()
-            }
-            supabase.table("loans").insert(loan_data).execute()
-            
-            # ปิดปุ่มและอัพเดทข้อความ
-            self.disabled = True
-            await button_interaction.message.edit(content=f"📢 ประกาศปล่อยกู้ {amount} เครดิต!\n✅ <@{user_id}> ได้รับสิทธิ์ไปแล้ว!", view=self.view)
-            
-            # แจ้งเตือนผู้กู้และแอดมิน
-            await button_interaction.response.send_message(f"🎉 คุณได้รับอนุมัติเงินกู้ {amount} เครดิต!", ephemeral=True)
-            for admin_id in ADMIN_USER_IDS:
-                admin = await bot.fetch_user(int(admin_id))
-                try:
-                    await admin.send(f"💰 <@{user_id}> ได้กู้เงิน {amount} เครดิต")
-                except:
-                    pass
-
-    view = discord.ui.View(timeout=None)  # ไม่ให้ปุ่มหมดอายุ
-    view.add_item(LoanButton())
+    view = persistent_view(AnnouncementButton(str(interaction.id), amount))
     await interaction.response.send_message(f"📢 **ประกาศ!** ปล่อยกู้ {amount} เครดิต!\nคนแรกที่กดจะได้รับสิทธิ์ทันที!", view=view)
 
 # คำสั่งล้างหนี้
@@ -393,10 +707,10 @@ async def clear_debt(interaction: discord.Interaction, user_id: str):
         user = await bot.fetch_user(int(user_id))
 
         # ล้างหนี้โดยการอัพเดทสถานะเป็น completed
-        response = supabase.table("loans").update({"status": "cleared"}).eq("user_id", user_id).eq("status", "pending").execute()
+        cleared = await loan_repo.mark_status(user_id, "cleared")
         
-        if response.data:
-            cleared_amount = sum([loan['amount'] for loan in response.data])
+        if cleared:
+            cleared_amount = sum([loan['amount'] for loan in cleared])
             await interaction.response.send_message(f"✨ ล้างหนี้ให้ <@{user_id}> เรียบร้อยแล้ว จำนวน {cleared_amount} เครดิต")
         else:
             await interaction.response.send_message(f"❌ ไม่พบหนี้ค้างชำระของ <@{user_id}>")
@@ -412,104 +726,127 @@ async def transfer_credit(interaction: discord.Interaction, user: discord.Member
         await interaction.response.send_message("คุณไม่มีสิทธิ์ใช้คำสั่งนี้", ephemeral=True)
         return
 
-    # เช็คว่าผู้ใช้มีหนี้ค้างหรือไม่
-    existing_loans = supabase.table("loans").select("*").eq("user_id", str(user.id)).eq("status", "pending").execute()
-    if existing_loans.data:
+    # บันทึกรายการโอน (completed เลยเพราะไม่ใช่การกู้) + payments ในครั้งเดียว
+    # ผู้ใช้ที่มีหนี้ค้างรับโอนไม่ได้ (เช็คในฐานข้อมูลด้วย)
+    result = await loan_repo.record_transfer(str(user.id), amount)
+    if result["status"] == "has_debt":
         await interaction.response.send_message(f"❌ <@{user.id}> มีหนี้ค้างอยู่ ไม่สามารถรับเครดิตเพิ่มได้", ephemeral=True)
         return
 
-    # สร้างรายการโอนเครดิต
-    loan_data = {
-        "user_id": str(user.id),
-        "amount": amount,
-        "status": "completed",  # ให้เป็น completed เลยเพราะเป็นการโอนให้เลย ไม่ใช่การกู้
-        "created_at": datetime.datetime.now().isoformat()
-    }
-    supabase.table("loans").insert(loan_data).execute()
-    
     await interaction.response.send_message(f"✅ โอนเครดิตให้ <@{user.id}> จำนวน {amount} เครดิตเรียบร้อยแล้ว")
-    try:
-        await user.send(f"🎁 คุณได้รับเครดิตจำนวน {amount} เครดิต!")
-    except:
-        pass
+    await notifier.send(user.id, f"🎁 คุณได้รับเครดิตจำนวน {amount} เครดิต!")
+
+# คำสั่งแอดมินแบบหลายคน: รับ mention / ID หลายคน หรือ role แล้วทำทั้งหมดในการเรียกฐานข้อมูลครั้งเดียว
+USER_ID_PATTERN = re.compile(r"(?<![&\d])\d{15,20}(?!\d)")  # ไม่รวม mention ของ role (<@&id>)
+
+def collect_user_ids(users: str | None, role: discord.Role | None) -> list[str]:
+    user_ids = USER_ID_PATTERN.findall(users or "")
+    if role is not None:
+        user_ids.extend(str(member.id) for member in role.members if not member.bot)
+    return list(dict.fromkeys(user_ids))
+
+def mention_list(user_ids, limit=30):
+    text = " ".join(f"<@{user_id}>" for user_id in user_ids[:limit])
+    if len(user_ids) > limit:
+        text += f" และอีก {len(user_ids) - limit} คน"
+    return text
+
+async def check_bulk_targets(interaction: discord.Interaction, user_ids, role: discord.Role | None) -> bool:
+    if user_ids:
+        return True
+    msg = "❌ ไม่พบผู้ใช้ กรุณาใส่ mention / ID หรือเลือก role"
+    if role is not None and not intents.members:
+        msg += " (การใช้ role ต้องตั้ง MEMBERS_INTENT=1 และเปิด Server Members Intent)"
+    await interaction.response.send_message(msg, ephemeral=True)
+    return False
+
+async def send_summary(interaction: discord.Interaction, lines):
+    for chunk in chunk_lines(lines):
+        await interaction.followup.send(chunk)
+
+@bot.tree.command(name="ล้างหนี้หลายคน", description="[Admin] ล้างหนี้ให้ผู้ใช้หลายคนพร้อมกัน")
+@app_commands.describe(users="mention หรือ ID ของผู้ใช้ (คั่นด้วยช่องว่าง)", role="ล้างหนี้ให้ทุกคนใน role นี้")
+async def clear_debt_bulk(interaction: discord.Interaction, users: str | None = None, role: discord.Role | None = None):
+    if not is_admin(interaction):
+        await interaction.response.send_message("คุณไม่มีสิทธิ์ใช้คำสั่งนี้", ephemeral=True)
+        return
+    user_ids = collect_user_ids(users, role)
+    if not await check_bulk_targets(interaction, user_ids, role):
+        return
 
-# ปุ่มขอชำระหนี้
-class RepaymentView(discord.ui.View):
-    def __init__(self):
-        super().__init__()
-        
-    @discord.ui.button(label="ขอชำระหนี้", style=discord.ButtonStyle.primary)
-    async def repay_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        user_id = str(interaction.user.id)
-        
-        loans = supabase.table("loans").select("*").eq("user_id", user_id).eq("status", "pending").execute()
-        if not loans.data:
-            await interaction.response.send_message("คุณไม่มีหนี้ค้างชำระ", ephemeral=True)
-            return
-            
-        class ApprovalView(discord.ui.View):
-            def __init__(self):
-                super().__init__()
-                
-            @discord.ui.button(label="อนุมัติชำระหนี้", style=discord.ButtonStyle.success)
-            async def approve_button(self, button_interaction: discord.Interaction, button: discord.ui.Button):
-                if not is_admin(button_interaction):
-                    await button_interaction.response.send_message("คุณไม่มีสิทธิ์อนุมัติ", ephemeral=True)
-                    return
-                    
-                supabase.table("loans").update({"status": "completed"}).eq("user_id", user_id).eq("status", "pending").execute()
-                
-                await button_interaction.message.edit(content=f"✅ อนุมัติการชำระหนี้ของ <@{user_id}> แล้ว", view=None)
-                await interaction.channel.send(f"🎉 <@{user_id}> ได้ชำระหนี้เรียบร้อยแล้ว!")
-        
-        loan = loans.data[0]
-        interest = calculate_interest(loan)
-        total = loan['amount'] + interest
-        
-        await interaction.response.send_message(
-            f"📝 คำขอชำระหนี้จาก <@{user_id}>\n"
-            f"ยอดหนี้: {loan['amount']} เครดิต\n"
-            f"ดอกเบี้ย: {interest} เครดิต\n"
-            f"รวม: {total} เครดิต",
-            view=ApprovalView()
-        )
+    await interaction.response.defer(thinking=True)
+    cleared = await loan_repo.clear_debts(user_ids)
+    per_user = {}
+    for loan, principal, *_ in compute_batch(cleared):
+        per_user[loan['user_id']] = per_user.get(loan['user_id'], 0) + principal
+    no_debt = [user_id for user_id in user_ids if user_id not in per_user]
+
+    lines = [f"✨ ล้างหนี้ให้ {len(per_user)} คน รวม {sum(per_user.values()):,} เครดิต"]
+    if per_user:
+        lines.append(mention_list(list(per_user)))
+    if no_debt:
+        lines.append(f"ไม่มีหนี้ค้าง {len(no_debt)} คน: {mention_list(no_debt)}")
+    await send_summary(interaction, lines)
+    await asyncio.gather(*(
+        notifier.send(user_id, f"✨ หนี้ของคุณจำนวน {amount:,} เครดิตถูกล้างโดยแอดมินแล้ว")
+        for user_id, amount in per_user.items()
+    ))
+
+@bot.tree.command(name="โอนเครดิตหลายคน", description="[Admin] โอนเครดิตเท่ากันให้ผู้ใช้หลายคนพร้อมกัน")
+@app_commands.describe(amount="จำนวนเครดิตต่อคน", users="mention หรือ ID ของผู้ใช้ (คั่นด้วยช่องว่าง)", role="โอนให้ทุกคนใน role นี้")
+async def transfer_credit_bulk(interaction: discord.Interaction, amount: int, users: str | None = None, role: discord.Role | None = None):
+    if not is_admin(interaction):
+        await interaction.response.send_message("คุณไม่มีสิทธิ์ใช้คำสั่งนี้", ephemeral=True)
+        return
+    user_ids = collect_user_ids(users, role)
+    if not await check_bulk_targets(interaction, user_ids, role):
+        return
 
-# คำสั่งขอชำระหนี้
-@bot.tree.command(name="ขอชำระหนี้", description="สร้างคำขอชำระหนี้")
-async def request_repayment(interaction: discord.Interaction):
+    await interaction.response.defer(thinking=True)
+    result = await loan_repo.record_transfers(user_ids, amount)
+    recipients = [loan['user_id'] for loan in result["loans"]]
+
+    lines = [f"✅ โอนเครดิตให้ {len(recipients)} คน คนละ {amount:,} เครดิต (รวม {amount * len(recipients):,} เครดิต)"]
+    if recipients:
+        lines.append(mention_list(recipients))
+    if result["has_debt"]:
+        lines.append(f"❌ ข้าม {len(result['has_debt'])} คนที่มีหนี้ค้าง: {mention_list(result['has_debt'])}")
+    await send_summary(interaction, lines)
+    await notifier.send_many(recipients, f"🎁 คุณได้รับเครดิตจำนวน {amount} เครดิต!")
+
+# คำขอชำระหนี้ (ใช้ทั้งคำสั่ง /ขอชำระหนี้ และปุ่มขอชำระหนี้)
+# amount None = ชำระทั้งหมด, น้อยกว่ายอดรวม = ชำระบางส่วน (ตัดดอกเบี้ยก่อนเงินต้น)
+async def send_repayment_request(interaction: discord.Interaction, amount: int | None = None):
     user_id = str(interaction.user.id)
-    
-    loans = supabase.table("loans").select("*").eq("user_id", user_id).eq("status", "pending").execute()
-    if not loans.data:
+
+    balance = await loan_repo.get_balance(user_id)
+    if not balance['pending_count']:
         await interaction.response.send_message("คุณไม่มีหนี้ค้างชำระ", ephemeral=True)
         return
-        
-    loan = loans.data[0]
-    interest = calculate_interest(loan)
-    total = loan['amount'] + interest
-    
-    class ApprovalView(discord.ui.View):
-        def __init__(self):
-            super().__init__(timeout=None)  # ไม่ให้ปุ่มหมดอายุ
-            
-        @discord.ui.button(label="อนุมัติชำระหนี้", style=discord.ButtonStyle.success)
-        async def approve_button(self, button_interaction: discord.Interaction, button: discord.ui.Button):
-            if not is_admin(button_interaction):
-                await button_interaction.response.send_message("คุณไม่มีสิทธิ์อนุมัติ", ephemeral=True)
-                return
-                
-            supabase.table("loans").update({"status": "completed"}).eq("user_id", user_id).eq("status", "pending").execute()
-            
-            await button_interaction.message.edit(content=f"✅ อนุมัติการชำระหนี้ของ <@{user_id}> แล้ว", view=None)
-            await interaction.channel.send(f"🎉 <@{user_id}> ได้ชำระหนี้เรียบร้อยแล้ว!")
-    
-    await interaction.response.send_message(
+    if amount is not None and amount <= 0:
+        await interaction.response.send_message("จำนวนที่ชำระต้องมากกว่า 0", ephemeral=True)
+        return
+
+    principal, interest = amount_due(await loan_repo.get_pending_for_user(user_id))
+    total = principal + interest
+    if amount is not None and amount >= total:
+        amount = None
+
+    msg = (
         f"📝 คำขอชำระหนี้จาก <@{user_id}>\n"
-        f"ยอดหนี้: {loan['amount']} เครดิต\n"
+        f"ยอดหนี้: {principal} เครดิต\n"
         f"ดอกเบี้ย: {interest} เครดิต\n"
-        f"รวม: {total} เครดิต",
-        view=ApprovalView()
+        f"รวม: {total} เครดิต"
     )
+    if amount is not None:
+        msg += f"\nขอชำระบางส่วน: {amount} เครดิต (คงเหลือประมาณ {total - amount} เครดิต)"
+    await interaction.response.send_message(msg, view=persistent_view(RepayApprovalButton(user_id, amount)))
+
+# คำสั่งขอชำระหนี้
+@bot.tree.command(name="ขอชำระหนี้", description="สร้างคำขอชำระหนี้")
+@app_commands.describe(amount="จำนวนที่จะชำระ (ไม่ใส่ = ชำระทั้งหมด)")
+async def request_repayment(interaction: discord.Interaction, amount: int | None = None):
+    await send_repayment_request(interaction, amount)
 
 # คำสั่งช่วยเหลือ
 @bot.tree.command(name="ช่วยเหลือ", description="แสดงคำอธิบายวิธีใช้คำสั่งต่างๆ")
@@ -520,55 +857,62 @@ async def help_command(interaction: discord.Interaction):
 **คำสั่งทั่วไป:**
 `/ยอดค้าง` - เช็คยอดหนี้ค้างชำระของทุกคน
 `/ประวัติ` - ดูประวัติการกู้ยืมของตัวเอง
-`/ขอชำระหนี้` - สร้างคำขอชำระหนี้
+`/ขอชำระหนี้ [จำนวน]` - สร้างคำขอชำระหนี้ (ไม่ใส่จำนวน = ชำระทั้งหมด)
+`/ai [ข้อความ] [style]` - คุยกับ AI (เลือกสไตล์การตอบได้)
 
 **คำสั่งสำหรับแอดมิน:**
 `/ปล่อยกู้ [จำนวน]` - สร้างปุ่มให้ผู้ใช้กดขอกู้
 `/ประกาศปล่อยกู้ [จำนวน]` - ประกาศปล่อยกู้พร้อมปุ่มให้กด
 `/ล้างหนี้ [user_id]` - ล้างหนี้ให้ผู้ใช้
 `/โอนเครดิต [@user] [จำนวน]` - โอนเครดิตให้ผู้ใช้
+`/ล้างหนี้หลายคน [users] [role]` - ล้างหนี้ให้หลายคนพร้อมกัน
+`/โอนเครดิตหลายคน [จำนวน] [users] [role]` - โอนเครดิตให้หลายคนพร้อมกัน
 `/ธุรกรรม` - ดูประวัติธุรกรรมทั้งหมด
+`/ส่งออก` - ส่งออกธุรกรรม/การชำระเป็นไฟล์ CSV หรือ JSONL (กรองวันที่/สถานะ/ผู้ใช้ได้)
 `/สถิติ` - ดูสถิติการกู้ยืมทั้งหมด
+`/ซิงค์แจ้งเตือน` - โหลดกำหนดเวลาแจ้งเตือนดอกเบี้ยใหม่จากฐานข้อมูล
+`/ประสิทธิภาพ` - ดูเวลาตอบสนองของคำสั่ง (p50/p95/p99)
+`/ล้างแคชai` - ล้างแคชคำตอบของ AI
 
 **หมายเหตุ:**
 • ดอกเบี้ย 10% ต่อชั่วโมงแบบทบต้น
 • สถานะ "completed" = ชำระแล้ว, "cleared" = ยกเลิกหนี้
 • ไม่สามารถกู้ซ้ำได้ถ้ายังมีหนี้ค้างชำระ
+• ชำระบางส่วนได้ ระบบตัดดอกเบี้ยก่อนแล้วค่อยตัดเงินต้น
 """
     await interaction.response.send_message(help_text)
 
-# คำสั่งดูสถิติ
+# คำสั่งดูสถิติ (ข้อความเดียวต้องไม่เกิน 2000 ตัวอักษร จึงจำกัดจำนวนผู้กู้ดอกเบี้ยสูงที่แสดง)
+STATS_HIGH_INTEREST_LIMIT = 10
+
 @bot.tree.command(name="สถิติ", description="[Admin] ดูสถิติการกู้ยืมทั้งหมด")
 async def view_stats(interaction: discord.Interaction):
     if not is_admin(interaction):
         await interaction.response.send_message("คุณไม่มีสิทธิ์ใช้คำสั่งนี้", ephemeral=True)
         return
 
-    all_loans = supabase.table("loans").select("*").execute()
-    if not all_loans.data:
+    totals = await loan_repo.aggregates()
+    if not totals["total_count"]:
         await interaction.response.send_message("ยังไม่มีข้อมูลธุรกรรม")
         return
 
     # สถิติทั่วไป
-    total_loans = len(all_loans.data)
-    total_amount = sum(loan['amount'] for loan in all_loans.data)
-    pending_loans = len([loan for loan in all_loans.data if loan['status'] == 'pending'])
-    pending_amount = sum(loan['amount'] for loan in all_loans.data if loan['status'] == 'pending')
+    total_loans = totals["total_count"]
+    total_amount = totals["total_amount"]
+    pending_loans = totals["pending_count"]
+    pending_amount = totals["pending_amount"]
     
     # ดอกเบี้ยรวมปัจจุบัน
-    total_current_interest = sum(calculate_interest(loan) for loan in all_loans.data if loan['status'] == 'pending')
+    total_current_interest = totals["pending_interest"]
     
-    # หาผู้กู้ที่มีดอกเบี้ยสูง (มากกว่าเงินต้น)
-    high_interest_loans = []
-    for loan in all_loans.data:
-        if loan['status'] == 'pending':
-            interest = calculate_interest(loan)
-            if interest > loan['amount']:
-                high_interest_loans.append({
-                    'user_id': loan['user_id'],
-                    'amount': loan['amount'],
-                    'interest': interest
-                })
+    # หาผู้กู้ที่มีดอกเบี้ยสูง (มากกว่าเงินต้น) แสดงเฉพาะดอกเบี้ยสูงสุด STATS_HIGH_INTEREST_LIMIT รายการ
+    high_interest_rows = compute_batch(totals["high_interest"]).high_interest()
+    high_interest_loans = [
+        {'user_id': loan['user_id'], 'amount': principal, 'interest': interest}
+        for loan, principal, interest, _, _ in heapq.nlargest(
+            STATS_HIGH_INTEREST_LIMIT, high_interest_rows, key=lambda row: row[2],
+        )
+    ]
 
     # สร้างข้อความ
     stats = f"""**📊 สถิติการกู้ยืม:**
@@ -582,63 +926,150 @@ async def view_stats(interaction: discord.Interaction):
 • มูลค่าหนี้ค้างรวม: {pending_amount:,} เครดิต
 • ดอกเบี้ยค้างรวม: {total_current_interest:,} เครดิต
 """
+    cache = loan_repo.stats()
+    stats += f"• แคชหนี้ค้าง: hit {cache['hits']:,} / miss {cache['misses']:,} ({cache['loans']:,} รายการ)\n"
+    dm = notifier.stats()
+    stats += f"• DM: ส่งแล้ว {dm['sent']:,} / ล้มเหลว {dm['failed']:,}\n"
+    ai = ai_cache.stats()
+    queue = ai_queue.stats()
+    stats += f"• คิว AI: กำลังตอบ {queue['active']} / รอ {queue['queued']} / ปฏิเสธ {queue['rejected']:,} / หมดเวลา {queue['expired']:,}\n"
+    stats += f"• แคช AI: hit {ai['hits']:,} / รวมคำขอ {ai['coalesced']:,} / miss {ai['misses']:,} ({ai['hit_rate']:.0%})\n"
 
     if high_interest_loans:
         stats += "\n**⚠️ ผู้กู้ที่มีดอกเบี้ยสูง:**\n"
         for loan in high_interest_loans:
             stats += f"• <@{loan['user_id']}> : {loan['amount']:,} เครดิต (ดอกเบี้ย {loan['interest']:,} เครดิต)\n"
+        # แคชคืนเฉพาะหัวแถว จำนวนทั้งหมดอยู่ใน high_interest_count
+        hidden = totals.get("high_interest_count", len(high_interest_rows)) - len(high_interest_loans)
+        if hidden:
+            stats += f"…และอีก {hidden:,} รายการ (ดูทั้งหมดด้วย /ส่งออก status:pending)\n"
+
+    await interaction.response.send_message(stats[:DISCORD_LIMIT])
+
+# ฟังก์ชันแจ้งเตือนดอกเบี้ยสูง (เรียกโดย alert_scheduler เมื่อดอกเบี้ยเกินเงินต้น × tier)
+async def send_high_interest_alert(loan, tier):
+    # ยืนยันกับแคชอีกครั้งว่ายังค้างอยู่ เผื่อถูกปิดจากนอกบอท
+    pending = await loan_repo.get_pending_for_user(loan['user_id'])
+    current = [row for row in pending if row['id'] == loan['id']]
+    if not current:
+        alert_scheduler.remove(loan['id'])
+        return False
+    batch = compute_batch(current)
+    loan, principal, interest = batch.loans[0], batch.principal[0], batch.interest[0]
+    level = "เกินเงินต้นแล้ว" if tier == 1 else f"เกินเงินต้น {tier} เท่าแล้ว"
+
+    # แจ้งเตือนผู้กู้
+    await notifier.send(
+        loan['user_id'],
+        f"⚠️ **คำเตือน:** ดอกเบี้ยของคุณสูง{level}!\n"
+        f"เงินต้น: {principal:,} เครดิต\n"
+        f"ดอกเบี้ย: {interest:,} เครดิต\n"
+        f"กรุณาชำระโดยเร็วที่สุด!"
+    )
+    # แจ้งเตือนแอดมิน (รวมหลายรายการที่ถึงเวลาพร้อมกันเป็นข้อความเดียว)
+    for admin_id in ADMIN_USER_IDS:
+        notifier.queue_digest(
+            admin_id,
+            f"• <@{loan['user_id']}> ดอกเบี้ย{level} | เงินต้น: {principal:,} เครดิต | ดอกเบี้ย: {interest:,} เครดิต",
+            header="⚠️ **แจ้งเตือน:** ผู้กู้ที่มีดอกเบี้ยสูงเกินเงินต้น",
+        )
+    return True
 
-    await interaction.response.send_message(stats)
+# ตั้งเวลาแจ้งเตือนตามเวลาที่ดอกเบี้ยจะเกินเงินต้น × tier (ALERT_TIERS เช่น "1,2,5")
+# แจ้งครั้งเดียวต่อ tier และจำไว้ในตาราง loan_alerts แม้บอทจะรีสตาร์ท
+ALERT_TIERS = [int(tier) for tier in os.getenv("ALERT_TIERS", "1,2,5").split(",") if tier.strip()]
+alert_scheduler = AlertScheduler(loan_repo, send_high_interest_alert, tiers=ALERT_TIERS)
+
+# เลือกโปรเซสเดียวให้แจ้งเตือน (LEADER_TTL = วินาทีที่โปรเซสอื่นรอรับช่วงต่อถ้า leader ตาย)
+# โหมดหลายโปรเซสโหลดกำหนดเวลาใหม่ทุก ALERT_RESYNC_INTERVAL วินาที เพื่อเห็นหนี้ที่โปรเซสอื่นสร้าง
+alert_leader = LeaderElection(shared_state, "interest-alerts", ttl=float(os.getenv("LEADER_TTL", "30")))
+ALERT_RESYNC_INTERVAL = float(os.getenv("ALERT_RESYNC_INTERVAL", "0" if SHARED_STATE == "memory" else "60")) or None
+
+def feed_alert_scheduler(event, user_id, rows):
+    # เฉพาะ leader ที่รัน alert_scheduler.run() — โปรเซสอื่นไม่ต้องเก็บกำหนดเวลา (ได้เป็น leader แล้วค่อย resync)
+    if alert_leader.is_leader:
+        alert_scheduler.on_loan_event(event, user_id, rows)
+
+loan_repo.add_listener(feed_alert_scheduler)
 
-# ฟังก์ชันเช็คและแจ้งเตือนดอกเบี้ยสูง
 async def check_high_interest():
-    while True:
-        try:
-            # ดึงข้อมูลหนี้ค้างทั้งหมด
-            response = supabase.table("loans").select("*").eq("status", "pending").execute()
-            if response.data:
-                for loan in response.data:
-                    interest = calculate_interest(loan)
-                    # ถ้าดอกเบี้ยสูงกว่าเงินต้น
-                    if interest > loan['amount']:
-                        try:
-                            user = await bot.fetch_user(int(loan['user_id']))
-                            # แจ้งเตือนผู้กู้
-                            await user.send(
-                                f"⚠️ **คำเตือน:** ดอกเบี้ยของคุณสูงเกินเงินต้นแล้ว!\n"
-                                f"เงินต้น: {loan['amount']:,} เครดิต\n"
-                                f"ดอกเบี้ย: {interest:,} เครดิต\n"
-                                f"กรุณาชำระโดยเร็วที่สุด!"
-                            )
-                            # แจ้งเตือนแอดมิน
-                            for admin_id in ADMIN_USER_IDS:
-                                try:
-                                    admin = await bot.fetch_user(int(admin_id))
-                                    await admin.send(
-                                        f"⚠️ **แจ้งเตือน:** <@{loan['user_id']}> มีดอกเบี้ยสูงเกินเงินต้น\n"
-                                        f"เงินต้น: {loan['amount']:,} เครดิต\n"
-                                        f"ดอกเบี้ย: {interest:,} เครดิต"
-                                    )
-                                except:
-                                    continue
-                        except:
-                            continue
-            # เช็คทุก 1 ชั่วโมง
-            await asyncio.sleep(3600)
-        except Exception as e:
-            print(f"Error in interest check: {e}")
-            await asyncio.sleep(3600)
-
-# เริ่มฟังก์ชันเช็คดอกเบี้ยสูงทันทีที่บอทออนไลน์
+    await alert_scheduler.run(resync_interval=ALERT_RESYNC_INTERVAL)
+
+@bot.tree.command(name="ซิงค์แจ้งเตือน", description="[Admin] โหลดกำหนดเวลาแจ้งเตือนดอกเบี้ยใหม่จากฐานข้อมูล")
+async def resync_alerts(interaction: discord.Interaction):
+    if not is_admin(interaction):
+        await interaction.response.send_message("คุณไม่มีสิทธิ์ใช้คำสั่งนี้", ephemeral=True)
+        return
+
+    if not alert_leader.is_leader:
+        await interaction.response.send_message(
+            "โปรเซสนี้ไม่ได้รันการแจ้งเตือน (leader จะโหลดใหม่เองตาม ALERT_RESYNC_INTERVAL)", ephemeral=True,
+        )
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    count = await alert_scheduler.resync()
+    next_at = alert_scheduler.next_deadline()
+    next_text = f"<t:{int(next_at.timestamp())}:R>" if next_at else "-"
+    await interaction.followup.send(f"🔄 โหลดใหม่แล้ว เฝ้าอยู่ {count} รายการ (แจ้งเตือนถัดไป {next_text})", ephemeral=True)
+
+@bot.tree.command(name="ล้างแคชai", description="[Admin] ล้างแคชคำตอบของ AI")
+async def flush_ai_cache(interaction: discord.Interaction):
+    if not is_admin(interaction):
+        await interaction.response.send_message("คุณไม่มีสิทธิ์ใช้คำสั่งนี้", ephemeral=True)
+        return
+
+    stats = ai_cache.stats()
+    count = ai_cache.flush()
+    await interaction.response.send_message(
+        f"🧹 ล้างแคช AI แล้ว {count} รายการ "
+        f"(hit {stats['hits']:,} / รวมคำขอ {stats['coalesced']:,} / miss {stats['misses']:,}, hit rate {stats['hit_rate']:.0%})",
+        ephemeral=True,
+    )
+
+# ตารางเวลาตอบสนอง (มิลลิวินาที) ของ histogram หนึ่งตัว เรียงจากช้าสุด
+def latency_table(title, name, label, limit=10):
+    rows = registry.summary(name)[:limit]
+    if not rows:
+        return []
+    lines = [f"{title:<28} {'n':>6} {'p50':>7} {'p95':>7} {'p99':>7}"]
+    for labels, count, p50, p95, p99 in rows:
+        key = label(labels)[:28]
+        lines.append(f"{key:<28} {count:>6} {format_ms(p50):>7} {format_ms(p95):>7} {format_ms(p99):>7}")
+    return lines + [""]
+
+@bot.tree.command(name="ประสิทธิภาพ", description="[Admin] ดูเวลาตอบสนองของคำสั่งและ dependency (p50/p95/p99)")
+@app_commands.describe(reset="ล้างค่าที่เก็บไว้หลังแสดงผล")
+async def view_performance(interaction: discord.Interaction, reset: bool = False):
+    if not is_admin(interaction):
+        await interaction.response.send_message("คุณไม่มีสิทธิ์ใช้คำสั่งนี้", ephemeral=True)
+        return
+
+    lines = [
+        *latency_table("time-to-ack (ms)", "interaction_ack_seconds", lambda l: l["name"]),
+        *latency_table("time-to-complete (ms)", "interaction_complete_seconds", lambda l: l["name"]),
+        *latency_table("dependency (ms)", "dependency_seconds", lambda l: f"{l['dependency']}.{l['op']}"),
+        *latency_table("AI first token (ms)", "ai_first_token_seconds", lambda l: "together"),
+        *latency_table("event loop lag (ms)", "event_loop_lag_seconds", lambda l: "loop"),
+    ]
+    tokens = {dict(labels).get("kind"): value for (name, labels), value in registry.counters.items() if name == "ai_tokens_total"}
+    if tokens:
+        lines.append(f"AI tokens: prompt {tokens.get('prompt', 0):,} / completion {tokens.get('completion', 0):,}")
+    if not lines:
+        lines = ["ยังไม่มีข้อมูล"]
+
+    if reset:
+        registry.reset()
+    # แต่ละก้อนอยู่ใน code block ของตัวเอง จึงเผื่อที่ให้ ``` ไว้
+    chunks = [f"```\n{chunk}\n```" for chunk in chunk_lines(lines, DISCORD_LIMIT - 8)]
+    await interaction.response.send_message("**⏱️ ประสิทธิภาพ**\n" + chunks[0], ephemeral=True)
+    for chunk in chunks[1:]:
+        await interaction.followup.send(chunk, ephemeral=True)
+
+# เมื่อบอทออนไลน์ (เรียกซ้ำทุกครั้งที่ reconnect — sync คำสั่งและ background task เริ่มใน setup_hook แล้ว)
 @bot.event
 async def on_ready():
     print(f"Logged in as {bot.user}")
-    try:
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} command(s)")
-        # เริ่ม background task
-        bot.loop.create_task(check_high_interest())
-    except Exception as e:
-        print(e)
 
-bot.run(DISCORD_TOKEN)
+if __name__ == "__main__":
+    bot.run(DISCORD_TOKEN)
@@ -0,0 +1,89 @@
+# claims.py
+# ตัดสินว่าใครได้สิทธิ์กู้จากประกาศ ("คนแรกที่กดได้สิทธิ์")
+# - ในโปรเซส: lock ต่อประกาศ ให้ถามฐานข้อมูลทีละคน และจำผู้ชนะไว้
+#   คนที่กดหลังจากมีผู้ชนะแล้วถูกปฏิเสธจากหน่วยความจำทันที ไม่ต้องแตะ Supabase
+# - ข้ามโปรเซส (โหมดหลาย shard): lock และผู้ชนะเก็บใน shared state ด้วย
+#   โปรเซสอื่นที่ได้กดปุ่มเดียวกันจึงรอคิวกันและรู้ผลโดยไม่ต้องถามฐานข้อมูลซ้ำ
+# - ในฐานข้อมูล: repo.claim_announcement ตัดสินแบบ atomic ใน round-trip เดียว
+#   (unique index ต่อประกาศ กันกรณี shared state หาย หรือบอทรีสตาร์ท)
+# run_once ใช้กลไกเดียวกันกับปุ่มที่ต้องทำงานครั้งเดียว (เช่นอนุมัติชำระหนี้ กดซ้ำแล้วต้องไม่ตัดเงินสองรอบ)
+
+import asyncio
+from collections import OrderedDict
+
+from metrics import registry
+from shared_state import MemoryState
+
+
+class AnnouncementClaims:
+    def __init__(self, repo, *, state=None, max_entries=1000, lock_ttl=10.0, winner_ttl=24 * 3600):
+        self.repo = repo
+        self.state = state or MemoryState()
+        self.max_entries = max_entries
+        self.lock_ttl = lock_ttl
+        self.winner_ttl = winner_ttl
+        self._winners = OrderedDict()   # announcement_id -> user_id ของผู้ได้สิทธิ์
+        self._locks = {}                # announcement_id -> [lock, จำนวนคนที่ถือ/รอ lock]
+
+    def winner(self, announcement_id):
+        return self._winners.get(announcement_id)
+
+    def _remember(self, announcement_id, user_id):
+        self._winners[announcement_id] = user_id
+        self._winners.move_to_end(announcement_id)
+        while len(self._winners) > self.max_entries:
+            self._winners.popitem(last=False)
+
+    def _taken(self, winner, result):
+        registry.inc("announcement_claims_total", result=result)
+        return {"status": "taken", "user_id": winner}
+
+    async def claim(self, announcement_id, user_id, amount):
+        """คืนผลแบบเดียวกับ repo.claim_announcement"""
+        def decided(result):
+            status = result.get("status")
+            return user_id if status == "claimed" else result.get("user_id") if status == "taken" else None
+        return await self._decide(
+            announcement_id, lambda: self.repo.claim_announcement(announcement_id, user_id, amount), decided,
+        )
+
+    async def run_once(self, key, user_id, action):
+        """รัน action() ได้ครั้งเดียวต่อ key — คนที่กดซ้ำได้ {"status": "taken", "user_id": คนที่ทำไปแล้ว}
+
+        ถ้า action() error ถือว่ายังไม่ได้ทำ คนถัดไปลองใหม่ได้"""
+        return await self._decide(key, action, lambda result: user_id)
+
+    async def _decide(self, key, action, decided):
+        """decided(result) คืนผู้ชนะ (None = ยังไม่มีใครได้สิทธิ์)"""
+        winner = self._winners.get(key)
+        if winner is not None:
+            return self._taken(winner, "rejected_in_memory")
+
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                # ระหว่างรอ lock อาจมีคนได้สิทธิ์ไปแล้ว
+                winner = self._winners.get(key)
+                if winner is not None:
+                    return self._taken(winner, "rejected_in_memory")
+                async with self.state.lock(f"claim:{key}", ttl=self.lock_ttl):
+                    # ผู้ชนะจากโปรเซสอื่น
+                    winner = await self.state.get(f"claim_winner:{key}")
+                    if winner is not None:
+                        self._remember(key, winner)
+                        return self._taken(winner, "rejected_shared")
+                    result = await action()
+                    winner = decided(result)
+                    if winner is not None:
+                        await self.state.set(f"claim_winner:{key}", winner, ttl=self.winner_ttl)
+        finally:
+            # คนสุดท้ายที่ออกลบ lock ทิ้ง ไม่ว่าจะได้ผู้ชนะ error หรือถูกยกเลิก
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(key, None)
+
+        if winner is not None:
+            self._remember(key, winner)
+        registry.inc("announcement_claims_total", result=result.get("status"))
+        return result
@@ -0,0 +1,52 @@
+# command_sync.py
+# sync slash command กับ Discord เฉพาะเมื่อคำสั่งเปลี่ยนจริง
+# เก็บ hash ของ command tree ที่ sync ล่าสุดไว้ในไฟล์ (แยกตามบอทและ guild)
+# ถ้า hash ตรงกับของเดิมก็ข้ามไป ไม่ต้องเรียก API ที่ติด rate limit ทุกครั้งที่บอทเริ่ม
+
+import hashlib
+import json
+import os
+
+
+def tree_hash(tree, guild=None):
+    commands = sorted(tree.get_commands(guild=guild), key=lambda command: command.name)
+    payload = json.dumps([command.to_dict(tree) for command in commands], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_state(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+async def sync_if_changed(tree, *, guild=None, state_path=".command_sync.json", force=False):
+    """sync เมื่อ tree ต่างจากครั้งก่อน คืน True ถ้ามีการ sync
+
+    guild: sync เฉพาะ guild นี้ (ใช้ตอนพัฒนา คำสั่งขึ้นทันที) โดยคัดลอกคำสั่ง global ไปด้วย"""
+    if guild is not None:
+        tree.copy_global_to(guild=guild)
+    scope = f"{tree.client.application_id}:{guild.id if guild else 'global'}"
+    digest = tree_hash(tree, guild)
+    state = load_state(state_path)
+    if not force and state.get(scope) == digest:
+        print(f"Command tree unchanged ({scope}), skip sync")
+        return False
+
+    synced = await tree.sync(guild=guild)
+    print(f"Synced {len(synced)} command(s) ({scope})")
+    state[scope] = digest
+    try:
+        save_state(state_path, state)
+    except OSError as e:
+        print(f"Could not save command sync state: {e}")
+    return True
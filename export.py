@@ -0,0 +1,91 @@
+# export.py
+# ส่งออกตาราง loans / payments เป็นไฟล์ CSV หรือ JSONL (บีบอัด gzip ได้) สำหรับแนบใน Discord
+# - ดึงข้อมูลทีละหน้าแบบ keyset (iter_pages) ไม่โหลดทั้งตารางเข้าหน่วยความจำ
+# - เขียนลง SpooledTemporaryFile ทีละหน้า: ไฟล์เล็กอยู่ในหน่วยความจำ เกิน spool_limit ย้ายไปดิสก์เอง
+# - แปลงแถว บีบอัด และเขียนไฟล์ทำใน thread (asyncio.to_thread) ไม่บล็อก event loop
+
+import asyncio
+import csv
+import gzip
+import io
+import json
+import tempfile
+
+SPOOL_LIMIT = 4 * 1024 * 1024
+PAGE_SIZE = 500
+
+LOAN_COLUMNS = (
+    "id", "user_id", "amount", "status", "created_at",
+    "principal_due", "interest_carried", "accrued_at", "interest_due", "announcement_id",
+)
+PAYMENT_COLUMNS = ("id", "loan_id", "user_id", "kind", "amount", "principal", "interest", "paid_at")
+
+FORMATS = ("csv", "jsonl")
+
+
+async def iter_pages(fetch_page, cursor_of, *, page_size=PAGE_SIZE):
+    """วนดึง fetch_page(after=..., limit=...) จนหมด คืนทีละหน้า (list ของแถว)"""
+    after = None
+    while True:
+        rows = await fetch_page(after=after, limit=page_size)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        after = cursor_of(rows[-1])
+
+
+def filename(table, fmt, *, compress=False, suffix=""):
+    name = f"{table}{suffix}.{fmt}"
+    return f"{name}.gz" if compress else name
+
+
+async def write_export(pages, columns, *, fmt="csv", compress=False, spool_limit=SPOOL_LIMIT):
+    """เขียนทุกหน้าจาก pages (async iterator) ลงไฟล์ชั่วคราว
+
+    คืน (ไฟล์ที่ seek(0) แล้ว, จำนวนแถว, ขนาดไบต์) — ผู้เรียกต้องปิดไฟล์เอง
+    CSV ขึ้นต้นด้วย BOM ให้ Excel อ่านภาษาไทยถูก"""
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format: {fmt}")
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_limit)
+    # GzipFile.close() ไม่ปิด fileobj ที่ส่งเข้าไป
+    out = gzip.GzipFile(fileobj=spool, mode="wb") if compress else spool
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def write_page(rows):
+        for row in rows:
+            values = [row.get(column) for column in columns]
+            if fmt == "csv":
+                writer.writerow(["" if value is None else value for value in values])
+            else:
+                buffer.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False, default=str))
+                buffer.write("\n")
+        # ระบายทีละหน้า หน่วยความจำที่ใช้จึงไม่โตตามขนาดตาราง
+        out.write(buffer.getvalue().encode("utf-8"))
+        buffer.seek(0)
+        buffer.truncate()
+
+    def finish():
+        if compress:
+            out.close()
+        size = spool.tell()
+        spool.seek(0)
+        return size
+
+    count = 0
+    try:
+        if fmt == "csv":
+            buffer.write("\ufeff")
+            writer.writerow(columns)
+        async for rows in pages:
+            # ทีละหน้า thread เดียว (รอจบก่อนดึงหน้าถัดไป) จึงไม่มีการเขียนไฟล์ซ้อนกัน
+            await asyncio.to_thread(write_page, rows)
+            count += len(rows)
+        await asyncio.to_thread(write_page, [])
+        size = await asyncio.to_thread(finish)
+    except BaseException:
+        spool.close()
+        raise
+    return spool, count, size
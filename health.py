@@ -0,0 +1,140 @@
+# health.py
+# HTTP endpoint สำหรับ health check (Railway) ที่รันอยู่ใน event loop เดียวกับบอท
+#   /         — "Bot is alive!" (เหมือนเดิม)
+#   /healthz  — liveness: event loop ยังตอบสนอง (loop lag ไม่เกินเกณฑ์)
+#   /readyz   — readiness: ต่อ Discord gateway อยู่และพร้อมรับคำสั่ง
+#   /metrics  — ตัวเลขแบบ Prometheus (เปิดด้วย METRICS_ENABLED=1)
+
+import asyncio
+import math
+import time
+
+from aiohttp import web
+
+from metrics import registry
+
+
+class HealthServer:
+    def __init__(self, bot, *, host="0.0.0.0", port=8080, metrics=False, lag_interval=1.0, max_lag=5.0):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.metrics_enabled = metrics
+        self.lag_interval = lag_interval
+        self.max_lag = max_lag
+        self.loop_lag = 0.0
+        self.max_loop_lag = 0.0
+        self.started_at = time.time()
+        self._dependencies = {}   # ชื่อ -> ฟังก์ชันคืน time.time() ของการเรียกที่สำเร็จล่าสุด
+        self._providers = []      # ฟังก์ชันคืน list ของ (ชื่อ metric, ค่า, labels)
+        self._runner = None
+        self._lag_task = None
+
+    def add_dependency(self, name, last_success):
+        self._dependencies[name] = last_success
+
+    def add_metrics(self, provider):
+        self._providers.append(provider)
+
+    async def start(self):
+        if self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/", self.handle_root)
+        app.router.add_get("/healthz", self.handle_liveness)
+        app.router.add_get("/readyz", self.handle_readiness)
+        if self.metrics_enabled:
+            app.router.add_get("/metrics", self.handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._lag_task = asyncio.create_task(self._measure_lag())
+
+    async def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _measure_lag(self):
+        # หลับ lag_interval วินาทีแล้วดูว่าตื่นช้ากว่ากำหนดเท่าไร = เวลาที่ loop ถูกบล็อก
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            self.loop_lag = max(0.0, loop.time() - start - self.lag_interval)
+            self.max_loop_lag = max(self.max_loop_lag, self.loop_lag)
+            registry.observe("event_loop_lag_seconds", self.loop_lag)
+
+    def gateway_latency(self):
+        latency = self.bot.latency
+        return latency if math.isfinite(latency) else None
+
+    def is_ready(self):
+        return self.bot.is_ready() and not self.bot.is_closed() and self.gateway_latency() is not None
+
+    def snapshot(self):
+        now = time.time()
+        dependencies = {}
+        for name, last_success in self._dependencies.items():
+            value = last_success()
+            dependencies[name] = {
+                "last_success": value,
+                "seconds_ago": round(now - value, 1) if value else None,
+            }
+        latency = self.gateway_latency()
+        return {
+            "ready": self.is_ready(),
+            "uptime_seconds": round(now - self.started_at, 1),
+            "gateway_latency_ms": round(latency * 1000, 1) if latency is not None else None,
+            "loop_lag_ms": round(self.loop_lag * 1000, 1),
+            "max_loop_lag_ms": round(self.max_loop_lag * 1000, 1),
+            "dependencies": dependencies,
+        }
+
+    async def handle_root(self, request):
+        return web.Response(text="Bot is alive!")
+
+    async def handle_liveness(self, request):
+        data = self.snapshot()
+        status = 200 if self.loop_lag < self.max_lag else 503
+        return web.json_response(data, status=status)
+
+    async def handle_readiness(self, request):
+        data = self.snapshot()
+        return web.json_response(data, status=200 if data["ready"] else 503)
+
+    def collect(self):
+        """รวม metric ทั้งหมดเป็น list ของ (ชื่อ, ค่า, labels)"""
+        latency = self.gateway_latency()
+        samples = [
+            ("bot_up", 1, {}),
+            ("bot_ready", int(self.is_ready()), {}),
+            ("bot_uptime_seconds", time.time() - self.started_at, {}),
+            ("bot_event_loop_lag_seconds", self.loop_lag, {}),
+            ("bot_event_loop_lag_max_seconds", self.max_loop_lag, {}),
+        ]
+        if latency is not None:
+            samples.append(("bot_gateway_latency_seconds", latency, {}))
+        for name, last_success in self._dependencies.items():
+            value = last_success()
+            if value:
+                samples.append(("bot_dependency_last_success_timestamp", value, {"dependency": name}))
+        for provider in self._providers:
+            try:
+                samples.extend(provider())
+            except Exception as e:
+                print(f"Metrics provider error: {e}")
+        return samples
+
+    async def handle_metrics(self, request):
+        lines = []
+        for name, value, labels in self.collect():
+            if labels:
+                label_text = ",".join(f'{key}="{val}"' for key, val in sorted(labels.items()))
+                lines.append(f"{name}{{{label_text}}} {value}")
+            else:
+                lines.append(f"{name} {value}")
+        return web.Response(text="\n".join(lines) + "\n", content_type="text/plain")
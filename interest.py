@@ -0,0 +1,173 @@
+# interest.py
+# คำนวณดอกเบี้ย 10% ต่อชั่วโมง (ไม่ทบต้น)
+# รายการที่ชำระบางส่วนแล้วคิดจากเงินต้นคงเหลือ (principal_due) + ดอกเบี้ยยกมา (interest_carried)
+# นับจาก accrued_at แทน amount / created_at (ดู migrations/004_payments_ledger.sql)
+# - calculate_interest: คิดทีละรายการ (สูตรต้นฉบับ)
+# - compute_batch: คิดทั้งชุดในรอบเดียว ใช้เวลา now เดียวกันทุกแถว และ cache การแปลง created_at
+#   ผลลัพธ์ตรงกับ calculate_interest ทุกแถว
+# ปัดดอกเบี้ยทีละรายการด้วย round_credits (ปัดครึ่งขึ้นแบบ round() ของ Postgres) ทุกที่
+# ยอดที่แสดงจึงตรงกับที่ record_repayment ตัดจริง
+
+import datetime
+import functools
+import math
+
+HOURLY_RATE = 0.1
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def round_credits(value):
+    """ปัดเป็นจำนวนเต็มแบบเดียวกับ round(numeric) ของ Postgres (.5 ปัดออกจากศูนย์)
+
+    round() ของ Python ปัด .5 เข้าหาเลขคู่ ทำให้ยอดต่างจากฝั่งฐานข้อมูลได้"""
+    return int(math.copysign(math.floor(abs(value) + 0.5), value))
+
+
+def accrual_basis(loan):
+    """(เงินต้นคงเหลือ, ดอกเบี้ยยกมา, เวลาที่เริ่มคิดดอกเบี้ยต่อ) ของรายการ"""
+    principal = loan.get('principal_due')
+    if principal is None:
+        principal = loan['amount']
+    return principal, loan.get('interest_carried') or 0, loan.get('accrued_at') or loan['created_at']
+
+
+def calculate_interest(loan):
+    if loan['status'] != 'pending':
+        return 0
+    try:
+        principal_due, carried, since = accrual_basis(loan)
+
+        # ใช้ datetime.fromisoformat โดยตรงกับ string ที่ได้จาก Supabase
+        created_at_str = str(since)
+        if '.' in created_at_str:
+            created_at_str = created_at_str.split('.')[0] + '+00:00'
+        start_time = datetime.datetime.fromisoformat(created_at_str)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        hours = abs((now - start_time).total_seconds() / 3600)  # ใช้ abs() เพื่อป้องกันค่าติดลบ
+
+        # คำนวณดอกเบี้ย 10% ต่อชั่วโมง (ไม่ทบต้น)
+        principal = float(principal_due)
+        interest = float(carried) + principal * HOURLY_RATE * hours  # 10% ต่อชั่วโมง
+        return round_credits(interest)
+    except Exception as e:
+        print(f"Error calculating interest: {e}")
+        return 0
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_created_at(value):
+    """แปลง created_at เป็นจำนวนไมโครวินาทีนับจาก epoch (None ถ้าแปลงไม่ได้)
+
+    ใช้กติกาเดียวกับ calculate_interest และเก็บเป็นจำนวนเต็มเพื่อให้ผลลบเวลาตรงกับ timedelta"""
+    created_at_str = str(value)
+    if '.' in created_at_str:
+        created_at_str = created_at_str.split('.')[0] + '+00:00'
+    try:
+        start_time = datetime.datetime.fromisoformat(created_at_str)
+    except ValueError:
+        return None
+    if start_time.tzinfo is None:
+        # calculate_interest จะลบเวลาไม่ได้ (naive - aware) และคืน 0
+        return None
+    return (start_time - _EPOCH) // _MICROSECOND
+
+
+def accrued_interest(principal, carried, since, now=None):
+    """ดอกเบี้ยสะสม (ยังไม่ปัดเศษ) ของเงินต้น principal ที่มีดอกเบี้ยยกมา carried ณ เวลา since"""
+    start_us = parse_created_at(str(since))
+    if start_us is None:
+        return float(carried)
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    hours = abs(((now - _EPOCH) // _MICROSECOND - start_us) / 10**6 / 3600)
+    return float(carried) + float(principal) * HOURLY_RATE * hours
+
+
+def amount_due(loans, now=None):
+    """(เงินต้นค้าง, ดอกเบี้ยค้าง) ของหนี้ค้างทั้งหมดของ user — ปัดทีละรายการเหมือน record_repayment
+
+    ไม่ใช้ snapshot ของ user_balances เพราะเก็บแค่ผลรวมดอกเบี้ยก่อนปัด (ปัดรวมทีเดียวแล้วต่างได้หลายเครดิต)"""
+    batch = compute_batch(loans, now)
+    return sum(batch.principal), batch.total_interest()
+
+
+def threshold_hours(principal, multiple=1, carried=0):
+    """จำนวนชั่วโมงที่ดอกเบี้ย (หลังปัดเศษ) จะเกิน principal × multiple (ติดลบ = เกินไปแล้ว)"""
+    return (principal * multiple + 0.5 - carried) / (principal * HOURLY_RATE)
+
+
+def crossing_time(loan, multiple=1):
+    """เวลาที่ดอกเบี้ยของรายการจะเกินเงินต้น × multiple (None ถ้าคำนวณไม่ได้)"""
+    principal, carried, since = accrual_basis(loan)
+    start_us = parse_created_at(str(since))
+    principal = _to_float(principal)
+    carried = _to_float(carried) or 0.0
+    if start_us is None or principal is None or principal <= 0:
+        return None
+    hours = threshold_hours(principal, multiple, carried)
+    return _EPOCH + datetime.timedelta(microseconds=start_us) + datetime.timedelta(hours=hours)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class InterestBatch:
+    """ผลการคำนวณทั้งชุด เก็บเป็นคอลัมน์ (list) เรียงตามลำดับของ loans"""
+
+    __slots__ = ("loans", "now", "principal", "interest", "total", "crosses_at")
+
+    def __init__(self, loans, now, principal, interest, total, crosses_at):
+        self.loans = loans
+        self.now = now
+        self.principal = principal
+        self.interest = interest
+        self.total = total
+        self.crosses_at = crosses_at
+
+    def __len__(self):
+        return len(self.loans)
+
+    def __iter__(self):
+        return zip(self.loans, self.principal, self.interest, self.total, self.crosses_at)
+
+    def total_interest(self):
+        return sum(self.interest)
+
+    def high_interest(self):
+        """รายการที่ดอกเบี้ยเกินเงินต้นแล้ว"""
+        return [row for row in self if row[2] > row[1]]
+
+
+def compute_batch(loans, now=None):
+    loans = list(loans)
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    now_us = (now - _EPOCH) // _MICROSECOND
+
+    bases = [accrual_basis(loan) for loan in loans]
+    starts = [
+        parse_created_at(str(since)) if loan['status'] == 'pending' else None
+        for loan, (_, _, since) in zip(loans, bases)
+    ]
+    principal = [basis[0] for basis in bases]
+    amounts = [_to_float(amount) for amount in principal]
+    carried = [_to_float(basis[1]) or 0.0 for basis in bases]
+
+    interest = [
+        0 if start is None or amount is None
+        else round_credits(owed + amount * HOURLY_RATE * abs((now_us - start) / 10**6 / 3600))
+        for start, amount, owed in zip(starts, amounts, carried)
+    ]
+    total = [p + i for p, i in zip(principal, interest)]
+    crosses_at = [
+        None if start is None or amount is None or amount <= 0
+        else _EPOCH + datetime.timedelta(microseconds=start) + datetime.timedelta(hours=threshold_hours(amount, 1, owed))
+        for start, amount, owed in zip(starts, amounts, carried)
+    ]
+    return InterestBatch(loans, now, principal, interest, total, crosses_at)
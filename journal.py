@@ -0,0 +1,513 @@
+# journal.py
+# โหมด write-behind (WRITE_BEHIND=1): คำสั่งที่เขียนข้อมูลไม่ต้องรอ Supabase
+# - ตัดสินผลในเครื่องจากสำเนาหนี้ค้าง (mirror) แล้วเขียนลง journal (SQLite WAL, append-only) ก่อนตอบผู้ใช้
+# - flusher เบื้องหลังส่ง journal ไปฐานข้อมูลทีละชุดผ่าน apply_journal (op_id = idempotency key)
+#   ถ้าฐานข้อมูลล่ม/ช้า จะลองใหม่เรื่อยๆ (backoff) ตามลำดับเดิม บอทรีสตาร์ทก็ส่งต่อจากที่ค้างได้
+# - การอ่านรวมรายการที่ยังไม่ถูกส่งเข้าไปด้วย ผู้ใช้จึงเห็นผลของตัวเองทันที
+# - รายการที่ขัดกับฐานข้อมูล (conflict) ถูกข้าม แต่เก็บไว้ในตาราง dead_letter และแจ้งแอดมิน (on_conflict)
+#   เพราะผู้ใช้ได้รับแจ้งว่าสำเร็จไปแล้ว แอดมินต้องตามแก้เอง
+# ใช้กับบอทโปรเซสเดียวเท่านั้น (mirror ไม่เห็นสิ่งที่โปรเซสอื่นตัดสินไปแล้ว)
+
+import asyncio
+import datetime
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from interest import compute_batch
+from loan_repository import (
+    LoanRepository, MemoryLoanRepository, empty_balance, filter_rows, page_rows,
+    payment_cursor_of, pending_balance,
+)
+
+# ส่งไปฐานข้อมูลเฉพาะคอลัมน์เหล่านี้ (ตรงกับ apply_journal ใน migrations/007_write_behind.sql)
+LOAN_COLUMNS = (
+    "id", "user_id", "amount", "status", "created_at",
+    "principal_due", "interest_carried", "accrued_at", "announcement_id",
+)
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class Journal:
+    """ไฟล์ SQLite แบบ append-only — แถวไม่ถูกแก้นอกจากบันทึกผลการ flush"""
+
+    def __init__(self, path=".journal.db"):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL = fsync ทุก commit ตอบผู้ใช้แล้วข้อมูลไม่หายแม้เครื่องดับ
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS journal ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " op_id TEXT NOT NULL UNIQUE,"
+            " op TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " last_error TEXT,"
+            " flushed_at REAL,"
+            " status TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS journal_unflushed ON journal (seq) WHERE flushed_at IS NULL")
+        # prune() ไม่ลบตารางนี้ — ลบเองหลังแก้ข้อมูลแล้ว
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            " op_id TEXT PRIMARY KEY,"
+            " op TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " error TEXT,"
+            " dropped_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def _append(self, entry):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO journal (op_id, op, data, created_at) VALUES (?, ?, ?, ?)",
+                (entry["op_id"], entry["op"], json.dumps(entry, ensure_ascii=False, default=str), time.time()),
+            )
+            return cursor.lastrowid
+
+    def _unflushed(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT seq, data FROM journal WHERE flushed_at IS NULL ORDER BY seq").fetchall()
+        return [(seq, json.loads(data)) for seq, data in rows]
+
+    def _mark(self, results):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE journal SET flushed_at = ?, status = ?, last_error = ? WHERE seq = ?",
+                [(now, status, error, seq) for seq, status, error in results],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO dead_letter (op_id, op, data, error, dropped_at)"
+                " SELECT op_id, op, data, ?, ? FROM journal WHERE seq = ?",
+                [(error, now, seq) for seq, status, error in results if status == "conflict"],
+            )
+
+    def _failed(self, seqs, error):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE journal SET attempts = attempts + 1, last_error = ? WHERE seq = ?",
+                [(error, seq) for seq in seqs],
+            )
+
+    def _dead_letters(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT data, error, dropped_at FROM dead_letter ORDER BY dropped_at").fetchall()
+        return [(json.loads(data), error, dropped_at) for data, error, dropped_at in rows]
+
+    def _prune(self, before):
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM journal WHERE flushed_at IS NOT NULL AND flushed_at < ?", (before,)
+            ).rowcount
+
+    async def append(self, entry):
+        """บันทึกลงดิสก์ (fsync) แล้วคืน seq"""
+        return await asyncio.to_thread(self._append, entry)
+
+    async def unflushed(self):
+        return await asyncio.to_thread(self._unflushed)
+
+    async def mark_flushed(self, results):
+        """results = [(seq, "applied" | "duplicate" | "conflict", error)]"""
+        await asyncio.to_thread(self._mark, results)
+
+    async def mark_failed(self, seqs, error):
+        await asyncio.to_thread(self._failed, seqs, error)
+
+    async def dead_letters(self):
+        """รายการที่ถูกข้ามเพราะ conflict: [(entry, error, dropped_at)]"""
+        return await asyncio.to_thread(self._dead_letters)
+
+    async def prune(self, older_than):
+        """ลบรายการที่ส่งแล้วเกิน older_than วินาที"""
+        return await asyncio.to_thread(self._prune, time.time() - older_than)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _loan_row(row):
+    return {column: row.get(column) for column in LOAN_COLUMNS}
+
+
+def _overlay(rows, entries, key, *, id_of=lambda row: str(row["id"])):
+    """แทนแถวจากฐานข้อมูลด้วยแถวใน journal ที่ id ตรงกัน (ใหม่กว่า) และเพิ่มแถวที่ยังไม่มี"""
+    by_id = {id_of(row): row for row in rows}
+    for entry in entries:
+        for row in key(entry):
+            by_id[id_of(row)] = dict(row)
+    return list(by_id.values())
+
+
+def _entry_loans(entry):
+    return entry["created"] + entry["updated"]
+
+
+def describe_entry(entry):
+    """สรุปว่า entry เขียนอะไรบ้าง (ใช้ในข้อความแจ้งแอดมิน)"""
+    lines = [f"• รายการใหม่ {row['amount']:,} เครดิต ของ <@{row['user_id']}> ({row['status']})" for row in entry["created"]]
+    lines += [f"• รายการ {row['id']} ของ <@{row['user_id']}> เป็น {row['status']}" for row in entry["updated"]]
+    lines += [f"• {payment['kind']} {payment['amount']:,} เครดิต ของ <@{payment['user_id']}>" for payment in entry["payments"]]
+    if entry["alerts"]:
+        lines.append(f"• บันทึกการแจ้งเตือน {len(entry['alerts'])} รายการ")
+    return "\n".join(lines)
+
+
+class WriteBehindRepository(LoanRepository):
+    def __init__(self, repo, journal, *, batch_size=100, linger=0.05, retry_delay=1.0, max_retry_delay=60.0,
+                 max_claimed=1000, on_conflict=None):
+        self.repo = repo
+        self.journal = journal
+        self.on_conflict = on_conflict   # async on_conflict(entry, error) — แจ้งแอดมินเมื่อรายการถูกข้าม
+        self.batch_size = batch_size
+        self.max_claimed = max_claimed
+        self.linger = linger
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._base = {}                  # loan_id -> แถว pending ล่าสุดที่รู้ว่าอยู่ในฐานข้อมูลแล้ว
+        self._unflushed = OrderedDict()  # seq -> entry ที่ยังไม่ถูกส่ง
+        # announcement_id -> user_id ที่ตัดสินไปแล้ว (จำล่าสุด max_claimed รายการ
+        # ที่หลุดไปแล้วแต่หนี้ยังค้าง mirror ยังปฏิเสธให้จาก announcement_id ของแถว)
+        self._claimed = OrderedDict()
+        self._alert_states = {}          # loan_id -> tier ล่าสุดที่รู้ว่าอยู่ในฐานข้อมูลแล้ว (ใช้ตอนฐานข้อมูลล่ม)
+        self._mirror = MemoryLoanRepository()
+        self._write_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._collectors = []            # การอ่านที่กำลังรอฐานข้อมูล (เก็บ entry ที่ถูก flush ระหว่างนั้น)
+        self.flushed = 0
+        self.conflicts = 0
+        self.failures = 0
+        self.last_error = None
+
+    def stats(self):
+        return {
+            "unflushed": len(self._unflushed),
+            "flushed": self.flushed,
+            "conflicts": self.conflicts,
+            "flush_failures": self.failures,
+        }
+
+    async def start(self, *, retention=7 * 24 * 3600):
+        """โหลดรายการที่ค้างจากรอบก่อน และสร้าง mirror ของหนี้ค้าง (ลบรายการที่ส่งแล้วเกิน retention วินาที)"""
+        await self.journal.prune(retention)
+        for seq, entry in await self.journal.unflushed():
+            self._unflushed[seq] = entry
+        if self._unflushed:
+            print(f"Journal: {len(self._unflushed)} entries waiting to be flushed")
+        try:
+            await self.list_pending()
+        except Exception as e:
+            # ฐานข้อมูลล่มตอนเริ่ม: ใช้เฉพาะข้อมูลใน journal ไปก่อน แล้วโหลดใหม่รอบถัดไป
+            print(f"Journal: could not load pending loans ({e}), starting from journal only")
+            self._rebuild()
+
+    # ----- mirror -----
+
+    def _rebuild(self):
+        rows = _overlay(self._base.values(), self._unflushed.values(), _entry_loans)
+        self._mirror = MemoryLoanRepository([row for row in rows if row["status"] == "pending"])
+        for row in rows:
+            if row.get("announcement_id") is not None:
+                self._remember_claim(row["announcement_id"], row["user_id"])
+
+    def _remember_claim(self, announcement_id, user_id):
+        self._claimed[announcement_id] = user_id
+        self._claimed.move_to_end(announcement_id)
+        while len(self._claimed) > self.max_claimed:
+            self._claimed.popitem(last=False)
+
+    def _settle(self, entry):
+        # entry ถูกเขียนลงฐานข้อมูลแล้ว: ย้ายผลเข้า _base
+        for row in _entry_loans(entry):
+            if row["status"] == "pending":
+                self._base[row["id"]] = row
+            else:
+                self._base.pop(row["id"], None)
+        for alert in entry["alerts"]:
+            self._alert_states[alert["loan_id"]] = alert["tier"]
+
+    async def _read(self, fetch):
+        """อ่านจากฐานข้อมูล คืน (ผล, entry ที่ต้องซ้อนทับ)
+
+        รวม entry ที่ถูก flush ระหว่างรอผล เพราะผลที่อ่านได้อาจเก่ากว่านั้น"""
+        collector = []
+        self._collectors.append(collector)
+        try:
+            result = await fetch()
+        finally:
+            self._collectors.remove(collector)
+        return result, collector + list(self._unflushed.values())
+
+    # ----- เขียน -----
+
+    async def _mutate(self, op, user_ids, action):
+        """action(mirror) คืน (ผล, แถวใหม่, แถวที่เปลี่ยน, alerts) — ถ้าไม่มีอะไรเปลี่ยนก็ไม่ลง journal"""
+        async with self._write_lock:
+            mirror = self._mirror
+            with mirror.track_changes(user_ids) as changes:
+                result, created, updated, alerts = await action(mirror)
+            payments, balances = changes["payments"], changes["balances"]
+            if not (created or updated or payments or alerts):
+                return result
+            entry = {
+                "op_id": str(uuid.uuid4()),
+                "op": op,
+                "created": [_loan_row(row) for row in created],
+                "updated": [_loan_row(row) for row in updated],
+                "payments": payments,
+                "alerts": alerts,
+                "balances": balances,
+            }
+            try:
+                seq = await self.journal.append(entry)
+            except Exception:
+                # ลง journal ไม่ได้ = ไม่ได้เกิดขึ้น ทิ้งสิ่งที่เปลี่ยนใน mirror
+                self._rebuild()
+                raise
+            self._unflushed[seq] = entry
+            self._wakeup.set()
+            return result
+
+    async def insert(self, loan_data):
+        async def action(mirror):
+            row = await mirror.insert(loan_data)
+            return row, [row], [], []
+        return await self._mutate("insert", [loan_data["user_id"]], action)
+
+    async def claim_announcement(self, announcement_id, user_id, amount):
+        async def action(mirror):
+            winner = self._claimed.get(announcement_id)
+            if winner is not None:
+                return {"status": "taken", "user_id": winner}, [], [], []
+            result = await mirror.claim_announcement(announcement_id, user_id, amount)
+            if result["status"] != "claimed":
+                return result, [], [], []
+            self._remember_claim(announcement_id, user_id)
+            return result, [result["loan"]], [], []
+        return await self._mutate("claim_announcement", [user_id], action)
+
+    async def mark_status(self, user_id, status, *, from_status="pending"):
+        if from_status != "pending":
+            # mirror มีแค่หนี้ค้าง สถานะอื่นต้องถามฐานข้อมูลตรงๆ
+            return await self.repo.mark_status(user_id, status, from_status=from_status)
+
+        async def action(mirror):
+            rows = await mirror.mark_status(user_id, status)
+            return rows, [], rows, []
+        return await self._mutate("mark_status", [user_id], action)
+
+    async def record_repayment(self, user_id, amount=None):
+        async def action(mirror):
+            result = await mirror.record_repayment(user_id, amount)
+            return result, [], result.get("loans") or [], []
+        return await self._mutate("record_repayment", [user_id], action)
+
+    async def record_transfer(self, user_id, amount):
+        async def action(mirror):
+            result = await mirror.record_transfer(user_id, amount)
+            return result, [result["loan"]] if result["status"] == "ok" else [], [], []
+        return await self._mutate("record_transfer", [user_id], action)
+
+    async def clear_debts(self, user_ids):
+        async def action(mirror):
+            rows = await mirror.clear_debts(user_ids)
+            return rows, [], rows, []
+        return await self._mutate("clear_debts", list(dict.fromkeys(user_ids)), action)
+
+    async def record_transfers(self, user_ids, amount):
+        async def action(mirror):
+            result = await mirror.record_transfers(user_ids, amount)
+            return result, result["loans"], [], []
+        return await self._mutate("record_transfers", list(dict.fromkeys(user_ids)), action)
+
+    async def record_alert(self, loan_id, tier):
+        async def action(mirror):
+            return None, [], [], [{"loan_id": loan_id, "tier": tier, "alerted_at": utcnow().isoformat()}]
+        await self._mutate("record_alert", [], action)
+
+    # ----- อ่าน (รวมรายการที่ยังไม่ถูกส่ง) -----
+
+    async def get_pending_for_user(self, user_id):
+        return await self._mirror.get_pending_for_user(user_id)
+
+    async def list_pending(self):
+        try:
+            rows, entries = await self._read(self.repo.list_pending)
+        except Exception as e:
+            print(f"Journal: list_pending from database failed ({e}), using local copy")
+            return await self._mirror.list_pending()
+        async with self._write_lock:
+            self._base = {row["id"]: row for row in rows}
+            # entry ที่ถูก flush ระหว่างอ่านอาจยังไม่อยู่ในผลที่อ่านได้
+            waiting = {entry["op_id"] for entry in self._unflushed.values()}
+            for entry in entries:
+                if entry["op_id"] not in waiting:
+                    self._settle(entry)
+            self._rebuild()
+        return await self._mirror.list_pending()
+
+    async def list_for_user(self, user_id):
+        rows, entries = await self._read(lambda: self.repo.list_for_user(user_id))
+        return [row for row in _overlay(rows, entries, _entry_loans) if row["user_id"] == user_id]
+
+    async def list_all(self):
+        rows, entries = await self._read(self.repo.list_all)
+        return _overlay(rows, entries, _entry_loans)
+
+    async def page(self, *, status=None, after=None, before=None, limit=15, user_id=None, since=None, until=None):
+        # ขอเผื่อเท่าจำนวนแถวใน journal เพราะบางแถวอาจถูกแทน/ตัดออกหลังซ้อนทับ
+        extra = sum(len(_entry_loans(entry)) for entry in self._unflushed.values())
+        rows, entries = await self._read(lambda: self.repo.page(
+            status=status, after=after, before=before, limit=limit + extra, user_id=user_id, since=since, until=until,
+        ))
+        if not entries:
+            return page_rows(rows, after=after, before=before, limit=limit)
+        rows = [row for row in _overlay(rows, entries, _entry_loans) if not status or row["status"] == status]
+        rows = filter_rows(rows, time_column="created_at", user_id=user_id, since=since, until=until)
+        return page_rows(rows, after=after, before=before, limit=limit)
+
+    async def page_payments(self, *, after=None, limit=500, user_id=None, since=None, until=None):
+        extra = sum(len(entry["payments"]) for entry in self._unflushed.values())
+        rows, entries = await self._read(lambda: self.repo.page_payments(
+            after=after, limit=limit + extra, user_id=user_id, since=since, until=until,
+        ))
+        rows = _overlay(rows, entries, lambda entry: entry["payments"])
+        rows = filter_rows(rows, time_column="paid_at", user_id=user_id, since=since, until=until)
+        return page_rows(rows, after=after, limit=limit, key=payment_cursor_of)
+
+    async def aggregates(self):
+        totals, entries = await self._read(self.repo.aggregates)
+        created = [row for entry in entries for row in entry["created"]]
+        batch = compute_batch(await self.list_pending())
+        return {
+            # entry ที่ถูก flush ระหว่างอ่านอาจถูกนับซ้ำ (ถูกต้องอีกครั้งในการอ่านรอบถัดไป)
+            "total_count": totals["total_count"] + len(created),
+            "total_amount": totals["total_amount"] + sum(row["amount"] for row in created),
+            "pending_count": len(batch),
+            "pending_amount": sum(batch.principal),
+            "pending_interest": batch.total_interest(),
+            "high_interest": [dict(row[0]) for row in batch.high_interest()],
+        }
+
+    async def get_balance(self, user_id):
+        try:
+            balance, entries = await self._read(lambda: self.repo.get_balance(user_id))
+            balance = dict(balance)
+        except Exception as e:
+            # ยอดรวมตลอดอายุจะขาดส่วนที่อยู่ในฐานข้อมูล แต่หนี้ค้างยังถูกต้องจาก mirror
+            print(f"Journal: get_balance from database failed ({e}), using local copy")
+            balance, entries = empty_balance(user_id), list(self._unflushed.values())
+        for entry in entries:
+            for key, value in entry["balances"].get(user_id, {}).items():
+                balance[key] = (balance.get(key) or 0) + value
+        balance.update(pending_balance(await self._mirror.get_pending_for_user(user_id), utcnow()))
+        return balance
+
+    async def get_alert_states(self):
+        try:
+            states, entries = await self._read(self.repo.get_alert_states)
+            self._alert_states = dict(states)
+        except Exception as e:
+            # tier จากการอ่านครั้งก่อน + entry ที่ส่งไปแล้วหลังจากนั้น (ดู _settle) + ที่ยังค้างใน journal
+            print(f"Journal: get_alert_states from database failed ({e}), using local copy")
+            entries = list(self._unflushed.values())
+        states = dict(self._alert_states)
+        pending = {row["id"] for row in await self._mirror.list_pending()}
+        for entry in entries:
+            for alert in entry["alerts"]:
+                if alert["loan_id"] in pending:
+                    states[alert["loan_id"]] = alert["tier"]
+        return states
+
+    # ----- flusher -----
+
+    async def flush_once(self):
+        """ส่ง journal หนึ่งชุด คืนจำนวนที่ส่งได้ (ฐานข้อมูลล่ม = exception)"""
+        batch = list(self._unflushed.items())[:self.batch_size]
+        if not batch:
+            return 0
+        payload = [
+            {key: entry[key] for key in ("op_id", "op", "created", "updated", "payments", "alerts")}
+            for _, entry in batch
+        ]
+        try:
+            results = await self.repo.apply_journal(payload)
+        except Exception as e:
+            await self.journal.mark_failed([seq for seq, _ in batch], str(e))
+            raise
+        by_op = {result["op_id"]: result for result in results}
+
+        marks = []
+        conflicted = []
+        for seq, entry in batch:
+            result = by_op.get(entry["op_id"], {"status": "conflict", "error": "missing from apply_journal result"})
+            marks.append((seq, result["status"], result.get("error")))
+            del self._unflushed[seq]
+            if result["status"] == "conflict":
+                conflicted.append((entry, result.get("error")))
+                self.conflicts += 1
+                print(f"Journal conflict, dropped {entry['op']} {entry['op_id']}: {result.get('error')}")
+                continue
+            self._settle(entry)
+            for collector in self._collectors:
+                collector.append(entry)
+        # mark_flushed เก็บรายการที่ conflict ลง dead_letter ก่อนแจ้งแอดมิน
+        await self.journal.mark_flushed(marks)
+        self.flushed += len(batch)
+        for entry, error in conflicted:
+            if self.on_conflict is not None:
+                try:
+                    await self.on_conflict(entry, error)
+                except Exception as e:
+                    print(f"Journal: conflict notification failed ({e})")
+        if conflicted:
+            # ผลที่ตัดสินไว้ในเครื่องใช้ไม่ได้ โหลดหนี้ค้างจากฐานข้อมูลใหม่
+            try:
+                await self.list_pending()
+            except Exception:
+                async with self._write_lock:
+                    self._rebuild()
+        return len(batch)
+
+    async def run(self):
+        """loop ของ flusher (เริ่มด้วย Bot.start_background_task)"""
+        delay = self.retry_delay
+        while True:
+            if not self._unflushed:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                # รอให้คำสั่งที่ตามมาติดๆ เข้าชุดเดียวกัน
+                await asyncio.sleep(self.linger)
+            try:
+                await self.flush_once()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"Journal flush failed ({len(self._unflushed)} waiting, retry in {delay:g}s): {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+            delay = self.retry_delay
+
+    async def close(self, *, timeout=5.0):
+        # พยายามส่งที่ค้างก่อนปิด ที่เหลือจะถูกส่งตอนเริ่มรอบหน้า
+        deadline = time.monotonic() + timeout
+        try:
+            while self._unflushed and time.monotonic() < deadline:
+                await asyncio.wait_for(self.flush_once(), max(0.1, deadline - time.monotonic()))
+        except Exception as e:
+            print(f"Journal: {len(self._unflushed)} entries left unflushed at shutdown ({e})")
+        self.journal.close()
+        await self.repo.close()
@@ -0,0 +1,263 @@
+# loan_cache.py
+# แคชหนี้ค้าง (status = pending) แยกตาม user_id ในหน่วยความจำ
+# - โหลดทั้งหมดตอนบอทเริ่ม (warm)
+# - ทุกครั้งที่บอทเพิ่ม/เปลี่ยนสถานะรายการ จะอัปเดตแคชไปพร้อมกัน (write-through)
+# - โหลดใหม่จากฐานข้อมูลเมื่อเกิน TTL เผื่อมีคนแก้ข้อมูลนอกบอท
+
+import asyncio
+import datetime
+import itertools
+import time
+
+from interest import HOURLY_RATE, accrual_basis, accrued_interest, compute_batch, round_credits
+from loan_repository import LoanRepository, filter_rows, page_rows
+
+
+class CachedLoanRepository(LoanRepository):
+    def __init__(self, repo, *, ttl=30.0, high_interest_limit=25):
+        self.repo = repo
+        self.ttl = ttl
+        self.high_interest_limit = high_interest_limit
+        self._pending = {}       # user_id -> {loan_id: row}
+        self._loaded_at = None
+        self._version = 0        # เพิ่มทุกครั้งที่บอทเขียนข้อมูลเอง
+        self._totals = None      # ผลของ repo.aggregates() ที่ปรับเองทุกครั้งที่บอทเขียนข้อมูล
+        self._totals_at = None
+        self._accrued_at = None  # เวลาที่ pending_interest ใน _totals คิดถึง
+        self._high = {}          # loan_id -> แถวดอกเบี้ยสูง เรียงดอกเบี้ยมากไปน้อย (ณ ตอนโหลด)
+        self._refresh_lock = asyncio.Lock()
+        self._listeners = []     # ฟังก์ชันที่อยากรู้ทุกครั้งที่บอทเขียนข้อมูล
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "users": len(self._pending),
+            "loans": sum(len(loans) for loans in self._pending.values()),
+        }
+
+    def add_listener(self, callback):
+        """callback(event, user_id, rows) — event เป็น "insert" หรือ "status" """
+        self._listeners.append(callback)
+
+    def _notify(self, event, user_id, rows):
+        for callback in self._listeners:
+            try:
+                callback(event, user_id, rows)
+            except Exception as e:
+                print(f"Loan listener error: {e}")
+
+    def _fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def warm(self):
+        async with self._refresh_lock:
+            await self._refresh()
+
+    async def _refresh(self):
+        # ถ้าบอทเขียนข้อมูลระหว่างที่กำลังโหลด ผลที่ได้อาจเก่ากว่าแคช ให้โหลดใหม่อีกรอบ
+        for _ in range(3):
+            version = self._version
+            rows = await self.repo.list_pending()
+            if version == self._version:
+                break
+        index = {}
+        for row in rows:
+            index.setdefault(row['user_id'], {})[row['id']] = row
+        self._pending = index
+        self._loaded_at = time.monotonic()
+        self.refreshes += 1
+
+    async def _ensure(self):
+        if self._fresh():
+            self.hits += 1
+            return
+        self.misses += 1
+        async with self._refresh_lock:
+            if not self._fresh():
+                await self._refresh()
+
+    def _add(self, row):
+        if row.get('status') == 'pending' and row.get('id') is not None:
+            self._pending.setdefault(row['user_id'], {})[row['id']] = dict(row)
+
+    async def get_pending_for_user(self, user_id):
+        await self._ensure()
+        return [dict(row) for row in self._pending.get(user_id, {}).values()]
+
+    async def list_pending(self):
+        await self._ensure()
+        return [dict(row) for loans in self._pending.values() for row in loans.values()]
+
+    async def list_for_user(self, user_id):
+        return await self.repo.list_for_user(user_id)
+
+    async def list_all(self):
+        return await self.repo.list_all()
+
+    def _inserted(self, row):
+        self._version += 1
+        self._add(row)
+        if self._totals is not None:
+            self._totals["total_count"] += 1
+            self._totals["total_amount"] += row['amount']
+            self._count_pending([], [row])
+        self._notify("insert", row['user_id'], [row])
+
+    def _accrue(self, now):
+        # ดอกเบี้ยรวมโตเป็นเส้นตรงตามเงินต้นคงค้างรวม (ไม่ทบต้น)
+        hours = (now - self._accrued_at).total_seconds() / 3600
+        self._totals["pending_interest"] += HOURLY_RATE * self._totals["pending_amount"] * hours
+        self._accrued_at = now
+
+    def _count_pending(self, old_rows, new_rows):
+        """ปรับยอดหนี้ค้างใน _totals: old_rows = แถว pending เดิม, new_rows = แถวหลังเขียน
+
+        ทำเฉพาะแถวที่เปลี่ยน ไม่ต้องคำนวณหนี้ค้างทั้งหมดใหม่"""
+        if self._totals is None:
+            return
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self._accrue(now)
+        totals = self._totals
+        for rows, sign in ((old_rows, -1), ([row for row in new_rows if row.get('status') == 'pending'], 1)):
+            for row in rows:
+                principal, carried, since = accrual_basis(row)
+                totals["pending_count"] += sign
+                totals["pending_amount"] += sign * principal
+                totals["pending_interest"] += sign * accrued_interest(principal, carried, since, now)
+        # รายการที่ปิดแล้วออกจาก high_interest ส่วนที่ชำระบางส่วนใช้แถวใหม่ (/สถิติ คำนวณซ้ำว่ายังเกินไหม)
+        for row in new_rows:
+            if row['id'] in self._high:
+                if row.get('status') == 'pending':
+                    self._high[row['id']] = dict(row)
+                else:
+                    del self._high[row['id']]
+
+    async def insert(self, loan_data):
+        row = await self.repo.insert(loan_data)
+        self._inserted(row)
+        return row
+
+    async def claim_announcement(self, announcement_id, user_id, amount):
+        # คนที่มีหนี้ค้างอยู่ในแคชแล้ว ตอบได้เลยไม่ต้องถามฐานข้อมูล
+        await self._ensure()
+        if self._pending.get(user_id):
+            return {"status": "has_debt"}
+        result = await self.repo.claim_announcement(announcement_id, user_id, amount)
+        if result.get("status") == "claimed":
+            self._inserted(result["loan"])
+        return result
+
+    async def mark_status(self, user_id, status, *, from_status="pending"):
+        rows = await self.repo.mark_status(user_id, status, from_status=from_status)
+        self._version += 1
+        if from_status == 'pending':
+            # หลัง update แล้ว user นี้ไม่มีรายการ pending เหลือในฐานข้อมูลแน่นอน
+            self._pending.pop(user_id, None)
+            # เปลี่ยนแค่สถานะ แถวเดิมจึงคือแถวเดียวกันที่ยัง pending
+            self._count_pending([dict(row, status='pending') for row in rows], rows)
+        for row in rows:
+            self._add(row)
+        self._notify("status", user_id, rows)
+        return rows
+
+    async def record_repayment(self, user_id, amount=None):
+        result = await self.repo.record_repayment(user_id, amount)
+        changed = result.get("loans") or []
+        if changed:
+            self._version += 1
+            loans = self._pending.setdefault(user_id, {})
+            self._count_pending([loans[row['id']] for row in changed if row['id'] in loans], changed)
+            for row in changed:
+                if row.get('status') == 'pending':
+                    loans[row['id']] = dict(row)
+                else:
+                    loans.pop(row['id'], None)
+            if not loans:
+                del self._pending[user_id]
+            # ส่งหนี้ที่ยังค้างทั้งหมดของ user ไปด้วย (listener ล้างของเดิมของ user นี้ก่อนเพิ่มใหม่)
+            remaining = [dict(row) for row in loans.values()]
+            self._notify("status", user_id, [row for row in changed if row.get('status') != 'pending'] + remaining)
+        return result
+
+    async def record_transfer(self, user_id, amount):
+        await self._ensure()
+        if self._pending.get(user_id):
+            return {"status": "has_debt"}
+        result = await self.repo.record_transfer(user_id, amount)
+        if result.get("status") == "ok":
+            self._inserted(result["loan"])
+        return result
+
+    async def clear_debts(self, user_ids):
+        rows = await self.repo.clear_debts(user_ids)
+        self._version += 1
+        by_user = {user_id: [] for user_id in user_ids}
+        for row in rows:
+            by_user.setdefault(row['user_id'], []).append(row)
+        for user_id, cleared in by_user.items():
+            self._pending.pop(user_id, None)
+            self._count_pending([dict(row, status='pending') for row in cleared], cleared)
+            if cleared:
+                self._notify("status", user_id, cleared)
+        return rows
+
+    async def record_transfers(self, user_ids, amount):
+        # คนที่มีหนี้ค้างอยู่ในแคชไม่ต้องส่งไปฐานข้อมูล (ฐานข้อมูลเช็คซ้ำอีกรอบ)
+        await self._ensure()
+        user_ids = list(dict.fromkeys(user_ids))
+        debtors = [user_id for user_id in user_ids if self._pending.get(user_id)]
+        eligible = [user_id for user_id in user_ids if not self._pending.get(user_id)]
+        result = {"loans": [], "has_debt": []}
+        if eligible:
+            result = await self.repo.record_transfers(eligible, amount)
+            for row in result["loans"]:
+                self._inserted(row)
+        return {"loans": result["loans"], "has_debt": debtors + list(result["has_debt"])}
+
+    async def get_balance(self, user_id):
+        return await self.repo.get_balance(user_id)
+
+    async def page(self, *, status=None, after=None, before=None, limit=15, user_id=None, since=None, until=None):
+        if status == 'pending':
+            # หน้าของหนี้ค้างตัดจากแคชได้เลย
+            rows = filter_rows(await self.list_pending(), time_column="created_at", user_id=user_id, since=since, until=until)
+            return page_rows(rows, after=after, before=before, limit=limit)
+        return await self.repo.page(
+            status=status, after=after, before=before, limit=limit, user_id=user_id, since=since, until=until,
+        )
+
+    async def page_payments(self, *, after=None, limit=500, user_id=None, since=None, until=None):
+        return await self.repo.page_payments(after=after, limit=limit, user_id=user_id, since=since, until=until)
+
+    async def aggregates(self):
+        # ดึงจากฐานข้อมูล (loan_stats) เมื่อเกิน TTL แล้วปรับเองทุกครั้งที่บอท insert/เปลี่ยนสถานะ
+        # ระหว่างนั้นดอกเบี้ยรวมคิดต่อจากเงินต้นคงค้างรวม — ไม่ต้องวนหนี้ค้างทั้งหมดทุกครั้งที่เรียก
+        if self._totals is None or time.monotonic() - self._totals_at >= self.ttl:
+            totals = await self.repo.aggregates()
+            self._totals = {key: value for key, value in totals.items() if key != "high_interest"}
+            self._totals_at = time.monotonic()
+            self._accrued_at = datetime.datetime.now(datetime.timezone.utc)
+            # เรียงครั้งเดียวต่อรอบ TTL แล้วคืนแค่หัวแถว (high_interest_limit รายการ)
+            ranked = sorted(compute_batch(totals["high_interest"]), key=lambda row: row[2], reverse=True)
+            self._high = {row[0]['id']: dict(row[0]) for row in ranked}
+        self._accrue(datetime.datetime.now(datetime.timezone.utc))
+        return {
+            **self._totals,
+            "pending_interest": round_credits(self._totals["pending_interest"]),
+            "high_interest": list(itertools.islice(self._high.values(), self.high_interest_limit)),
+            "high_interest_count": len(self._high),
+        }
+
+    async def get_alert_states(self):
+        return await self.repo.get_alert_states()
+
+    async def record_alert(self, loan_id, tier):
+        await self.repo.record_alert(loan_id, tier)
+
+    async def close(self):
+        await self.repo.close()
@@ -0,0 +1,632 @@
+# loan_repository.py
+# จุดเดียวสำหรับอ่าน/เขียนตาราง loans
+# - SupabaseLoanRepository: เรียก supabase (sync) ใน thread pool จะได้ไม่บล็อก event loop
+# - MemoryLoanRepository: เก็บข้อมูลในหน่วยความจำ ใช้ทดสอบ/load test แบบ offline
+
+import asyncio
+import contextlib
+import datetime
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from interest import accrual_basis, accrued_interest, compute_batch, parse_created_at, round_credits
+from metrics import observe_dependency
+
+
+class LoanRepository:
+    """API กลางของตาราง loans — ทุก method เป็น async และคืนค่าเป็น list/dict ธรรมดา"""
+
+    async def get_pending_for_user(self, user_id):
+        raise NotImplementedError
+
+    async def list_pending(self):
+        raise NotImplementedError
+
+    async def list_for_user(self, user_id):
+        raise NotImplementedError
+
+    async def list_all(self):
+        raise NotImplementedError
+
+    async def insert(self, loan_data):
+        """เพิ่มรายการใหม่ คืนแถวที่บันทึกแล้ว (มี id)"""
+        raise NotImplementedError
+
+    async def mark_status(self, user_id, status, *, from_status="pending"):
+        """เปลี่ยนสถานะทุกรายการของ user ที่อยู่ใน from_status คืนแถวที่ถูกเปลี่ยน"""
+        raise NotImplementedError
+
+    async def page(self, *, status=None, after=None, before=None, limit=15, user_id=None, since=None, until=None):
+        """ดึงทีละหน้าแบบ keyset เรียงตาม (created_at, id)
+
+        after/before คือ cursor (created_at, id) ของแถวขอบหน้า ผลลัพธ์เรียงจากเก่าไปใหม่เสมอ
+        ถ้าใช้ before จะได้ limit แถวที่อยู่ติดก่อน cursor
+        since/until (ISO timestamp) กรอง created_at ในช่วง [since, until)"""
+        raise NotImplementedError
+
+    async def page_payments(self, *, after=None, limit=500, user_id=None, since=None, until=None):
+        """ดึงตาราง payments ทีละหน้า เรียงตาม (paid_at, id) — after คือ cursor (paid_at, id)"""
+        raise NotImplementedError
+
+    async def aggregates(self):
+        """สถิติรวม: total_count, total_amount, pending_count, pending_amount, pending_interest
+        และ high_interest (รายการ pending ที่ดอกเบี้ยเกินเงินต้นแล้ว)"""
+        raise NotImplementedError
+
+    async def claim_announcement(self, announcement_id, user_id, amount):
+        """ให้สิทธิ์กู้จากประกาศกับคนแรกที่กด (ตัดสินแบบ atomic ที่ฐานข้อมูล)
+
+        คืน {"status": "claimed", "loan": row} / {"status": "taken", "user_id": ผู้ได้สิทธิ์}
+        / {"status": "has_debt"}"""
+        raise NotImplementedError
+
+    async def get_balance(self, user_id):
+        """snapshot ยอดของ user จาก user_balances (แถวเดียว) — ไม่มีแถวคืนค่าศูนย์ทั้งหมด"""
+        raise NotImplementedError
+
+    async def record_repayment(self, user_id, amount=None):
+        """ชำระหนี้ (amount None = ทั้งหมด) ตัดดอกเบี้ยก่อนเงินต้น เริ่มจากรายการเก่าสุด
+
+        คืน {"status": "paid" | "partial", "paid", "principal", "interest", "unapplied",
+        "loans": แถวที่ถูกเปลี่ยน} หรือ {"status": "no_debt"}"""
+        raise NotImplementedError
+
+    async def record_transfer(self, user_id, amount):
+        """โอนเครดิตให้ user ที่ไม่มีหนี้ค้าง คืน {"status": "ok", "loan": row} / {"status": "has_debt"}"""
+        raise NotImplementedError
+
+    async def clear_debts(self, user_ids):
+        """ล้างหนี้ค้างของหลายคนในครั้งเดียว คืนแถวที่ถูกเปลี่ยนเป็น cleared"""
+        raise NotImplementedError
+
+    async def record_transfers(self, user_ids, amount):
+        """โอนเครดิตเท่ากันให้หลายคนในครั้งเดียว (ข้ามคนที่มีหนี้ค้าง)
+
+        คืน {"loans": รายการโอนที่บันทึกแล้ว, "has_debt": user_id ที่ถูกข้าม}"""
+        raise NotImplementedError
+
+    async def get_alert_states(self):
+        """tier ที่แจ้งเตือนไปแล้วของหนี้ที่ยังค้าง: {loan_id: tier}"""
+        raise NotImplementedError
+
+    async def record_alert(self, loan_id, tier):
+        """บันทึกว่าแจ้งเตือนรายการนี้ถึง tier นี้แล้ว"""
+        raise NotImplementedError
+
+    async def apply_journal(self, entries):
+        """เขียนรายการจาก journal ของโหมด write-behind ตามลำดับ (ดู journal.py)
+
+        entry = {"op_id", "op", "created", "updated", "payments", "alerts"} — op_id เดิมซ้ำได้ไม่เขียนซ้ำ
+        คืน [{"op_id", "status": "applied" | "duplicate" | "conflict", "error"?}] ตามลำดับเดียวกัน"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+def summarize(rows):
+    """คำนวณ aggregates จากแถวในหน่วยความจำ (ผลเหมือนฟังก์ชัน loan_stats ใน schema.sql)"""
+    total_count = 0
+    total_amount = 0
+    pending = []
+    for loan in rows:
+        total_count += 1
+        total_amount += loan['amount']
+        if loan['status'] == 'pending':
+            pending.append(loan)
+    batch = compute_batch(pending)
+    return {
+        "total_count": total_count,
+        "total_amount": total_amount,
+        "pending_count": len(pending),
+        "pending_amount": sum(batch.principal),
+        "pending_interest": batch.total_interest(),
+        "high_interest": [dict(row[0]) for row in batch.high_interest()],
+    }
+
+
+BALANCE_TOTALS = ("loan_count", "total_borrowed", "total_repaid", "total_interest_paid", "total_transferred", "total_cleared")
+
+
+def empty_balance(user_id):
+    return {
+        "user_id": user_id,
+        "principal_due": 0,
+        "interest_carried": 0,
+        "accrued_at": None,
+        "pending_count": 0,
+        **{key: 0 for key in BALANCE_TOTALS},
+    }
+
+
+def pending_balance(pending, now):
+    """ส่วนหนี้ค้างของ user_balances คำนวณจากแถว pending ของ user (เหมือน sync_user_balance())"""
+    return {
+        "principal_due": sum(accrual_basis(row)[0] for row in pending),
+        "interest_carried": sum(accrued_interest(*accrual_basis(row), now) for row in pending),
+        "accrued_at": now.isoformat(),
+        "pending_count": len(pending),
+    }
+
+
+def cursor_of(loan):
+    return (str(loan['created_at']), str(loan['id']))
+
+
+def payment_cursor_of(payment):
+    return (str(payment['paid_at']), str(payment['id']))
+
+
+def page_rows(rows, *, after=None, before=None, limit=15, key=cursor_of):
+    """keyset pagination สำหรับแถวในหน่วยความจำ (ใช้กติกาเดียวกับ LoanRepository.page)"""
+    rows = sorted(rows, key=key)
+    if after is not None:
+        rows = [row for row in rows if key(row) > tuple(after)]
+        return rows[:limit]
+    if before is not None:
+        rows = [row for row in rows if key(row) < tuple(before)]
+        return rows[-limit:]
+    return rows[:limit]
+
+
+def filter_rows(rows, *, time_column, user_id=None, since=None, until=None):
+    """กรองแถวในหน่วยความจำแบบเดียวกับ user_id / since / until ของ page"""
+    # เทียบเป็นไมโครวินาที (แปลงด้วย parse_created_at ตัวเดียวกับการคิดดอกเบี้ย)
+    since = parse_created_at(str(since)) if since else None
+    until = parse_created_at(str(until)) if until else None
+    result = []
+    for row in rows:
+        if user_id is not None and row['user_id'] != user_id:
+            continue
+        if since is not None or until is not None:
+            at = parse_created_at(str(row[time_column]))
+            if at is None or since is not None and at < since or until is not None and at >= until:
+                continue
+        result.append(row)
+    return result
+
+
+class SupabaseLoanRepository(LoanRepository):
+    def __init__(self, client, *, max_workers=8):
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="supabase")
+        self.last_success = None  # time.time() ของ query ล่าสุดที่สำเร็จ (ใช้ใน health check)
+
+    async def _execute(self, op, build_query):
+        # supabase-py เป็น sync ทั้งหมด จึงรันใน thread pool
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            response = await loop.run_in_executor(self._executor, lambda: build_query().execute())
+        except Exception:
+            observe_dependency("supabase", op, time.perf_counter() - start, ok=False)
+            raise
+        observe_dependency("supabase", op, time.perf_counter() - start)
+        self.last_success = time.time()
+        return response.data or []
+
+    def _loans(self):
+        return self.client.table("loans")
+
+    async def get_pending_for_user(self, user_id):
+        return await self._execute(
+            "get_pending_for_user",
+            lambda: self._loans().select("*").eq("user_id", user_id).eq("status", "pending")
+        )
+
+    async def list_pending(self):
+        return await self._execute("list_pending", lambda: self._loans().select("*").eq("status", "pending"))
+
+    async def list_for_user(self, user_id):
+        return await self._execute("list_for_user", lambda: self._loans().select("*").eq("user_id", user_id))
+
+    async def list_all(self):
+        return await self._execute("list_all", lambda: self._loans().select("*"))
+
+    async def insert(self, loan_data):
+        rows = await self._execute("insert", lambda: self._loans().insert(loan_data))
+        return rows[0] if rows else dict(loan_data)
+
+    async def mark_status(self, user_id, status, *, from_status="pending"):
+        return await self._execute(
+            "mark_status",
+            lambda: self._loans().update({"status": status}).eq("user_id", user_id).eq("status", from_status)
+        )
+
+    def _keyset(self, table, time_column, *, after, before, limit, filters):
+        cursor = after if after is not None else before
+        descending = after is None and before is not None
+
+        def build_query():
+            query = self.client.table(table).select("*")
+            for column, value in filters.get("eq", {}).items():
+                if value is not None:
+                    query = query.eq(column, value)
+            if filters.get("since"):
+                query = query.gte(time_column, filters["since"])
+            if filters.get("until"):
+                query = query.lt(time_column, filters["until"])
+            if cursor is not None:
+                op = "lt" if descending else "gt"
+                at, row_id = cursor
+                query = query.or_(
+                    f'{time_column}.{op}."{at}",'
+                    f'and({time_column}.eq."{at}",id.{op}.{row_id})'
+                )
+            return query.order(time_column, desc=descending).order("id", desc=descending).limit(limit)
+
+        return build_query, descending
+
+    async def page(self, *, status=None, after=None, before=None, limit=15, user_id=None, since=None, until=None):
+        build_query, descending = self._keyset(
+            "loans", "created_at", after=after, before=before, limit=limit,
+            filters={"eq": {"status": status or None, "user_id": user_id}, "since": since, "until": until},
+        )
+        rows = await self._execute("page", build_query)
+        if descending:
+            rows.reverse()
+        return rows
+
+    async def page_payments(self, *, after=None, limit=500, user_id=None, since=None, until=None):
+        build_query, _ = self._keyset(
+            "payments", "paid_at", after=after, before=None, limit=limit,
+            filters={"eq": {"user_id": user_id}, "since": since, "until": until},
+        )
+        return await self._execute("page_payments", build_query)
+
+    async def aggregates(self):
+        # คำนวณฝั่งฐานข้อมูล (ดูฟังก์ชัน loan_stats ใน schema.sql)
+        return await self._execute("aggregates", lambda: self.client.rpc("loan_stats", {}))
+
+    async def claim_announcement(self, announcement_id, user_id, amount):
+        # ดูฟังก์ชัน claim_announcement ใน migrations/003_loan_claims.sql
+        return await self._execute(
+            "claim_announcement",
+            lambda: self.client.rpc("claim_announcement", {
+                "p_announcement_id": announcement_id,
+                "p_user_id": user_id,
+                "p_amount": amount,
+            })
+        )
+
+    async def get_balance(self, user_id):
+        rows = await self._execute(
+            "get_balance",
+            lambda: self.client.table("user_balances").select("*").eq("user_id", user_id).limit(1)
+        )
+        return rows[0] if rows else empty_balance(user_id)
+
+    async def record_repayment(self, user_id, amount=None):
+        # ดูฟังก์ชัน record_repayment ใน migrations/004_payments_ledger.sql
+        return await self._execute(
+            "record_repayment",
+            lambda: self.client.rpc("record_repayment", {"p_user_id": user_id, "p_amount": amount})
+        )
+
+    async def record_transfer(self, user_id, amount):
+        return await self._execute(
+            "record_transfer",
+            lambda: self.client.rpc("record_transfer", {"p_user_id": user_id, "p_amount": amount})
+        )
+
+    async def clear_debts(self, user_ids):
+        # ดูฟังก์ชัน clear_debts / record_transfers ใน migrations/005_bulk_admin.sql
+        return await self._execute(
+            "clear_debts",
+            lambda: self.client.rpc("clear_debts", {"p_user_ids": list(user_ids)})
+        )
+
+    async def record_transfers(self, user_ids, amount):
+        return await self._execute(
+            "record_transfers",
+            lambda: self.client.rpc("record_transfers", {"p_user_ids": list(user_ids), "p_amount": amount})
+        )
+
+    async def get_alert_states(self):
+        rows = await self._execute(
+            "get_alert_states",
+            lambda: self.client.table("loan_alerts")
+            .select("loan_id,tier,loans!inner(status)")
+            .eq("loans.status", "pending")
+        )
+        return {row['loan_id']: row['tier'] for row in rows}
+
+    async def record_alert(self, loan_id, tier):
+        await self._execute(
+            "record_alert",
+            lambda: self.client.table("loan_alerts").upsert({
+                "loan_id": loan_id,
+                "tier": tier,
+                "last_alerted_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            })
+        )
+
+    async def apply_journal(self, entries):
+        # ดูฟังก์ชัน apply_journal ใน migrations/007_write_behind.sql
+        return await self._execute(
+            "apply_journal",
+            lambda: self.client.rpc("apply_journal", {"p_entries": list(entries)})
+        )
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class MemoryLoanRepository(LoanRepository):
+    """ทำงานเหมือนตารางและ trigger ใน migrations/ (user_balances อัปเดตทุกครั้งที่เขียน)"""
+
+    def __init__(self, rows=None):
+        self._rows = {}
+        self._alerts = {}
+        self._payments = []
+        self._balances = {}
+        self._applied_ops = set()
+        for row in rows or []:
+            self._store(row, sync=False)
+        self._rebuild_balances()
+
+    def _store(self, loan_data, *, sync=True):
+        row = {
+            "id": str(uuid.uuid4()),
+            "created_at": _now().isoformat(),
+            "status": "pending",
+            "interest": 0,
+            "principal_due": None,
+            "interest_carried": 0,
+            "accrued_at": None,
+        }
+        row.update(loan_data)
+        self._rows[row["id"]] = row
+        if sync and row["status"] == "pending":
+            self._sync_balance(row["user_id"], loan_count=1, total_borrowed=row["amount"])
+        return dict(row)
+
+    def _sync_balance(self, user_id, pending=None, **totals):
+        # เหมือน sync_user_balance(): คำนวณส่วนหนี้ค้างใหม่ แล้วบวกยอดรวมตลอดอายุ
+        balance = self._balances.setdefault(user_id, empty_balance(user_id))
+        if pending is None:
+            pending = self._select(user_id=user_id, status="pending")
+        balance.update(pending_balance(pending, _now()))
+        for key, value in totals.items():
+            balance[key] += value
+
+    def _rebuild_balances(self):
+        # เหมือนการเติมข้อมูลเก่าใน 004_payments_ledger.sql
+        self._balances = {}
+        by_user = {}
+        for row in self._rows.values():
+            by_user.setdefault(row["user_id"], []).append(row)
+        for user_id, rows in by_user.items():
+            self._sync_balance(
+                user_id,
+                [row for row in rows if row["status"] == "pending"],
+                loan_count=len(rows),
+                total_borrowed=sum(row["amount"] for row in rows),
+                total_repaid=sum(row["amount"] for row in rows if row["status"] == "completed"),
+                total_cleared=sum(row["amount"] for row in rows if row["status"] == "cleared"),
+            )
+
+    def _pay(self, loan, user_id, amount, *, principal=0, interest=0, kind="repayment"):
+        return self._add_payment({
+            "id": str(uuid.uuid4()),
+            "loan_id": loan["id"],
+            "user_id": user_id,
+            "paid_at": _now().isoformat(),
+            "amount": amount,
+            "principal": principal,
+            "interest": interest,
+            "kind": kind,
+        })
+
+    @contextlib.contextmanager
+    def track_changes(self, user_ids):
+        """เก็บสิ่งที่เขียนระหว่างอยู่ใน with — ออกจาก with แล้ว dict ที่ได้มีสองคีย์
+
+        "payments" = แถว payments ที่เพิ่มขึ้น, "balances" = {user_id: {ยอดรวมตลอดอายุ: ส่วนต่าง}}
+        (ใช้กับโหมด write-behind ที่ต้องส่งผลของแต่ละคำสั่งไปฐานข้อมูลทีหลัง)"""
+        before = {user_id: dict(self._balances.get(user_id) or empty_balance(user_id)) for user_id in user_ids}
+        paid_from = len(self._payments)
+        changes = {}
+        yield changes
+        changes["payments"] = [dict(payment) for payment in self._payments[paid_from:]]
+        changes["balances"] = {}
+        for user_id, old in before.items():
+            new = self._balances.get(user_id) or empty_balance(user_id)
+            delta = {key: new[key] - old[key] for key in BALANCE_TOTALS if new[key] != old[key]}
+            if delta:
+                changes["balances"][user_id] = delta
+
+    def _add_payment(self, payment):
+        # เหมือน trigger payments_sync_balance
+        self._payments.append(payment)
+        if payment["kind"] == "transfer":
+            self._sync_balance(payment["user_id"], total_transferred=payment["amount"])
+        else:
+            self._sync_balance(payment["user_id"], total_repaid=payment["amount"], total_interest_paid=payment["interest"] or 0)
+        return payment
+
+    def _select(self, **filters):
+        return [
+            dict(row) for row in self._rows.values()
+            if all(row.get(key) == value for key, value in filters.items())
+        ]
+
+    async def get_pending_for_user(self, user_id):
+        return self._select(user_id=user_id, status="pending")
+
+    async def list_pending(self):
+        return self._select(status="pending")
+
+    async def list_for_user(self, user_id):
+        return self._select(user_id=user_id)
+
+    async def list_all(self):
+        return self._select()
+
+    async def insert(self, loan_data):
+        return self._store(loan_data)
+
+    async def mark_status(self, user_id, status, *, from_status="pending"):
+        updated = []
+        cleared = 0
+        for row in self._rows.values():
+            if row["user_id"] == user_id and row["status"] == from_status:
+                if from_status == "pending" and status == "cleared":
+                    cleared += accrual_basis(row)[0]
+                row["status"] = status
+                updated.append(dict(row))
+        if updated and "pending" in (status, from_status):
+            self._sync_balance(user_id, total_cleared=cleared)
+        return updated
+
+    async def page(self, *, status=None, after=None, before=None, limit=15, user_id=None, since=None, until=None):
+        rows = self._select(status=status) if status else self._select()
+        rows = filter_rows(rows, time_column="created_at", user_id=user_id, since=since, until=until)
+        return page_rows(rows, after=after, before=before, limit=limit)
+
+    async def page_payments(self, *, after=None, limit=500, user_id=None, since=None, until=None):
+        rows = filter_rows(self._payments, time_column="paid_at", user_id=user_id, since=since, until=until)
+        return [dict(row) for row in page_rows(rows, after=after, limit=limit, key=payment_cursor_of)]
+
+    async def aggregates(self):
+        return summarize(self._rows.values())
+
+    async def claim_announcement(self, announcement_id, user_id, amount):
+        winner = self._select(announcement_id=announcement_id)
+        if winner:
+            return {"status": "taken", "user_id": winner[0]["user_id"]}
+        if self._select(user_id=user_id, status="pending"):
+            return {"status": "has_debt"}
+        loan = self._store({
+            "user_id": user_id,
+            "amount": amount,
+            "status": "pending",
+            "announcement_id": announcement_id,
+        })
+        return {"status": "claimed", "loan": loan}
+
+    async def get_balance(self, user_id):
+        return dict(self._balances.get(user_id) or empty_balance(user_id))
+
+    async def record_repayment(self, user_id, amount=None):
+        now = _now()
+        pending = sorted(
+            (row for row in self._rows.values() if row["user_id"] == user_id and row["status"] == "pending"),
+            key=cursor_of,
+        )
+        remaining = amount
+        changed = []
+        paid_principal = paid_interest = 0
+        for loan in pending:
+            if remaining is not None and remaining <= 0:
+                break
+            principal, carried, since = accrual_basis(loan)
+            due_interest = round_credits(accrued_interest(principal, carried, since, now))
+            pay_interest = due_interest if remaining is None else min(remaining, due_interest)
+            if remaining is not None:
+                remaining -= pay_interest
+            pay_principal = principal if remaining is None else min(remaining, principal)
+            if remaining is not None:
+                remaining -= pay_principal
+
+            if pay_principal >= principal:
+                loan.update(status="completed", principal_due=0, interest_carried=0)
+            else:
+                loan.update(principal_due=principal - pay_principal, interest_carried=due_interest - pay_interest)
+            loan["accrued_at"] = now.isoformat()
+            changed.append(dict(loan))
+            self._pay(loan, user_id, pay_principal + pay_interest, principal=pay_principal, interest=pay_interest)
+            paid_principal += pay_principal
+            paid_interest += pay_interest
+
+        if not changed:
+            return {"status": "no_debt"}
+        still_pending = any(row["user_id"] == user_id and row["status"] == "pending" for row in self._rows.values())
+        return {
+            "status": "partial" if still_pending else "paid",
+            "paid": paid_principal + paid_interest,
+            "principal": paid_principal,
+            "interest": paid_interest,
+            "unapplied": max(remaining or 0, 0),
+            "loans": changed,
+        }
+
+    async def record_transfer(self, user_id, amount):
+        if self._select(user_id=user_id, status="pending"):
+            return {"status": "has_debt"}
+        loan = self._store({"user_id": user_id, "amount": amount, "status": "completed"})
+        self._pay(loan, user_id, amount, kind="transfer")
+        return {"status": "ok", "loan": loan}
+
+    async def clear_debts(self, user_ids):
+        cleared = []
+        for user_id in dict.fromkeys(user_ids):
+            cleared.extend(await self.mark_status(user_id, "cleared"))
+        return cleared
+
+    async def record_transfers(self, user_ids, amount):
+        user_ids = list(dict.fromkeys(user_ids))
+        debtors = {row["user_id"] for row in self._rows.values() if row["status"] == "pending"}
+        loans = []
+        for user_id in user_ids:
+            if user_id not in debtors:
+                loan = self._store({"user_id": user_id, "amount": amount, "status": "completed"})
+                self._pay(loan, user_id, amount, kind="transfer")
+                loans.append(loan)
+        return {"loans": loans, "has_debt": [user_id for user_id in user_ids if user_id in debtors]}
+
+    async def get_alert_states(self):
+        return {
+            loan_id: tier for loan_id, tier in self._alerts.items()
+            if self._rows.get(loan_id, {}).get("status") == "pending"
+        }
+
+    async def record_alert(self, loan_id, tier):
+        self._alerts[loan_id] = tier
+
+    async def apply_journal(self, entries):
+        # เหมือน apply_journal() ใน migrations/007_write_behind.sql
+        results = []
+        for entry in entries:
+            if entry["op_id"] in self._applied_ops:
+                results.append({"op_id": entry["op_id"], "status": "duplicate"})
+                continue
+            error = self._journal_conflict(entry)
+            if error:
+                results.append({"op_id": entry["op_id"], "status": "conflict", "error": error})
+                continue
+            for row in entry["created"]:
+                self._store(row)
+            for row in entry["updated"]:
+                loan = self._rows[row["id"]]
+                cleared = accrual_basis(loan)[0] if loan["status"] == "pending" and row["status"] == "cleared" else 0
+                was_pending = loan["status"] == "pending"
+                for key in ("status", "principal_due", "interest_carried", "accrued_at"):
+                    loan[key] = row.get(key)
+                if was_pending or loan["status"] == "pending":
+                    self._sync_balance(loan["user_id"], total_cleared=cleared)
+            known = {payment["id"] for payment in self._payments}
+            for payment in entry["payments"]:
+                if payment["id"] not in known:
+                    self._add_payment(dict(payment))
+            for alert in entry["alerts"]:
+                self._alerts[alert["loan_id"]] = alert["tier"]
+            self._applied_ops.add(entry["op_id"])
+            results.append({"op_id": entry["op_id"], "status": "applied"})
+        return results
+
+    def _journal_conflict(self, entry):
+        for row in entry["created"]:
+            if row["id"] in self._rows:
+                return f"loan {row['id']} already exists"
+            if row.get("announcement_id") is not None and self._select(announcement_id=row["announcement_id"]):
+                return f"announcement {row['announcement_id']} already claimed"
+        for row in entry["updated"]:
+            if row["id"] not in self._rows:
+                return f"loan {row['id']} not found"
+        return None
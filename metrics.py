@@ -0,0 +1,242 @@
+# metrics.py
+# วัดเวลาของคำสั่ง / ปุ่ม และการเรียก dependency (Supabase, Together AI) ภายในโปรเซส
+# - InstrumentedTree: CommandTree ที่จับเวลาทุก slash command ผ่าน hook ที่ discord.py มีให้
+#   (interaction_check → เริ่ม, on_app_command_completion / on_error → จบ)
+# - InstrumentedView: View ที่ห่อ callback ของปุ่ม/ไอเท็มทุกตัว
+# - instrument_dynamic_items(): ห่อ callback ของปุ่มถาวร (DynamicItem)
+# - time-to-ack: discord.py ไม่มี hook ตอนตอบรับ จึงดู interaction.response.is_done() เป็นระยะ
+#   (ทุก ACK_POLL วินาที จนตอบหรือครบ ACK_DEADLINE) ไม่แก้คลาสของ discord.py
+# - observe_dependency(): บันทึกการเรียก dependency และนับเข้ากับคำสั่งที่กำลังรันอยู่
+# ค่าทั้งหมดเก็บเป็น histogram แบบ reservoir (เก็บตัวอย่างล่าสุด N ค่า) สำหรับคำนวณ p50/p95/p99
+
+import asyncio
+import contextvars
+import functools
+import time
+from collections import deque
+
+import discord
+from discord import app_commands
+
+QUANTILES = (0.5, 0.95, 0.99)
+ACK_POLL = 0.005
+ACK_DEADLINE = 3.0   # Discord ยกเลิก interaction ที่ไม่ตอบรับภายใน 3 วินาที
+
+
+class Histogram:
+    def __init__(self, size=2048):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def percentiles(self, quantiles=QUANTILES):
+        """คืน list ของค่าตาม quantile (nearest-rank) จากตัวอย่างที่เก็บไว้"""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return [None for _ in quantiles]
+        last = len(ordered) - 1
+        return [ordered[min(last, int(q * len(ordered)))] for q in quantiles]
+
+
+class Metrics:
+    def __init__(self, reservoir=2048):
+        self.reservoir = reservoir
+        self.histograms = {}   # (ชื่อ, labels) -> Histogram
+        self.counters = {}     # (ชื่อ, labels) -> ตัวเลข
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, value, /, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.reservoir)
+        histogram.observe(value)
+
+    def inc(self, name, value=1, /, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self):
+        self.histograms.clear()
+        self.counters.clear()
+
+    def summary(self, name):
+        """คืน list ของ (labels, count, p50, p95, p99) ของ histogram ชื่อนี้ เรียงจากช้าสุด"""
+        rows = []
+        for (key_name, labels), histogram in self.histograms.items():
+            if key_name == name:
+                rows.append((dict(labels), histogram.count, *histogram.percentiles()))
+        rows.sort(key=lambda row: row[-1] or 0, reverse=True)
+        return rows
+
+    def samples(self):
+        """แปลงเป็น (ชื่อ, ค่า, labels) สำหรับ HealthServer.add_metrics (Prometheus summary)"""
+        samples = []
+        for (name, labels), histogram in self.histograms.items():
+            labels = dict(labels)
+            for quantile, value in zip(QUANTILES, histogram.percentiles()):
+                if value is not None:
+                    samples.append((f"bot_{name}", value, {**labels, "quantile": str(quantile)}))
+            samples.append((f"bot_{name}_count", histogram.count, labels))
+            samples.append((f"bot_{name}_sum", histogram.total, labels))
+        for (name, labels), value in self.counters.items():
+            samples.append((f"bot_{name}", value, dict(labels)))
+        return samples
+
+
+registry = Metrics()
+
+
+class CallRecord:
+    """ข้อมูลของ interaction ที่กำลังรัน (อยู่ใน contextvar ของ task นั้น)"""
+
+    __slots__ = ("kind", "name", "started", "acked", "dependencies", "interaction", "watcher")
+
+    def __init__(self, kind, name, interaction=None):
+        self.kind = kind
+        self.name = name
+        self.started = time.perf_counter()
+        self.acked = None
+        self.dependencies = {}   # dependency -> [จำนวนครั้ง, วินาทีรวม]
+        self.interaction = interaction
+        self.watcher = None
+        if interaction is not None:
+            self.watcher = asyncio.get_running_loop().create_task(self._watch_ack())
+
+    async def _watch_ack(self):
+        deadline = self.started + ACK_DEADLINE
+        while not self.interaction.response.is_done():
+            if time.perf_counter() >= deadline:
+                return
+            await asyncio.sleep(ACK_POLL)
+        self.acked = time.perf_counter()
+
+    def finish(self, status):
+        if self.watcher is not None:
+            self.watcher.cancel()
+            # ตอบรับระหว่างรอบ poll สุดท้าย
+            if self.acked is None and self.interaction.response.is_done():
+                self.acked = time.perf_counter()
+        kind, name = self.kind, self.name
+        elapsed = time.perf_counter() - self.started
+        registry.observe("interaction_complete_seconds", elapsed, kind=kind, name=name)
+        if self.acked is not None:
+            registry.observe("interaction_ack_seconds", self.acked - self.started, kind=kind, name=name)
+        registry.inc("interactions_total", kind=kind, name=name, status=status)
+        for dependency, (count, seconds) in self.dependencies.items():
+            registry.observe("interaction_dependency_calls", count, name=name, dependency=dependency)
+            registry.observe("interaction_dependency_seconds", seconds, name=name, dependency=dependency)
+
+
+_current = contextvars.ContextVar("metrics_call", default=None)
+
+
+def observe_dependency(dependency, op, seconds, *, ok=True):
+    registry.observe("dependency_seconds", seconds, dependency=dependency, op=op)
+    if not ok:
+        registry.inc("dependency_errors_total", dependency=dependency, op=op)
+    record = _current.get()
+    if record is not None:
+        stats = record.dependencies.setdefault(dependency, [0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+
+
+async def _run(kind, name, callback, *args, **kwargs):
+    interaction = next((arg for arg in args if isinstance(arg, discord.Interaction)), None)
+    record = CallRecord(kind, name, interaction)
+    token = _current.set(record)
+    status = "ok"
+    try:
+        return await callback(*args, **kwargs)
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        _current.reset(token)
+        record.finish(status)
+
+
+def instrumented(kind, name, callback):
+    if getattr(callback, "__instrumented__", False):
+        return callback
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        return await _run(kind, name, callback, *args, **kwargs)
+
+    wrapper.__instrumented__ = True
+    return wrapper
+
+
+class InstrumentedTree(app_commands.CommandTree):
+    """ใช้เป็น tree_cls ของ Bot — client ต้องมี add_listener (commands.Bot)"""
+
+    def __init__(self, client, *args, **kwargs):
+        super().__init__(client, *args, **kwargs)
+        client.add_listener(self._completed, "on_app_command_completion")
+
+    async def interaction_check(self, interaction):
+        if interaction.type is discord.InteractionType.application_command:
+            command = interaction.command
+            record = CallRecord("command", command.qualified_name if command else "unknown", interaction)
+            interaction.extras["metrics_call"] = record
+            # interaction_check รันใน task เดียวกับคำสั่ง dependency ที่เรียกระหว่างนั้นจึงนับเข้าคำสั่งนี้
+            _current.set(record)
+        return True
+
+    @staticmethod
+    def _finish(interaction, status):
+        record = interaction.extras.pop("metrics_call", None)
+        if record is not None:
+            record.finish(status)
+
+    async def _completed(self, interaction, command):
+        self._finish(interaction, "ok")
+
+    async def on_error(self, interaction, error):
+        self._finish(interaction, "error")
+        await super().on_error(interaction, error)
+
+
+def instrument_item(item, prefix):
+    callback = item.callback
+    raw = getattr(callback, "callback", callback)
+    name = getattr(raw, "__name__", "callback")
+    if name == "callback":
+        # Button ที่ override callback เอง ใช้ชื่อคลาสแทน
+        name = type(item).__name__
+    item.callback = instrumented("component", f"{prefix}.{name}", callback)
+    return item
+
+
+def instrument_dynamic_items(*classes):
+    """ห่อ callback ของคลาส DynamicItem (ปุ่มถาวรที่ discord.py สร้างจาก custom_id เอง)"""
+    for cls in classes:
+        cls.callback = instrumented("component", cls.__name__, cls.callback)
+    return classes
+
+
+class InstrumentedView(discord.ui.View):
+    """View ที่จับเวลา callback ของไอเท็มทุกตัว (รวมที่เพิ่มทีหลังด้วย add_item)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for item in self.children:
+            instrument_item(item, type(self).__name__)
+
+    def add_item(self, item):
+        instrument_item(item, type(self).__name__)
+        return super().add_item(item)
+
+
+def format_ms(value):
+    return "-" if value is None else f"{value * 1000:.0f}"
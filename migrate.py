@@ -0,0 +1,115 @@
+# migrate.py
+# ตัวรัน migration ของฐานข้อมูล (Postgres ของ Supabase หรือ Postgres ในเครื่อง)
+#
+#   python migrate.py                 # รัน migration ที่ยังไม่เคยรัน
+#   python migrate.py --status        # ดูว่ารันอะไรไปแล้วบ้าง
+#   python migrate.py --with-schema   # ฐานข้อมูลใหม่: สร้างตารางจาก schema.sql ก่อน
+#
+# ต้องตั้ง DATABASE_URL (connection string ของ Postgres) และติดตั้ง psycopg:
+#   pip install "psycopg[binary]"   (หรือ pip install -r requirements-optional.txt)
+# ไฟล์ใน migrations/ ตั้งชื่อเป็น <เลขเวอร์ชัน>_<คำอธิบาย>.sql และรันตามลำดับเลข
+
+import argparse
+import os
+import pathlib
+import sys
+
+from dotenv import load_dotenv
+
+ROOT = pathlib.Path(__file__).resolve().parent
+MIGRATIONS_DIR = ROOT / "migrations"
+SCHEMA_FILE = ROOT / "schema.sql"
+
+
+def connect(url):
+    try:
+        import psycopg
+    except ImportError:
+        sys.exit('ต้องติดตั้ง psycopg ก่อน: pip install "psycopg[binary]"')
+    return psycopg.connect(url)
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """คืน list ของ (version, name, sql) เรียงตามเวอร์ชัน"""
+    migrations = []
+    for path in sorted(directory.glob("*.sql")):
+        version = path.name.split("_", 1)[0]
+        migrations.append((version, path.name, path.read_text(encoding="utf-8")))
+    return migrations
+
+
+def ensure_table(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+          version text PRIMARY KEY,
+          name text NOT NULL,
+          applied_at timestamptz DEFAULT now()
+        )
+        """
+    )
+    conn.commit()
+
+
+def applied_versions(conn):
+    ensure_table(conn)
+    rows = conn.execute("SELECT version FROM schema_migrations").fetchall()
+    return {row[0] for row in rows}
+
+
+def apply_schema(conn, path=SCHEMA_FILE):
+    conn.execute(path.read_text(encoding="utf-8"))
+    conn.commit()
+
+
+def apply_pending(conn, migrations=None, *, verbose=True):
+    """รัน migration ที่ยังไม่เคยรัน แต่ละไฟล์อยู่ใน transaction ของตัวเอง คืนจำนวนที่รัน"""
+    if migrations is None:
+        migrations = load_migrations()
+    done = applied_versions(conn)
+    count = 0
+    for version, name, sql in migrations:
+        if version in done:
+            continue
+        if verbose:
+            print(f"applying {name} ...")
+        try:
+            conn.execute(sql)
+            conn.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        count += 1
+    return count
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="รัน migration ของฐานข้อมูล")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--status", action="store_true", help="แสดงสถานะ migration")
+    parser.add_argument("--with-schema", action="store_true", help="รัน schema.sql ก่อน (ฐานข้อมูลใหม่)")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        sys.exit("กรุณาตั้ง DATABASE_URL หรือใส่ --database-url")
+
+    with connect(args.database_url) as conn:
+        if args.status:
+            done = applied_versions(conn)
+            for version, name, _ in load_migrations():
+                mark = "x" if version in done else " "
+                print(f"[{mark}] {name}")
+            return
+        if args.with_schema:
+            apply_schema(conn)
+        count = apply_pending(conn)
+        print(f"applied {count} migration(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+-- ดัชนีสำหรับ query ที่บอทใช้บ่อย (ก่อนหน้านี้ทุก query เป็น sequential scan)
+
+-- หนี้ค้างของ user: .eq("user_id", ...).eq("status", "pending")
+CREATE INDEX IF NOT EXISTS loans_user_id_status_idx ON loans (user_id, status);
+
+-- รายการหนี้ค้างทั้งหมด / หน้าของ /ยอดค้าง (เฉพาะแถว pending จึงเล็กมาก)
+CREATE INDEX IF NOT EXISTS loans_pending_created_at_idx ON loans (created_at, id) WHERE status = 'pending';
+
+-- keyset pagination ของ /ธุรกรรม เรียงตาม (created_at, id)
+CREATE INDEX IF NOT EXISTS loans_created_at_id_idx ON loans (created_at, id);
+
+-- payments.loan_id ต้องชี้ไปที่ loans จริง และต้องมีดัชนี
+ALTER TABLE payments
+  ADD CONSTRAINT payments_loan_id_fkey FOREIGN KEY (loan_id) REFERENCES loans (id);
+CREATE INDEX IF NOT EXISTS payments_loan_id_idx ON payments (loan_id);
+CREATE INDEX IF NOT EXISTS payments_user_id_paid_at_idx ON payments (user_id, paid_at);
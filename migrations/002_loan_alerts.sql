@@ -0,0 +1,8 @@
+-- สถานะการแจ้งเตือนดอกเบี้ยสูงของแต่ละรายการ
+-- tier = จำนวนเท่าของเงินต้นที่แจ้งเตือนไปแล้วล่าสุด (เช่น 1, 2, 5)
+-- บอทจะไม่แจ้งซ้ำใน tier เดิม แม้จะรีสตาร์ท
+CREATE TABLE IF NOT EXISTS loan_alerts (
+  loan_id uuid PRIMARY KEY REFERENCES loans (id) ON DELETE CASCADE,
+  tier integer NOT NULL,
+  last_alerted_at timestamptz NOT NULL DEFAULT now()
+);
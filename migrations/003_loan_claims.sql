@@ -0,0 +1,46 @@
+-- ประกาศปล่อยกู้แบบ "คนแรกที่กดได้สิทธิ์"
+-- แต่ละประกาศมีผู้ได้สิทธิ์ได้คนเดียว (unique index) และตัดสินใน round-trip เดียวผ่าน claim_announcement()
+ALTER TABLE loans ADD COLUMN IF NOT EXISTS announcement_id text;
+
+CREATE UNIQUE INDEX IF NOT EXISTS loans_announcement_id_key
+  ON loans (announcement_id)
+  WHERE announcement_id IS NOT NULL;
+
+-- คืน json:
+--   {"status": "claimed", "loan": {...}}      ได้สิทธิ์ (สร้างรายการ pending แล้ว)
+--   {"status": "taken", "user_id": "..."}     มีคนได้สิทธิ์ไปก่อนแล้ว
+--   {"status": "has_debt"}                    ผู้กดยังมีหนี้ค้าง
+CREATE OR REPLACE FUNCTION claim_announcement(p_announcement_id text, p_user_id text, p_amount numeric)
+RETURNS json
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  claimed loans;
+  winner text;
+BEGIN
+  -- กันคนเดียวกันกดหลายประกาศพร้อมกันจนมีหนี้ค้างสองรายการ
+  PERFORM pg_advisory_xact_lock(hashtext('loan_claim:' || p_user_id));
+
+  SELECT user_id INTO winner FROM loans WHERE announcement_id = p_announcement_id;
+  IF FOUND THEN
+    RETURN json_build_object('status', 'taken', 'user_id', winner);
+  END IF;
+
+  IF EXISTS (SELECT 1 FROM loans WHERE user_id = p_user_id AND status = 'pending') THEN
+    RETURN json_build_object('status', 'has_debt');
+  END IF;
+
+  -- ถ้ามีอีก transaction กำลัง insert ประกาศเดียวกันอยู่ จะรอจนอีกฝั่ง commit แล้วไม่ทำอะไร
+  INSERT INTO loans (user_id, amount, status, announcement_id)
+  VALUES (p_user_id, p_amount, 'pending', p_announcement_id)
+  ON CONFLICT (announcement_id) WHERE announcement_id IS NOT NULL DO NOTHING
+  RETURNING * INTO claimed;
+
+  IF claimed.id IS NULL THEN
+    SELECT user_id INTO winner FROM loans WHERE announcement_id = p_announcement_id;
+    RETURN json_build_object('status', 'taken', 'user_id', winner);
+  END IF;
+
+  RETURN json_build_object('status', 'claimed', 'loan', row_to_json(claimed));
+END;
+$$;
@@ -0,0 +1,279 @@
+-- สมุดบัญชี (ledger) + ยอดคงเหลือรายคน
+-- - payments: ทุกการชำระหนี้ (รวมชำระบางส่วน) และทุกการโอนเครดิต เป็นหนึ่งแถว
+-- - user_balances: snapshot ต่อคน (เงินต้นคงเหลือ, ดอกเบี้ยสะสม ณ เวลาล่าสุด, ยอดรวมตลอดอายุ)
+--   อัปเดตด้วย trigger ใน transaction เดียวกับการเขียน loans / payments
+--   /ประวัติ และ /ขอชำระหนี้ อ่านแถวเดียวจากตารางนี้แทนการไล่ทุกรายการของคนนั้น
+-- ดอกเบี้ยยังเป็น 10% ต่อชั่วโมง (ไม่ทบต้น) เหมือน interest.py
+
+-- ชำระบางส่วน: แต่ละรายการเก็บเงินต้นคงเหลือ + ดอกเบี้ยยกมา ณ เวลา accrued_at
+-- ดอกเบี้ยปัจจุบัน = interest_carried + principal_due × 0.1 × ชั่วโมงนับจาก accrued_at
+-- รายการที่ยังไม่เคยชำระบางส่วนมีค่า NULL = ใช้ amount / created_at ตามเดิม
+ALTER TABLE loans ADD COLUMN IF NOT EXISTS principal_due numeric;
+ALTER TABLE loans ADD COLUMN IF NOT EXISTS interest_carried numeric NOT NULL DEFAULT 0;
+ALTER TABLE loans ADD COLUMN IF NOT EXISTS accrued_at timestamptz;
+
+-- kind: repayment = ชำระหนี้, transfer = แอดมินโอนเครดิตให้ (loan_id ชี้ไปที่รายการโอน)
+ALTER TABLE payments ADD COLUMN IF NOT EXISTS kind text NOT NULL DEFAULT 'repayment'
+  CHECK (kind IN ('repayment', 'transfer'));
+ALTER TABLE payments ADD COLUMN IF NOT EXISTS principal numeric NOT NULL DEFAULT 0;
+ALTER TABLE payments ADD COLUMN IF NOT EXISTS interest numeric NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS user_balances (
+  user_id text PRIMARY KEY,
+  principal_due numeric NOT NULL DEFAULT 0,        -- เงินต้นค้างรวม
+  interest_carried numeric NOT NULL DEFAULT 0,     -- ดอกเบี้ยค้างรวม ณ accrued_at
+  accrued_at timestamptz NOT NULL DEFAULT now(),
+  pending_count integer NOT NULL DEFAULT 0,
+  loan_count integer NOT NULL DEFAULT 0,
+  total_borrowed numeric NOT NULL DEFAULT 0,
+  total_repaid numeric NOT NULL DEFAULT 0,         -- รวมดอกเบี้ยที่จ่ายแล้ว
+  total_interest_paid numeric NOT NULL DEFAULT 0,
+  total_transferred numeric NOT NULL DEFAULT 0,
+  total_cleared numeric NOT NULL DEFAULT 0,        -- เงินต้นที่แอดมินล้างให้
+  updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+-- คำนวณส่วนหนี้ค้างของ user ใหม่จากรายการ pending (ใช้ดัชนี loans_user_id_status_idx มีแค่ไม่กี่แถว)
+-- แล้วบวกยอดรวมตลอดอายุตามที่ส่งมา
+CREATE OR REPLACE FUNCTION sync_user_balance(
+  p_user_id text,
+  p_loans integer DEFAULT 0,
+  p_borrowed numeric DEFAULT 0,
+  p_repaid numeric DEFAULT 0,
+  p_interest_paid numeric DEFAULT 0,
+  p_transferred numeric DEFAULT 0,
+  p_cleared numeric DEFAULT 0
+)
+RETURNS void
+LANGUAGE sql
+AS $$
+  INSERT INTO user_balances AS b (
+    user_id, principal_due, interest_carried, accrued_at, pending_count,
+    loan_count, total_borrowed, total_repaid, total_interest_paid, total_transferred, total_cleared
+  )
+  SELECT
+    p_user_id,
+    coalesce(sum(coalesce(principal_due, amount)), 0),
+    coalesce(sum(
+      interest_carried
+      + coalesce(principal_due, amount) * 0.1 * abs(extract(epoch FROM now() - coalesce(accrued_at, created_at))) / 3600
+    ), 0),
+    now(),
+    count(*),
+    p_loans, p_borrowed, p_repaid, p_interest_paid, p_transferred, p_cleared
+  FROM loans
+  WHERE user_id = p_user_id AND status = 'pending'
+  ON CONFLICT (user_id) DO UPDATE SET
+    principal_due = excluded.principal_due,
+    interest_carried = excluded.interest_carried,
+    accrued_at = excluded.accrued_at,
+    pending_count = excluded.pending_count,
+    loan_count = b.loan_count + excluded.loan_count,
+    total_borrowed = b.total_borrowed + excluded.total_borrowed,
+    total_repaid = b.total_repaid + excluded.total_repaid,
+    total_interest_paid = b.total_interest_paid + excluded.total_interest_paid,
+    total_transferred = b.total_transferred + excluded.total_transferred,
+    total_cleared = b.total_cleared + excluded.total_cleared,
+    updated_at = now();
+$$;
+
+CREATE OR REPLACE FUNCTION loans_sync_balance()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    IF NEW.status = 'pending' THEN
+      PERFORM sync_user_balance(NEW.user_id, p_loans => 1, p_borrowed => NEW.amount);
+    END IF;
+  ELSIF OLD.status = 'pending' AND NEW.status = 'cleared' THEN
+    PERFORM sync_user_balance(NEW.user_id, p_cleared => coalesce(OLD.principal_due, OLD.amount));
+  ELSIF OLD.status = 'pending' OR NEW.status = 'pending' THEN
+    PERFORM sync_user_balance(NEW.user_id);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS loans_sync_balance ON loans;
+CREATE TRIGGER loans_sync_balance
+  AFTER INSERT OR UPDATE OF status, principal_due, interest_carried, accrued_at ON loans
+  FOR EACH ROW EXECUTE FUNCTION loans_sync_balance();
+
+CREATE OR REPLACE FUNCTION payments_sync_balance()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF NEW.kind = 'transfer' THEN
+    PERFORM sync_user_balance(NEW.user_id, p_transferred => NEW.amount);
+  ELSE
+    PERFORM sync_user_balance(NEW.user_id, p_repaid => NEW.amount, p_interest_paid => NEW.interest);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS payments_sync_balance ON payments;
+CREATE TRIGGER payments_sync_balance
+  AFTER INSERT ON payments
+  FOR EACH ROW EXECUTE FUNCTION payments_sync_balance();
+
+-- ข้อมูลเก่า: ก่อนหน้านี้ไม่มีการบันทึก payments และการโอนเครดิตเป็นรายการ completed
+-- ที่แยกจากหนี้ที่ชำระแล้วไม่ได้ จึงนับรายการ completed ทั้งหมดเป็น "กู้แล้วชำระคืน" (ไม่รวมดอกเบี้ย)
+INSERT INTO user_balances (
+  user_id, principal_due, interest_carried, accrued_at, pending_count,
+  loan_count, total_borrowed, total_repaid, total_cleared
+)
+SELECT
+  user_id,
+  coalesce(sum(amount) FILTER (WHERE status = 'pending'), 0),
+  coalesce(sum(amount * 0.1 * abs(extract(epoch FROM now() - created_at)) / 3600) FILTER (WHERE status = 'pending'), 0),
+  now(),
+  count(*) FILTER (WHERE status = 'pending'),
+  count(*),
+  coalesce(sum(amount), 0),
+  coalesce(sum(amount) FILTER (WHERE status = 'completed'), 0),
+  coalesce(sum(amount) FILTER (WHERE status = 'cleared'), 0)
+FROM loans
+WHERE user_id IS NOT NULL
+GROUP BY user_id
+ON CONFLICT (user_id) DO NOTHING;
+
+-- ชำระหนี้ของ user (p_amount NULL = ชำระทั้งหมด ณ ตอนนี้)
+-- ตัดดอกเบี้ยก่อนแล้วค่อยตัดเงินต้น เริ่มจากรายการเก่าสุด แต่ละรายการที่ถูกตัดได้ payments หนึ่งแถว
+-- คืน json:
+--   {"status": "paid" | "partial", "paid", "principal", "interest", "unapplied", "loans": [...]}
+--   {"status": "no_debt"}
+CREATE OR REPLACE FUNCTION record_repayment(p_user_id text, p_amount numeric DEFAULT NULL)
+RETURNS json
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  loan loans;
+  updated loans;
+  remaining numeric := p_amount;
+  principal numeric;
+  due_interest numeric;
+  pay_interest numeric;
+  pay_principal numeric;
+  paid_principal numeric := 0;
+  paid_interest numeric := 0;
+  changed json[] := '{}';
+BEGIN
+  -- lock เดียวกับ claim_announcement กันชำระพร้อมกับการกู้ใหม่ของคนเดียวกัน
+  PERFORM pg_advisory_xact_lock(hashtext('loan_claim:' || p_user_id));
+
+  FOR loan IN
+    SELECT * FROM loans
+    WHERE user_id = p_user_id AND status = 'pending'
+    ORDER BY created_at, id
+    FOR UPDATE
+  LOOP
+    EXIT WHEN remaining IS NOT NULL AND remaining <= 0;
+    principal := coalesce(loan.principal_due, loan.amount);
+    due_interest := round(
+      loan.interest_carried
+      + principal * 0.1 * abs(extract(epoch FROM now() - coalesce(loan.accrued_at, loan.created_at))) / 3600
+    );
+    pay_interest := CASE WHEN remaining IS NULL THEN due_interest ELSE least(remaining, due_interest) END;
+    remaining := remaining - pay_interest;
+    pay_principal := CASE WHEN remaining IS NULL THEN principal ELSE least(remaining, principal) END;
+    remaining := remaining - pay_principal;
+
+    IF pay_principal >= principal THEN
+      UPDATE loans
+      SET status = 'completed', principal_due = 0, interest_carried = 0, accrued_at = now()
+      WHERE id = loan.id
+      RETURNING * INTO updated;
+    ELSE
+      UPDATE loans
+      SET principal_due = principal - pay_principal,
+          interest_carried = due_interest - pay_interest,
+          accrued_at = now()
+      WHERE id = loan.id
+      RETURNING * INTO updated;
+    END IF;
+    changed := changed || row_to_json(updated);
+
+    INSERT INTO payments (loan_id, user_id, amount, principal, interest, kind)
+    VALUES (loan.id, p_user_id, pay_principal + pay_interest, pay_principal, pay_interest, 'repayment');
+    paid_principal := paid_principal + pay_principal;
+    paid_interest := paid_interest + pay_interest;
+  END LOOP;
+
+  IF array_length(changed, 1) IS NULL THEN
+    RETURN json_build_object('status', 'no_debt');
+  END IF;
+
+  RETURN json_build_object(
+    'status', CASE WHEN EXISTS (
+      SELECT 1 FROM loans WHERE user_id = p_user_id AND status = 'pending'
+    ) THEN 'partial' ELSE 'paid' END,
+    'paid', paid_principal + paid_interest,
+    'principal', paid_principal,
+    'interest', paid_interest,
+    'unapplied', greatest(coalesce(remaining, 0), 0),
+    'loans', array_to_json(changed)
+  );
+END;
+$$;
+
+-- แอดมินโอนเครดิตให้ user ที่ไม่มีหนี้ค้าง: บันทึกรายการ completed + payments (kind = transfer)
+-- คืน {"status": "ok", "loan": {...}} หรือ {"status": "has_debt"}
+CREATE OR REPLACE FUNCTION record_transfer(p_user_id text, p_amount numeric)
+RETURNS json
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  transfer loans;
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtext('loan_claim:' || p_user_id));
+
+  IF EXISTS (SELECT 1 FROM loans WHERE user_id = p_user_id AND status = 'pending') THEN
+    RETURN json_build_object('status', 'has_debt');
+  END IF;
+
+  INSERT INTO loans (user_id, amount, status)
+  VALUES (p_user_id, p_amount, 'completed')
+  RETURNING * INTO transfer;
+
+  INSERT INTO payments (loan_id, user_id, amount, kind)
+  VALUES (transfer.id, p_user_id, p_amount, 'transfer');
+
+  RETURN json_build_object('status', 'ok', 'loan', row_to_json(transfer));
+END;
+$$;
+
+-- loan_stats ใช้เงินต้นคงเหลือและดอกเบี้ยยกมาของรายการที่ชำระบางส่วนแล้ว
+CREATE OR REPLACE FUNCTION loan_stats()
+RETURNS json
+LANGUAGE sql STABLE
+AS $$
+  WITH due AS (
+    SELECT
+      id, user_id, amount, created_at, status, principal_due, interest_carried, accrued_at,
+      coalesce(principal_due, amount) AS principal,
+      round(
+        interest_carried
+        + coalesce(principal_due, amount) * 0.1 * abs(extract(epoch FROM now() - coalesce(accrued_at, created_at))) / 3600
+      ) AS interest
+    FROM loans
+  )
+  SELECT json_build_object(
+    'total_count', count(*),
+    'total_amount', coalesce(sum(amount), 0),
+    'pending_count', count(*) FILTER (WHERE status = 'pending'),
+    'pending_amount', coalesce(sum(principal) FILTER (WHERE status = 'pending'), 0),
+    'pending_interest', coalesce(sum(interest) FILTER (WHERE status = 'pending'), 0),
+    'high_interest', coalesce((
+      SELECT json_agg(h ORDER BY h.created_at)
+      FROM (
+        SELECT id, user_id, amount, created_at, status, principal_due, interest_carried, accrued_at
+        FROM due
+        WHERE status = 'pending' AND principal > 0 AND interest > principal
+      ) h
+    ), '[]'::json)
+  )
+  FROM due;
+$$;
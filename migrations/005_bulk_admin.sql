@@ -0,0 +1,76 @@
+-- คำสั่งแอดมินแบบหลายคนในครั้งเดียว (/ล้างหนี้หลายคน, /โอนเครดิตหลายคน)
+-- เช็คหนี้ค้างและเขียนทุกแถวใน statement เดียว แทนการเรียกทีละคน
+-- user_balances ยังอัปเดตผ่าน trigger ของ 004_payments_ledger.sql ตามเดิม
+
+-- lock ต่อ user แบบเดียวกับ claim_announcement / record_repayment (เรียงก่อนกัน deadlock)
+CREATE OR REPLACE FUNCTION lock_users(p_user_ids text[])
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  uid text;
+BEGIN
+  FOR uid IN SELECT DISTINCT user_id FROM unnest(p_user_ids) AS user_id ORDER BY user_id LOOP
+    PERFORM pg_advisory_xact_lock(hashtext('loan_claim:' || uid));
+  END LOOP;
+END;
+$$;
+
+-- ล้างหนี้ค้างของทุกคนในรายการ คืน json array ของแถวที่ถูกเปลี่ยนเป็น cleared
+CREATE OR REPLACE FUNCTION clear_debts(p_user_ids text[])
+RETURNS json
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  cleared json;
+BEGIN
+  PERFORM lock_users(p_user_ids);
+
+  WITH updated AS (
+    UPDATE loans SET status = 'cleared'
+    WHERE user_id = ANY (p_user_ids) AND status = 'pending'
+    RETURNING *
+  )
+  SELECT coalesce(json_agg(updated), '[]'::json) INTO cleared FROM updated;
+
+  RETURN cleared;
+END;
+$$;
+
+-- โอนเครดิตเท่ากันให้ทุกคนในรายการที่ไม่มีหนี้ค้าง (รายการ completed + payments kind = transfer)
+-- คืน {"loans": [...รายการโอน], "has_debt": [user_id ที่ข้ามเพราะมีหนี้ค้าง]}
+CREATE OR REPLACE FUNCTION record_transfers(p_user_ids text[], p_amount numeric)
+RETURNS json
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  result json;
+BEGIN
+  PERFORM lock_users(p_user_ids);
+
+  WITH targets AS (
+    SELECT DISTINCT user_id FROM unnest(p_user_ids) AS user_id
+  ),
+  debtors AS (
+    SELECT DISTINCT user_id FROM loans
+    WHERE user_id = ANY (p_user_ids) AND status = 'pending'
+  ),
+  inserted AS (
+    INSERT INTO loans (user_id, amount, status)
+    SELECT user_id, p_amount, 'completed'
+    FROM targets
+    WHERE user_id NOT IN (SELECT user_id FROM debtors)
+    RETURNING *
+  ),
+  paid AS (
+    INSERT INTO payments (loan_id, user_id, amount, kind)
+    SELECT id, user_id, amount, 'transfer' FROM inserted
+  )
+  SELECT json_build_object(
+    'loans', coalesce((SELECT json_agg(inserted) FROM inserted), '[]'::json),
+    'has_debt', coalesce((SELECT json_agg(user_id) FROM debtors), '[]'::json)
+  ) INTO result;
+
+  RETURN result;
+END;
+$$;
@@ -0,0 +1,3 @@
+-- keyset pagination ของ /ส่งออก สำหรับตาราง payments เรียงตาม (paid_at, id)
+-- (loans ใช้ loans_created_at_id_idx จาก 001 อยู่แล้ว)
+CREATE INDEX IF NOT EXISTS payments_paid_at_id_idx ON payments (paid_at, id);
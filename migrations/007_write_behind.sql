@@ -0,0 +1,80 @@
+-- โหมด write-behind (WRITE_BEHIND=1, ดู journal.py)
+-- บอทตัดสินผลในเครื่องแล้วเขียนลง journal ก่อน จากนั้นค่อยส่งผลลัพธ์ (แถวที่เปลี่ยน) มาเขียนทีละชุด
+-- op_id ของแต่ละรายการเป็น idempotency key: ส่งซ้ำ (เช่น retry หลัง timeout) จะไม่เขียนซ้ำ
+-- user_balances ยังอัปเดตผ่าน trigger ของ 004_payments_ledger.sql ตามเดิม
+
+CREATE TABLE IF NOT EXISTS journal_applied (
+  op_id uuid PRIMARY KEY,
+  op text NOT NULL,
+  applied_at timestamptz NOT NULL DEFAULT now()
+);
+
+-- p_entries = json array ของ {"op_id", "op", "created", "updated", "payments", "alerts"} เรียงตามลำดับที่เกิด
+--   created  = แถว loans ใหม่ (id สร้างจากฝั่งบอท)
+--   updated  = แถว loans ที่เปลี่ยน status / principal_due / interest_carried / accrued_at
+-- คืน json array ของ {"op_id", "status": "applied" | "duplicate" | "conflict", "error"}
+-- รายการที่ขัดกับข้อมูลในฐานข้อมูล (ประกาศถูกรับไปแล้ว, แถวที่จะแก้ไม่มีอยู่) ถูกข้ามทั้งรายการเป็น conflict
+CREATE OR REPLACE FUNCTION apply_journal(p_entries json)
+RETURNS json
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  entry json;
+  results jsonb := '[]'::jsonb;
+  users text[];
+  touched integer;
+BEGIN
+  FOR entry IN SELECT value FROM json_array_elements(p_entries) LOOP
+    IF EXISTS (SELECT 1 FROM journal_applied WHERE op_id = (entry->>'op_id')::uuid) THEN
+      results := results || jsonb_build_object('op_id', entry->>'op_id', 'status', 'duplicate');
+      CONTINUE;
+    END IF;
+
+    -- sub-transaction ต่อรายการ: ถ้าขัดกันให้ย้อนเฉพาะรายการนี้
+    BEGIN
+      SELECT array_agg(row_data->>'user_id') INTO users
+      FROM (
+        SELECT json_array_elements(entry->'created') AS row_data
+        UNION ALL SELECT json_array_elements(entry->'updated')
+        UNION ALL SELECT json_array_elements(entry->'payments')
+      ) touched_rows;
+      IF users IS NOT NULL THEN
+        PERFORM lock_users(users);
+      END IF;
+
+      INSERT INTO loans (id, user_id, amount, status, created_at, principal_due, interest_carried, accrued_at, announcement_id)
+      SELECT id, user_id, amount, status, created_at, principal_due, coalesce(interest_carried, 0), accrued_at, announcement_id
+      FROM json_populate_recordset(NULL::loans, entry->'created');
+
+      UPDATE loans SET
+        status = u.status,
+        principal_due = u.principal_due,
+        interest_carried = coalesce(u.interest_carried, 0),
+        accrued_at = u.accrued_at
+      FROM json_populate_recordset(NULL::loans, entry->'updated') u
+      WHERE loans.id = u.id;
+      GET DIAGNOSTICS touched = ROW_COUNT;
+      IF touched < json_array_length(entry->'updated') THEN
+        RAISE EXCEPTION 'journal entry % updates missing loans', entry->>'op_id' USING ERRCODE = 'no_data_found';
+      END IF;
+
+      INSERT INTO payments (id, loan_id, user_id, amount, principal, interest, kind, paid_at)
+      SELECT id, loan_id, user_id, amount, principal, interest, kind, paid_at
+      FROM json_populate_recordset(NULL::payments, entry->'payments')
+      ON CONFLICT (id) DO NOTHING;
+
+      INSERT INTO loan_alerts (loan_id, tier, last_alerted_at)
+      SELECT (alert->>'loan_id')::uuid, (alert->>'tier')::integer, (alert->>'alerted_at')::timestamptz
+      FROM json_array_elements(entry->'alerts') AS alert
+      ON CONFLICT (loan_id) DO UPDATE SET tier = excluded.tier, last_alerted_at = excluded.last_alerted_at;
+
+      INSERT INTO journal_applied (op_id, op) VALUES ((entry->>'op_id')::uuid, entry->>'op');
+      results := results || jsonb_build_object('op_id', entry->>'op_id', 'status', 'applied');
+    EXCEPTION WHEN unique_violation OR foreign_key_violation OR check_violation OR no_data_found THEN
+      results := results || jsonb_build_object('op_id', entry->>'op_id', 'status', 'conflict', 'error', SQLERRM);
+    END;
+  END LOOP;
+
+  RETURN results::json;
+END;
+$$;
@@ -0,0 +1,42 @@
+-- loan_stats() ของ 004 อ้าง CTE due สองครั้ง Postgres จึงเก็บทุกแถวของ loans ลง temp แล้วสแกนซ้ำ
+-- ฉบับนี้คิดดอกเบี้ยเฉพาะแถว pending (ผ่าน loans_pending_created_at_idx) ส่วนยอดรวมนับจาก loans รอบเดียว
+-- ผลลัพธ์เหมือนเดิมทุกช่อง
+CREATE OR REPLACE FUNCTION loan_stats()
+RETURNS json
+LANGUAGE sql STABLE
+AS $$
+  WITH due AS (
+    SELECT
+      id, user_id, amount, created_at, status, principal_due, interest_carried, accrued_at,
+      coalesce(principal_due, amount) AS principal,
+      round(
+        interest_carried
+        + coalesce(principal_due, amount) * 0.1 * abs(extract(epoch FROM now() - coalesce(accrued_at, created_at))) / 3600
+      ) AS interest
+    FROM loans
+    WHERE status = 'pending'
+  )
+  SELECT json_build_object(
+    'total_count', totals.total_count,
+    'total_amount', totals.total_amount,
+    'pending_count', pending.pending_count,
+    'pending_amount', pending.pending_amount,
+    'pending_interest', pending.pending_interest,
+    'high_interest', coalesce((
+      SELECT json_agg(h ORDER BY h.created_at)
+      FROM (
+        SELECT id, user_id, amount, created_at, status, principal_due, interest_carried, accrued_at
+        FROM due
+        WHERE principal > 0 AND interest > principal
+      ) h
+    ), '[]'::json)
+  )
+  FROM
+    (SELECT count(*) AS total_count, coalesce(sum(amount), 0) AS total_amount FROM loans) totals,
+    (
+      SELECT count(*) AS pending_count,
+             coalesce(sum(principal), 0) AS pending_amount,
+             coalesce(sum(interest), 0) AS pending_interest
+      FROM due
+    ) pending;
+$$;
@@ -0,0 +1,110 @@
+# notifier.py
+# ส่ง DM ถึงผู้ใช้/แอดมินแบบขนาน (จำกัดจำนวนพร้อมกัน) พร้อมแคช user และ DM channel
+# - send / send_many: ส่งทันที
+# - queue_digest: รวมหลายแจ้งเตือนของคนเดียวกันเป็นข้อความเดียว แล้วส่งหลังรอสักครู่
+# การส่งที่ล้มเหลวจะถูกนับแยกตามสาเหตุ (ดูได้จาก stats())
+
+import asyncio
+from collections import Counter
+
+import discord
+
+from paging import chunk_lines
+
+
+class Notifier:
+    def __init__(self, client, *, concurrency=5, digest_delay=2.0):
+        self.client = client
+        self.digest_delay = digest_delay
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._channels = {}      # user_id (int) -> DMChannel
+        self._digests = {}       # user_id (str) -> (header, [บรรทัด])
+        self._digest_tasks = {}
+        self.sent = 0
+        self.failures = Counter()
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "failed": sum(self.failures.values()),
+            "failures": dict(self.failures),
+            "cached_channels": len(self._channels),
+        }
+
+    async def _channel(self, user_id):
+        channel = self._channels.get(user_id)
+        if channel is not None:
+            return channel
+        user = self.client.get_user(user_id)
+        if user is None:
+            user = await self.client.fetch_user(user_id)
+        channel = user.dm_channel or await user.create_dm()
+        self._channels[user_id] = channel
+        return channel
+
+    async def send(self, user_id, content):
+        """ส่ง DM คืน True ถ้าสำเร็จ"""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            self.failures["invalid_id"] += 1
+            return False
+        async with self._semaphore:
+            try:
+                channel = await self._channel(user_id)
+                for chunk in chunk_lines(content.split("\n")):
+                    await channel.send(chunk)
+            except discord.Forbidden:
+                # ปิด DM หรือไม่ได้อยู่เซิร์ฟเวอร์เดียวกัน
+                self.failures["forbidden"] += 1
+                return False
+            except discord.NotFound:
+                self._channels.pop(user_id, None)
+                self.failures["not_found"] += 1
+                return False
+            except discord.HTTPException as e:
+                self._channels.pop(user_id, None)
+                self.failures[f"http_{e.status}"] += 1
+                print(f"DM to {user_id} failed: {e}")
+                return False
+        self.sent += 1
+        return True
+
+    async def send_many(self, user_ids, content):
+        results = await asyncio.gather(*(self.send(user_id, content) for user_id in user_ids))
+        return sum(results)
+
+    def queue_digest(self, user_id, line, *, header=""):
+        """เพิ่มบรรทัดเข้า digest ของผู้ใช้ แล้วส่งรวมกันหลัง digest_delay วินาที"""
+        key = str(user_id)
+        if key not in self._digests:
+            self._digests[key] = (header, [])
+        self._digests[key][1].append(line)
+        if key not in self._digest_tasks:
+            self._digest_tasks[key] = asyncio.create_task(self._flush_later(key))
+
+    async def _flush_later(self, key):
+        try:
+            await asyncio.sleep(self.digest_delay)
+        finally:
+            self._digest_tasks.pop(key, None)
+        header, lines = self._digests.pop(key, ("", []))
+        await self._send_digest(key, header, lines)
+
+    async def _send_digest(self, key, header, lines):
+        if not lines:
+            return
+        if len(lines) > 1 and header:
+            header = f"{header} ({len(lines)} รายการ)"
+        await self.send(key, "\n".join([header, *lines] if header else lines))
+
+    async def flush(self):
+        """ส่ง digest ที่ค้างอยู่ทั้งหมดทันที (ใช้ตอนปิดบอท)"""
+        tasks = list(self._digest_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        pending, self._digests = self._digests, {}
+        await asyncio.gather(*(
+            self._send_digest(key, header, lines) for key, (header, lines) in pending.items()
+        ))
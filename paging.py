@@ -0,0 +1,108 @@
+# paging.py
+# แสดงรายการยาวๆ (หนี้ค้าง / ธุรกรรม) ทีละหน้า พร้อมปุ่ม ก่อนหน้า/ถัดไป
+# ดึงจากฐานข้อมูลเฉพาะหน้าที่ขอ (keyset pagination) และตัดข้อความไม่ให้เกิน limit ของ Discord
+
+import discord
+
+from loan_repository import cursor_of
+from metrics import InstrumentedView
+from stream_reply import DISCORD_LIMIT
+
+
+def chunk_lines(lines, limit=DISCORD_LIMIT, header=""):
+    """รวมบรรทัดเป็นข้อความหลายก้อน แต่ละก้อนยาวไม่เกิน limit (ก้อนแรกมี header)"""
+    chunks = []
+    current = [header] if header else []
+    size = len(header)
+    for line in lines:
+        extra = len(line) + (1 if current else 0)
+        if current and size + extra > limit:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+            extra = len(line)
+        current.append(line)
+        size += extra
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class LedgerPageView(InstrumentedView):
+    """View ที่เก็บ cursor ของหน้าปัจจุบันไว้ในตัวเอง
+
+    fetch_page(after=..., before=..., limit=...) -> rows (เรียงเก่าไปใหม่)
+    render(rows) -> list ของบรรทัด (หนึ่งบรรทัดต่อหนึ่งแถว)"""
+
+    def __init__(self, fetch_page, render, *, header, empty_text, owner_id=None, page_size=15, timeout=300):
+        super().__init__(timeout=timeout)
+        self.fetch_page = fetch_page
+        self.render = render
+        self.header = header
+        self.empty_text = empty_text
+        self.owner_id = owner_id
+        self.page_size = page_size
+        self.page_no = 1
+        self.rows = []
+        self.lines = []
+        self.has_prev = False
+        self.has_next = False
+
+    async def load(self, *, after=None, before=None):
+        # ขอเกินมาหนึ่งแถวเพื่อรู้ว่ามีหน้าถัดไป/ก่อนหน้าหรือไม่
+        rows = await self.fetch_page(after=after, before=before, limit=self.page_size + 1)
+        backward = before is not None
+        more = len(rows) > self.page_size
+        rows = rows[-self.page_size:] if backward else rows[:self.page_size]
+
+        lines = self.render(rows)
+        # ถ้าหน้ายาวเกิน limit ตัดแถวที่อยู่ไกล cursor ออก (แถวที่ตัดจะไปโผล่หน้าถัดไป)
+        budget = DISCORD_LIMIT - len(self._footer(99999)) - 1
+        while len(lines) > 1 and len(chunk_lines(lines, budget, self.header)) > 1:
+            more = True
+            if backward:
+                rows, lines = rows[1:], lines[1:]
+            else:
+                rows, lines = rows[:-1], lines[:-1]
+
+        self.rows = rows
+        self.lines = lines
+        if backward:
+            self.has_prev = more
+            self.has_next = True
+        else:
+            self.has_prev = after is not None
+            self.has_next = more
+        self.prev_button.disabled = not self.has_prev
+        self.next_button.disabled = not self.has_next
+
+    def _footer(self, page_no):
+        return f"หน้า {page_no}"
+
+    def content(self):
+        if not self.rows:
+            return self.empty_text
+        return chunk_lines(self.lines, DISCORD_LIMIT, self.header)[0] + "\n" + self._footer(self.page_no)
+
+    @property
+    def needs_buttons(self):
+        return self.has_prev or self.has_next
+
+    async def interaction_check(self, interaction):
+        if self.owner_id is not None and interaction.user.id != self.owner_id:
+            await interaction.response.send_message("ปุ่มนี้ใช้ได้เฉพาะคนที่เรียกคำสั่งนะ", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="◀ ก่อนหน้า", style=discord.ButtonStyle.secondary)
+    async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.rows:
+            await self.load(before=cursor_of(self.rows[0]))
+            self.page_no = max(1, self.page_no - 1)
+        await interaction.response.edit_message(content=self.content(), view=self)
+
+    @discord.ui.button(label="ถัดไป ▶", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.rows:
+            await self.load(after=cursor_of(self.rows[-1]))
+            self.page_no += 1
+        await interaction.response.edit_message(content=self.content(), view=self)
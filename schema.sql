@@ -15,4 +15,33 @@ CREATE TABLE payments (
   user_id text,
   paid_at timestamptz DEFAULT now(),
   amount numeric
-);
\ No newline at end of file
+);
+
+-- สถิติรวมสำหรับ /สถิติ คำนวณในฐานข้อมูล (เรียกผ่าน supabase.rpc("loan_stats"))
+-- คืนเฉพาะตัวเลขรวม + รายการที่ดอกเบี้ยเกินเงินต้น ไม่ต้องดึงทั้งตาราง
+-- ดอกเบี้ย 10% ต่อชั่วโมง (ไม่ทบต้น) เหมือน interest.py
+CREATE OR REPLACE FUNCTION loan_stats()
+RETURNS json
+LANGUAGE sql STABLE
+AS $$
+  SELECT json_build_object(
+    'total_count', count(*),
+    'total_amount', coalesce(sum(amount), 0),
+    'pending_count', count(*) FILTER (WHERE status = 'pending'),
+    'pending_amount', coalesce(sum(amount) FILTER (WHERE status = 'pending'), 0),
+    'pending_interest', coalesce(sum(
+      round(amount * 0.1 * abs(extract(epoch FROM now() - created_at)) / 3600)
+    ) FILTER (WHERE status = 'pending'), 0),
+    'high_interest', coalesce((
+      SELECT json_agg(h ORDER BY h.created_at)
+      FROM (
+        SELECT id, user_id, amount, created_at, status
+        FROM loans
+        WHERE status = 'pending'
+          AND amount > 0
+          AND round(amount * 0.1 * abs(extract(epoch FROM now() - created_at)) / 3600) > amount
+      ) h
+    ), '[]'::json)
+  )
+  FROM loans;
+$$;
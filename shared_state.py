@@ -0,0 +1,267 @@
+# shared_state.py
+# สถานะที่ต้องใช้ร่วมกันเมื่อรันบอทหลายโปรเซส (แบ่ง shard)
+# - MemoryState: ในโปรเซสเดียว (ค่าเริ่มต้น ทำงานเหมือนเดิม)
+# - SQLiteState: หลายโปรเซสในเครื่องเดียวกัน ใช้ไฟล์ SQLite ร่วมกัน (WAL)
+# - RedisState: Redis หรือเซิร์ฟเวอร์ที่พูดโปรโตคอลเดียวกัน (Valkey, KeyDB, Dragonfly ฯลฯ)
+# ทุกแบบมี key/value ที่หมดอายุได้ + acquire/release (ถือ key ได้ทีละเจ้าของ)
+# ใช้ทำ lock ของปุ่มกู้ (lock) และเลือกโปรเซสเดียวให้รันงานเบื้องหลัง (LeaderElection)
+
+import asyncio
+import contextlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+STATE_KINDS = ("memory", "sqlite", "redis")
+
+
+def process_id():
+    """ชื่อของโปรเซสนี้ (ใช้เป็นเจ้าของ lease) — ตั้งเองได้ด้วย PROCESS_ID"""
+    return os.getenv("PROCESS_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SharedState:
+    """ค่าที่มี ttl หมดอายุเองเมื่อเกิน ttl วินาที (ttl=None = ไม่หมดอายุ)"""
+
+    async def get(self, key):
+        raise NotImplementedError
+
+    async def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    async def acquire(self, key, owner, ttl):
+        """ถือ key ไว้ในนาม owner ถ้ายังว่าง/หมดอายุ หรือ owner ถืออยู่แล้ว (ต่ออายุ) — คืน True ถ้าได้"""
+        raise NotImplementedError
+
+    async def release(self, key, owner):
+        """ปล่อย key ถ้า owner ยังถืออยู่"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    @contextlib.asynccontextmanager
+    async def lock(self, key, *, ttl=10.0, poll=0.01, max_poll=0.2):
+        """lock ข้ามโปรเซส — ถ้าผู้ถือหายไป lock หลุดเองเมื่อครบ ttl"""
+        token = uuid.uuid4().hex
+        delay = poll
+        while not await self.acquire(key, token, ttl):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_poll)
+        try:
+            yield
+        finally:
+            await self.release(key, token)
+
+
+class MemoryState(SharedState):
+    def __init__(self):
+        self._data = {}   # key -> (value, หมดอายุเมื่อ monotonic)
+
+    def _get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def _expiry(self, ttl):
+        return None if ttl is None else time.monotonic() + ttl
+
+    async def get(self, key):
+        return self._get(key)
+
+    async def set(self, key, value, ttl=None):
+        self._data[key] = (value, self._expiry(ttl))
+
+    async def acquire(self, key, owner, ttl):
+        current = self._get(key)
+        if current is not None and current != owner:
+            return False
+        self._data[key] = (owner, self._expiry(ttl))
+        return True
+
+    async def release(self, key, owner):
+        if self._get(key) == owner:
+            del self._data[key]
+
+
+class SQLiteState(SharedState):
+    """ทุกคำสั่งเป็น statement เดียวแบบ atomic เรียกผ่าน thread เพื่อไม่บล็อก event loop
+
+    เวลาหมดอายุใช้นาฬิกาของเครื่อง (time.time) ซึ่งทุกโปรเซสในเครื่องเห็นตรงกัน"""
+
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, path=".shared_state.db", *, busy_timeout=5.0):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_state ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            return cursor.fetchone(), cursor.rowcount
+
+    async def _run(self, sql, params=()):
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def get(self, key):
+        row, _ = await self._run(
+            "SELECT value FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        )
+        return row[0] if row else None
+
+    async def set(self, key, value, ttl=None):
+        now = time.time()
+        await self._run(
+            "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, None if ttl is None else now + ttl),
+        )
+        if now - self._purged_at >= self.PURGE_INTERVAL:
+            self._purged_at = now
+            await self._run("DELETE FROM shared_state WHERE expires_at <= ?", (now,))
+
+    async def acquire(self, key, owner, ttl):
+        now = time.time()
+        # แถวที่มีคนอื่นถือและยังไม่หมดอายุ upsert จะไม่แก้ (rowcount = 0)
+        _, changed = await self._run(
+            "INSERT INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+            " WHERE shared_state.value = excluded.value"
+            " OR (shared_state.expires_at IS NOT NULL AND shared_state.expires_at <= ?)",
+            (key, owner, now + ttl, now),
+        )
+        return changed > 0
+
+    async def release(self, key, owner):
+        await self._run("DELETE FROM shared_state WHERE key = ? AND value = ?", (key, owner))
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ตรวจเจ้าของแล้วต่ออายุ/ลบใน script เดียว (atomic ฝั่งเซิร์ฟเวอร์)
+_ACQUIRE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current == false or current == ARGV[1] then
+  redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+  return 1
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisState(SharedState):
+    """ต้องติดตั้ง redis (pip install redis) — อยู่ใน requirements-optional.txt เพราะใช้เฉพาะโหมดนี้"""
+
+    def __init__(self, url="redis://localhost:6379/0", *, prefix="landing:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("SHARED_STATE=redis ต้องติดตั้ง redis ก่อน (pip install redis)") from None
+        self.url = url
+        self.prefix = prefix
+        self._redis = redis.from_url(url, decode_responses=True)
+
+    def _key(self, key):
+        return self.prefix + key
+
+    async def get(self, key):
+        return await self._redis.get(self._key(key))
+
+    async def set(self, key, value, ttl=None):
+        await self._redis.set(self._key(key), value, px=None if ttl is None else max(1, int(ttl * 1000)))
+
+    async def acquire(self, key, owner, ttl):
+        return bool(await self._redis.eval(_ACQUIRE_SCRIPT, 1, self._key(key), owner, max(1, int(ttl * 1000))))
+
+    async def release(self, key, owner):
+        await self._redis.eval(_RELEASE_SCRIPT, 1, self._key(key), owner)
+
+    async def close(self):
+        # redis 5 ใช้ aclose() ส่วนรุ่นเก่ามีแค่ close()
+        close = getattr(self._redis, "aclose", None) or self._redis.close
+        await close()
+
+
+def open_state(kind="memory", url=None):
+    """สร้าง backend ตามชื่อ (memory / sqlite / redis) — url คือ path ของไฟล์หรือ redis://..."""
+    if kind == "memory":
+        return MemoryState()
+    if kind == "sqlite":
+        return SQLiteState(url or ".shared_state.db")
+    if kind == "redis":
+        return RedisState(url or "redis://localhost:6379/0")
+    raise ValueError(f"unknown shared state backend: {kind} (ใช้ได้: {', '.join(STATE_KINDS)})")
+
+
+class LeaderElection:
+    """เลือกโปรเซสเดียวให้รันงาน (เช่น loop แจ้งเตือนดอกเบี้ย) ด้วย lease ที่ต้องต่ออายุเรื่อยๆ
+
+    ถ้าโปรเซสที่เป็น leader ตาย lease หมดอายุภายใน ttl วินาที แล้วโปรเซสอื่นรับช่วงต่อ
+    ถ้าต่ออายุไม่ได้ (เช่น backend ล่ม) จะหยุดงานไว้ก่อน กันไม่ให้สองโปรเซสรันซ้อนกัน"""
+
+    def __init__(self, state, name, *, owner=None, ttl=30.0, renew_interval=None):
+        self.state = state
+        self.key = f"leader:{name}"
+        self.owner = owner or process_id()
+        self.ttl = ttl
+        self.renew_interval = renew_interval or ttl / 3
+        self.is_leader = False
+        self.changes = 0
+
+    async def _elect(self):
+        try:
+            leader = await self.state.acquire(self.key, self.owner, self.ttl)
+        except Exception as e:
+            print(f"Leader election error ({self.key}): {e}")
+            leader = False
+        if leader != self.is_leader:
+            self.changes += 1
+            print(f"{self.owner} {'became' if leader else 'is no longer'} leader of {self.key}")
+        self.is_leader = leader
+        return leader
+
+    async def run(self, coro_factory):
+        """รัน coro_factory() เฉพาะตอนเป็น leader (ยกเลิกเมื่อเสีย lease, เริ่มใหม่ถ้างานจบเอง)"""
+        task = None
+        try:
+            while True:
+                leader = await self._elect()
+                if leader and (task is None or task.done()):
+                    if task is not None and not task.cancelled() and task.exception() is not None:
+                        print(f"{self.key} task failed: {task.exception()!r}")
+                    task = asyncio.create_task(coro_factory())
+                elif not leader and task is not None:
+                    task.cancel()
+                    task = None
+                await asyncio.sleep(self.renew_interval)
+        finally:
+            if task is not None:
+                task.cancel()
+            if self.is_leader:
+                self.is_leader = False
+                with contextlib.suppress(Exception):
+                    await self.state.release(self.key, self.owner)
@@ -0,0 +1,97 @@
+# stream_reply.py
+# ทยอยแสดงข้อความของ AI ใน Discord ด้วยการแก้ไข followup message เป็นช่วงๆ
+# - ส่งข้อความแรกทันทีที่ได้คำแรก
+# - แก้ไขข้อความไม่ถี่กว่า min_interval วินาที (กันโดน rate limit ของการ edit)
+# - ยาวเกิน limit แล้วขึ้นข้อความใหม่ต่อ แทนการตัดทิ้ง
+# - status(): แสดงสถานะระหว่างรอ (เช่นลำดับคิว) แล้วให้คำตอบเขียนทับ
+
+import time
+
+DISCORD_LIMIT = 2000
+
+
+def split_text(text, limit=DISCORD_LIMIT):
+    """ตัดข้อความออกเป็นส่วนๆ ไม่เกิน limit โดยพยายามตัดที่ขึ้นบรรทัดใหม่หรือช่องว่าง"""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut < limit // 2:
+            cut = text.rfind(" ", 0, limit)
+        if cut < limit // 2:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    parts.append(text)
+    return parts
+
+
+class StreamingReply:
+    def __init__(self, interaction, *, min_interval=1.2, limit=DISCORD_LIMIT):
+        self.interaction = interaction
+        self.min_interval = min_interval
+        self.limit = limit
+        self.messages = []      # ข้อความทั้งหมดที่ส่งไปแล้ว
+        self._current = None    # ข้อความที่กำลังแก้อยู่ (None = ยังไม่ได้ส่ง)
+        self._text = ""         # เนื้อหาของข้อความปัจจุบัน
+        self._shown = ""        # เนื้อหาที่แสดงอยู่บน Discord ตอนนี้
+        self._last_edit = 0.0
+
+    @property
+    def started(self):
+        return bool(self.messages)
+
+    async def status(self, text):
+        """แสดงข้อความสถานะ (เช่นลำดับคิว) ก่อนเริ่มตอบ คำตอบจะเขียนทับข้อความนี้"""
+        if self.messages:
+            return
+        if self._current is None:
+            self._current = await self.interaction.followup.send(text, wait=True)
+        else:
+            await self._current.edit(content=text)
+        self._shown = text
+
+    async def fail(self, text):
+        """แจ้งข้อผิดพลาดแทนคำตอบ (ใช้ข้อความสถานะเดิมถ้ามี)"""
+        if self._current is not None and not self.messages:
+            await self._current.edit(content=text)
+        else:
+            await self.interaction.followup.send(text)
+
+    async def feed(self, delta):
+        self._text += delta
+        if len(self._text) > self.limit:
+            await self._rollover()
+        # ข้อความใหม่ส่งทันที ส่วนการแก้ไขต้องเว้นช่วง
+        if self._current is None or time.monotonic() - self._last_edit >= self.min_interval:
+            await self._flush()
+
+    async def finish(self, suffix=""):
+        """แสดงข้อความที่เหลือทั้งหมด (เรียกตอน stream จบ)"""
+        self._text += suffix
+        if len(self._text) > self.limit:
+            await self._rollover()
+        await self._flush()
+
+    async def _rollover(self):
+        parts = split_text(self._text, self.limit)
+        # ส่วนที่เต็มแล้ว: ปิดข้อความปัจจุบันแล้วขึ้นข้อความใหม่
+        for part in parts[:-1]:
+            self._text = part
+            await self._flush()
+            self._current = None
+            self._shown = ""
+        self._text = parts[-1]
+
+    async def _flush(self):
+        if self._text == self._shown or not self._text.strip():
+            return
+        if self._current is None:
+            self._current = await self.interaction.followup.send(self._text, wait=True)
+            self.messages.append(self._current)
+        else:
+            await self._current.edit(content=self._text)
+            if not self.messages:
+                # ข้อความสถานะกลายเป็นข้อความแรกของคำตอบ
+                self.messages.append(self._current)
+        self._shown = self._text
+        self._last_edit = time.monotonic()